@@ -2,20 +2,262 @@
 # Date: 11 March 2021
 # Description: A class for playing the abstract board game Janggi
 
+import collections
+import random
+
+
+# The board is stored as a list of 90 squares numbered left to right and then
+# top to bottom, so 'a1' is square 0, 'i1' is square 8 and 'i10' is square 89.
+# Everything that depends only on the geometry of the board is worked out once
+# here, so the move functions never have to do any string arithmetic.
+COLUMNS = 'abcdefghi'
+SQUARES = [column + str(row) for row in range(1, 11) for column in COLUMNS]
+SQUARE_INDEX = {name: index for index, name in enumerate(SQUARES)}
+
+PLAYERS = ('blue', 'red')
+OPPONENT = {'blue': 'red', 'red': 'blue'}
+RANKS = ('general', 'guard', 'elephant', 'horse', 'chariot', 'cannon', 'soldier')
+
+# Pieces keep their player and rank as small integer codes too, which are
+# their indexes in PLAYERS and RANKS
+PLAYER_CODES = {player: code for code, player in enumerate(PLAYERS)}
+RANK_CODES = {rank: code for code, rank in enumerate(RANKS)}
+GENERAL, GUARD, ELEPHANT, HORSE, CHARIOT, CANNON, SOLDIER = range(len(RANKS))
+
+# (row, column) steps for the four orthogonal directions
+UP, DOWN, LEFT, RIGHT = 0, 1, 2, 3
+DIRECTIONS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+
+
+def _offset(square, rows, columns):
+	"""Takes a square index and a number of rows and columns to shift by.
+	Returns the index of the shifted square, or None if it is off the board."""
+	row, column = divmod(square, 9)
+	row += rows
+	column += columns
+	if 0 <= row < 10 and 0 <= column < 9:
+		return row * 9 + column
+	return None
+
+
+def _ray(square, rows, columns):
+	"""Takes a square index and a direction and returns a tuple of every
+	square from the provided square to the edge of the board, nearest first"""
+	ray = []
+	next_sq = _offset(square, rows, columns)
+	while next_sq is not None:
+		ray.append(next_sq)
+		next_sq = _offset(next_sq, rows, columns)
+	return tuple(ray)
+
+
+def _leg_paths(square, distance):
+	"""Takes a square index and returns a tuple of (leg, target) pairs for a
+	piece that steps one square orthogonally (the leg, which must be empty)
+	and then `distance` squares diagonally outward. Horses use a distance of
+	1 and elephants use a distance of 2."""
+	paths = []
+	for rows, columns in DIRECTIONS:
+		leg = _offset(square, rows, columns)
+		if leg is None:
+			continue
+		for side in (-1, 1):
+			# Turning the orthogonal step sideways gives the diagonal's other half
+			diagonal_rows = rows + columns * side
+			diagonal_columns = columns + rows * side
+			target = _offset(leg, diagonal_rows * distance, diagonal_columns * distance)
+			if target is not None:
+				paths.append((leg, target))
+	return tuple(paths)
+
+
+# The squares next to each square, in the order UP, DOWN, LEFT, RIGHT
+NEIGHBORS = [tuple(_offset(square, r, c) for r, c in DIRECTIONS) for square in range(90)]
+
+# Every square a chariot or cannon could slide through in each direction
+RAYS = [tuple(_ray(square, r, c) for r, c in DIRECTIONS) for square in range(90)]
+
+HORSE_PATHS = [_leg_paths(square, 1) for square in range(90)]
+ELEPHANT_PATHS = [_leg_paths(square, 2) for square in range(90)]
+
+# Mapping of valid squares the general/guards can move to
+_PALACE_MOVES = {
+	'red': {
+		'd1': ['e1', 'd2', 'e2'], 'e1': ['d1', 'f1', 'e2'],
+		'f1': ['e1', 'e2', 'f2'], 'd2': ['d1', 'e2', 'd3'],
+		'e2': ['d1', 'e1', 'f1', 'd2', 'f2', 'd3', 'e3', 'f3'],
+		'f2': ['f1', 'e2', 'f3'], 'd3': ['d2', 'e2', 'e3'],
+		'e3': ['e2', 'd3', 'f3'], 'f3': ['e2', 'f2', 'e3'],
+	},
+
+	'blue': {
+		'd8': ['e8', 'd9', 'e9'], 'e8': ['d8', 'f8', 'e9'],
+		'f8': ['e8', 'e9', 'f9'], 'd9': ['d8', 'e9', 'd10'],
+		'e9': ['d8', 'e8', 'f8', 'd9', 'f9', 'd10', 'e10', 'f10'],
+		'f9': ['f8', 'e9', 'f10'], 'd10': ['d9', 'e9', 'e10'],
+		'e10': ['e9', 'd10', 'f10'], 'f10': ['e9', 'f9', 'e10'],
+	},
+}
+PALACE_STEPS = {
+	player: {SQUARE_INDEX[a]: tuple(SQUARE_INDEX[b] for b in moves) for a, moves in squares.items()}
+	for player, squares in _PALACE_MOVES.items()
+}
+
+# The diagonal lines inside each palace. DIAGONAL_STEPS holds the one-step
+# diagonal moves (corner to center, center to corners) and DIAGONAL_JUMPS holds
+# (center, opposite corner) pairs for moves that pass over the center.
+_PALACE_CORNERS = {'e2': ('d1', 'f1', 'd3', 'f3'), 'e9': ('d8', 'f8', 'd10', 'f10')}
+DIAGONAL_STEPS = [() for square in range(90)]
+DIAGONAL_JUMPS = [() for square in range(90)]
+for _center, _corners in _PALACE_CORNERS.items():
+	DIAGONAL_STEPS[SQUARE_INDEX[_center]] = tuple(SQUARE_INDEX[corner] for corner in _corners)
+	for _corner, _opposite in zip(_corners, reversed(_corners)):
+		DIAGONAL_STEPS[SQUARE_INDEX[_corner]] = (SQUARE_INDEX[_center],)
+		DIAGONAL_JUMPS[SQUARE_INDEX[_corner]] = ((SQUARE_INDEX[_center], SQUARE_INDEX[_opposite]),)
+
+# Soldiers move forward (up for blue, down for red) or sideways
+SOLDIER_STEPS = {
+	'blue': [tuple(s for s in (NEIGHBORS[square][UP], NEIGHBORS[square][LEFT],
+							NEIGHBORS[square][RIGHT]) if s is not None) for square in range(90)],
+	'red': [tuple(s for s in (NEIGHBORS[square][DOWN], NEIGHBORS[square][LEFT],
+							NEIGHBORS[square][RIGHT]) if s is not None) for square in range(90)],
+}
+
+
+def _mask(squares):
+	"""Takes some square numbers and returns an integer with their bits set"""
+	bits = 0
+	for square in squares:
+		bits |= 1 << square
+	return bits
+
+
+# The same steps as bit masks (bit 0 is 'a1'), for working out every square a
+# piece attacks at once. Soldiers can step along the palace diagonals too.
+DIAGONAL_MASKS = [_mask(steps) for steps in DIAGONAL_STEPS]
+PALACE_MASKS = {
+	player: [_mask(steps.get(square, ())) for square in range(90)]
+	for player, steps in PALACE_STEPS.items()
+}
+SOLDIER_MASKS = {
+	player: [_mask(DIAGONAL_STEPS[square] + steps[square]) for square in range(90)]
+	for player, steps in SOLDIER_STEPS.items()
+}
+
+# HORSE_PATHS and ELEPHANT_PATHS with a mask for each target
+HORSE_PATH_BITS = [tuple((leg, 1 << b) for leg, b in paths) for paths in HORSE_PATHS]
+ELEPHANT_PATH_BITS = [tuple((leg, 1 << b) for leg, b in paths) for paths in ELEPHANT_PATHS]
+
+# The non-empty RAYS of each square, each with the masks of its first one,
+# two, three, ... squares, so a line piece's reach along a ray is the mask of
+# the squares up to the first piece it meets
+RAY_PREFIXES = [
+	tuple((ray, tuple(_mask(ray[:length]) for length in range(1, len(ray) + 1))) for ray in rays if ray)
+	for rays in RAYS
+]
+
+# Counts the set bits of an integer (int.bit_count is new in Python 3.10)
+_popcount = getattr(int, 'bit_count', None) or (lambda bits: bin(bits).count('1'))
+
+
+# Random 64-bit numbers for Zobrist hashing. A position's key is the XOR of
+# the number for each (player, rank, square) on the board, plus ZOBRIST_TURN
+# when it is red's turn. The seed is fixed so keys are the same in every
+# process and can be saved to disk.
+_zobrist_random = random.Random(20210311)
+ZOBRIST = {
+	player: {rank: [_zobrist_random.getrandbits(64) for square in range(90)] for rank in RANKS}
+	for player in PLAYERS
+}
+ZOBRIST_TURN = _zobrist_random.getrandbits(64)
+
+GAME_STATES = ('UNFINISHED', 'BLUE_WON', 'RED_WON')
+
+# Letters for each rank in FEN-style notation (blue's are upper case)
+FEN_LETTERS = {
+	'general': 'k', 'guard': 'a', 'elephant': 'b', 'horse': 'n',
+	'chariot': 'r', 'cannon': 'c', 'soldier': 'p',
+}
+FEN_RANKS = {letter: rank for rank, letter in FEN_LETTERS.items()}
+FEN_PLAYERS = {'blue': 'b', 'red': 'r'}
+START_FEN = 'rbna1abnr/4k4/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/4K4/RBNA1ABNR b UNFINISHED'
+
+# to_bytes packs two squares into each byte and adds one byte for the turn
+# and the game state
+POSITION_BYTES = 46
+
+
+def _origins(paths):
+	"""Takes a table of (leg, target) paths for every square and turns it
+	around, returning a table of (origin, leg) pairs for every target square"""
+	origins = [[] for square in range(90)]
+	for origin, square_paths in enumerate(paths):
+		for leg, target in square_paths:
+			origins[target].append((origin, leg))
+	return [tuple(square_origins) for square_origins in origins]
+
+
+def _sources(steps):
+	"""Takes a table of the squares a piece can step to from each square and
+	turns it around, returning the squares it can step from for each square"""
+	sources = [[] for square in range(90)]
+	for origin, targets in steps:
+		for target in targets:
+			sources[target].append(origin)
+	return [tuple(square_sources) for square_sources in sources]
+
+
+# The same tables turned around, for working backward from a square that is
+# being attacked to the squares an attacker would have to be standing on
+HORSE_ORIGINS = _origins(HORSE_PATHS)
+ELEPHANT_ORIGINS = _origins(ELEPHANT_PATHS)
+PALACE_SOURCES = {player: _sources(steps.items()) for player, steps in PALACE_STEPS.items()}
+SOLDIER_SOURCES = {player: _sources(enumerate(steps)) for player, steps in SOLDIER_STEPS.items()}
+
 
 class Piece:
-	"""A class for pieces. A dictionary of these pieces is instantiated
-	for each team when a new JanggiGame is created. This class does
-	not need to communicate with any other classes, but the legal move
-	function and the JanggiGame class will need to access rank and player,
-	so we provide getters for those private data members."""
-
-	def __init__(self, player, rank):
-		"""Create a piece by providing a player ('blue' or 'red') and a rank,
+	"""A class for pieces. There are only 14 different pieces (a player and
+	a rank), so only 14 Piece objects are ever made: asking for Piece('blue',
+	'horse') always returns the same one, and every game shares them. They
+	can't be changed once made. The legal move function and the JanggiGame
+	class will need to access rank and player, so we provide getters for
+	those, and for the small integer codes that stand for them."""
+
+	__slots__ = ('_player', '_rank', '_player_code', '_rank_code')
+
+	def __new__(cls, player, rank):
+		"""Get a piece by providing a player ('blue' or 'red') and a rank,
 		which can be any of the ranks of Janggi pieces such as 'general'
-		or 'elephant'. This function returns a Piece instance."""
-		self._player = player
-		self._rank = rank
+		or 'elephant'. This function returns the Piece instance for them."""
+		try:
+			return _PIECES[player, rank]
+		except KeyError:
+			pass
+
+		if player not in PLAYER_CODES or rank not in RANK_CODES:
+			raise ValueError('no such piece: %r %r' % (player, rank))
+
+		piece = object.__new__(cls)
+		object.__setattr__(piece, '_player', player)
+		object.__setattr__(piece, '_rank', rank)
+		object.__setattr__(piece, '_player_code', PLAYER_CODES[player])
+		object.__setattr__(piece, '_rank_code', RANK_CODES[rank])
+		_PIECES[player, rank] = piece
+		return piece
+
+	def __setattr__(self, name, value):
+		raise AttributeError('pieces can not be changed')
+
+	def __delattr__(self, name):
+		raise AttributeError('pieces can not be changed')
+
+	def __reduce__(self):
+		"""Pickles a piece by its player and rank, so unpickling (or copying)
+		gives back the shared instance"""
+		return Piece, (self._player, self._rank)
+
+	def __repr__(self):
+		return 'Piece(%r, %r)' % (self._player, self._rank)
 
 	def to_string(self):
 		"""Takes no parameters and returns nothing. Creates a string
@@ -34,88 +276,360 @@ class Piece:
 		parameters, return type is a string like 'general' or 'elephant'."""
 		return self._rank
 
+	def get_player_code(self):
+		"""Return the piece's player as an integer: its index in PLAYERS"""
+		return self._player_code
+
+	def get_rank_code(self):
+		"""Return the piece's rank as an integer: its index in RANKS"""
+		return self._rank_code
+
+
+# The shared Piece instances, keyed by (player, rank). PIECES lists the same
+# pieces in order of player code and then rank code, so the piece with
+# player code p and rank code r is PIECES[p * 7 + r].
+_PIECES = {}
+PIECES = tuple(Piece(player, rank) for player in PLAYERS for rank in RANKS)
+
+# Where every piece starts
+START_LAYOUT = {
+
+	# Row 1
+	'a1': Piece('red', 'chariot'), 'b1': Piece('red', 'elephant'),
+	'c1': Piece('red', 'horse'), 'd1': Piece('red', 'guard'),
+	'f1': Piece('red', 'guard'), 'g1': Piece('red', 'elephant'),
+	'h1': Piece('red', 'horse'), 'i1': Piece('red', 'chariot'),
+
+	# Row 2
+	'e2': Piece('red', 'general'),
+
+	# Row 3
+	'b3': Piece('red', 'cannon'), 'h3': Piece('red', 'cannon'),
+
+	# Row 4
+	'a4': Piece('red', 'soldier'), 'c4': Piece('red', 'soldier'),
+	'e4': Piece('red', 'soldier'), 'g4': Piece('red', 'soldier'),
+	'i4': Piece('red', 'soldier'),
+
+	# Row 7
+	'a7': Piece('blue', 'soldier'), 'c7': Piece('blue', 'soldier'),
+	'e7': Piece('blue', 'soldier'), 'g7': Piece('blue', 'soldier'),
+	'i7': Piece('blue', 'soldier'),
+
+	# Row 8
+	'b8': Piece('blue', 'cannon'), 'h8': Piece('blue', 'cannon'),
+
+	# Row 9
+	'e9': Piece('blue', 'general'),
+
+	# Row 10
+	'a10': Piece('blue', 'chariot'), 'b10': Piece('blue', 'elephant'),
+	'c10': Piece('blue', 'horse'), 'd10': Piece('blue', 'guard'),
+	'f10': Piece('blue', 'guard'), 'g10': Piece('blue', 'elephant'),
+	'h10': Piece('blue', 'horse'), 'i10': Piece('blue', 'chariot'),
+
+}
+
+
+class BoardView:
+	"""A dictionary-style view of a JanggiGame's board that is keyed by
+	square names like 'e9'. The game itself keeps its pieces in a list indexed
+	by square number; this view lets code that thinks in square names read
+	and place pieces without knowing about the numbering."""
+
+	def __init__(self, game):
+		"""Takes the JanggiGame whose board should be viewed"""
+		self._game = game
+
+	def __getitem__(self, square):
+		"""Takes a square name and returns the piece on it, or None"""
+		return self._game._board[SQUARE_INDEX[square]]
+
+	def __setitem__(self, square, piece):
+		"""Takes a square name and a piece (or None) and puts it on the board,
+		replacing whatever was there"""
+		self._game._set(SQUARE_INDEX[square], piece)
+
+	def __iter__(self):
+		return iter(SQUARES)
+
+	def __len__(self):
+		return len(SQUARES)
+
+	def items(self):
+		"""Returns (square name, piece) pairs for every square on the board"""
+		return zip(SQUARES, self._game._board)
+
+	def copy(self):
+		"""Returns a plain dictionary snapshot of the board"""
+		return dict(self.items())
+
+
+# The ways a player can set up their horses and elephants, naming what stands
+# on their b, c, g and h files: 'e' for an elephant and 'h' for a horse.
+# START_LAYOUT has both players set up as 'eheh'.
+SETUPS = ('eheh', 'heeh', 'ehhe', 'hehe')
+
+
+def start_layout(blue_setup='eheh', red_setup='eheh'):
+	"""Takes each player's setup (one of SETUPS) and returns a dictionary of
+	where every piece starts, like START_LAYOUT but with the horses and
+	elephants arranged as given"""
+	layout = dict(START_LAYOUT)
+	for player, setup, row in (('blue', blue_setup, '10'), ('red', red_setup, '1')):
+		if setup not in SETUPS:
+			raise ValueError('no such setup: %r' % (setup,))
+		for column, letter in zip('bcgh', setup):
+			layout[column + row] = Piece(player, 'elephant' if letter == 'e' else 'horse')
+	return layout
+
+
+class MoveCache:
+	"""A least recently used cache of the legal moves from a square, keyed by
+	(game class, position key, square number), for answering the same question about the
+	same position over and over. It holds at most capacity entries, and keeps
+	count of its hits and misses."""
+
+	def __init__(self, capacity=4096):
+		"""Takes the most entries the cache can hold"""
+		self._capacity = capacity
+		self._entries = collections.OrderedDict()
+		self._hits = 0
+		self._misses = 0
+		self._evictions = 0
+
+	def get(self, key):
+		"""Returns the entry for the key, or None if there isn't one"""
+		entry = self._entries.get(key)
+		if entry is None:
+			self._misses += 1
+		else:
+			self._hits += 1
+			self._entries.move_to_end(key)
+		return entry
+
+	def put(self, key, entry):
+		"""Stores an entry, evicting the least recently used one if the cache
+		is full"""
+		self._entries[key] = entry
+		self._entries.move_to_end(key)
+		if len(self._entries) > self._capacity:
+			self._entries.popitem(last=False)
+			self._evictions += 1
+
+	def clear(self):
+		"""Empties the cache and resets its counts"""
+		self._entries.clear()
+		self._hits = self._misses = self._evictions = 0
+
+	def hit_rate(self):
+		"""Returns the fraction of lookups that were hits, or 0.0 if there
+		haven't been any"""
+		lookups = self._hits + self._misses
+		return self._hits / lookups if lookups else 0.0
+
+	def stats(self):
+		"""Returns a dictionary of the cache's size, capacity, hits, misses,
+		evictions and hit rate"""
+		return {
+			'size': len(self._entries),
+			'capacity': self._capacity,
+			'hits': self._hits,
+			'misses': self._misses,
+			'evictions': self._evictions,
+			'hit_rate': self.hit_rate(),
+		}
+
+
+# The cache every game shares for legal_moves_from. The key covers everything
+# the answer depends on, so games in the same position share entries too. That
+# includes the game's class, since a subclass can move its pieces differently.
+MOVE_CACHE = MoveCache()
+
+
+# How much each rank is worth to the evaluation. The general can't be
+# traded, so it doesn't count toward material.
+PIECE_VALUES = {
+	'general': 0, 'guard': 300, 'elephant': 300, 'horse': 500,
+	'cannon': 700, 'chariot': 1300, 'soldier': 200,
+}
+
+
+def _square_bonuses(bonus):
+	"""Takes a function of (rows forward from blue's back row, column) and
+	returns a piece-square table of its value on each of the 90 squares"""
+	return tuple(bonus(9 - square // 9, square % 9) for square in range(90))
+
+
+# Bonuses for standing on each square, from blue's side of the board (so
+# square 0, 'a1', is red's back corner). Red's pieces use the same tables
+# turned upside down. Soldiers gain as they get closer to the enemy palace,
+# horses and chariots like the middle of the board, and the general likes the
+# middle of its palace.
+PIECE_SQUARE_TABLES = {
+	'general': _square_bonuses(lambda forward, column: 10 if (forward, column) == (1, 4) else 0),
+	'guard': (0,) * 90,
+	'elephant': (0,) * 90,
+	'horse': _square_bonuses(lambda forward, column: 5 * (4 - abs(column - 4)) + (10 if 2 <= forward <= 6 else 0)),
+	'chariot': _square_bonuses(lambda forward, column: 5 * (4 - abs(column - 4)) + (15 if forward >= 7 else 0)),
+	'cannon': (0,) * 90,
+	'soldier': _square_bonuses(lambda forward, column:
+		(0, 0, 0, 0, 10, 20, 30, 40, 50, 30)[forward] + (10 if forward >= 7 and 3 <= column <= 5 else 0)),
+}
+
+
+class Evaluation:
+	"""Piece values and piece-square tables, folded into one table of what
+	each piece is worth on each square: positive for blue's pieces and
+	negative for red's. JanggiGame adds and subtracts these as pieces come
+	and go, so the total is always up to date."""
+
+	def __init__(self, piece_values=None, tables=None):
+		"""Takes a dictionary of values for some ranks and a dictionary of
+		90-square piece-square tables (laid out like PIECE_SQUARE_TABLES)
+		for some ranks. Ranks left out use PIECE_VALUES and
+		PIECE_SQUARE_TABLES."""
+		self.piece_values = dict(PIECE_VALUES, **(piece_values or {}))
+		self.tables = dict(PIECE_SQUARE_TABLES, **(tables or {}))
+		for rank in RANKS:
+			if len(self.tables[rank]) != 90:
+				raise ValueError('the %s table needs 90 squares' % rank)
+
+		# Indexed like PIECES: player code * 7 + rank code
+		self.weights = tuple(
+			tuple(self._weight(player, rank, square) for square in range(90))
+			for player in PLAYERS for rank in RANKS
+		)
+
+	def _weight(self, player, rank, square):
+		if player == 'red':
+			row, column = divmod(square, 9)
+			return -(self.piece_values[rank] + self.tables[rank][(9 - row) * 9 + column])
+		return self.piece_values[rank] + self.tables[rank][square]
+
+
+# The evaluation games use unless they are given another
+EVALUATION = Evaluation()
+
 
 class JanggiGame:
-	"""This class creates a board represented by a dictionary whose keys
-	are squares and whose values are pieces. An empty square has the value
-	None. The JanggiGame class can get the game state (unfinished, blue_won,
-	or red_won), check if a player is in check, and check if a player is in
-	checkmate. It will also keep track of whose turn it is, starting with blue.
-	The make_move function can move a piece to a new square based on the rules
-	of Janggi. This class will need to communicate with the Piece class,
+	"""This class creates a board represented by a list of 90 squares whose
+	values are pieces. An empty square has the value None. The JanggiGame class
+	can get the game state (unfinished, blue_won, or red_won), check if a player
+	is in check, and check if a player is in checkmate. It will also keep track
+	of whose turn it is, starting with blue. The make_move function can move a
+	piece to a new square based on the rules of Janggi. Squares are passed in
+	and out by name ('e9'); they are converted to square numbers once, as soon
+	as they come in. This class will need to communicate with the Piece class,
 	because certain functions (like find_general) need to access the Rank
 	data member of Piece to guide behavior."""
 
-	def __init__(self):
-		"""Instantiates a new JanggiGame. No parameters, returns
-		a new JanggiGame ready to be played."""
+	def __init__(self, blue_setup='eheh', red_setup='eheh'):
+		"""Instantiates a new JanggiGame, returning a new JanggiGame ready to
+		be played. Each player's horses and elephants can be set up any of
+		the ways in SETUPS. Each starting position is only set up piece by
+		piece once for each class; after that, new games copy it from that
+		first one."""
+		self._copy_state(self._template(blue_setup, red_setup))
+
+	@classmethod
+	def _template(cls, blue_setup, red_setup):
+		"""Returns a game of this class in the starting position with the
+		given setups that new games copy themselves from, setting it up the
+		first time"""
+		templates = cls.__dict__.get('_starts')
+		if templates is None:
+			templates = cls._starts = {}
+
+		template = templates.get((blue_setup, red_setup))
+		if template is None:
+			template = cls._empty()
+			for square, piece in start_layout(blue_setup, red_setup).items():
+				template._add(SQUARE_INDEX[square], piece)
+			templates[blue_setup, red_setup] = template
+		return template
+
+	@classmethod
+	def _empty(cls):
+		"""Returns a new game of this class with nothing on the board, blue
+		to move, without running __init__"""
+		game = cls.__new__(cls)
+		game._clear()
+		return game
+
+	def _clear(self):
+		"""Takes every piece off the board and resets the turn, the game
+		state and the history"""
 		self._game_state = 'UNFINISHED'
-		self._pieces = {
-
-			# Row 1
-			'a1': Piece('red', 'chariot'), 'b1': Piece('red', 'elephant'),
-			'c1': Piece('red', 'horse'), 'd1': Piece('red', 'guard'), 'e1': None,
-			'f1': Piece('red', 'guard'), 'g1': Piece('red', 'elephant'),
-			'h1': Piece('red', 'horse'), 'i1': Piece('red', 'chariot'),
-
-			# Row 2
-			'a2': None, 'b2': None, 'c2': None, 'd2': None,
-			'e2': Piece('red', 'general'), 'f2': None, 'g2': None, 'h2': None,
-			'i2': None,
-
-			# Row 3
-			'a3': None, 'b3': Piece('red', 'cannon'), 'c3': None, 'd3': None,
-			'e3': None, 'f3': None, 'g3': None, 'h3': Piece('red', 'cannon'),
-			'i3': None,
-
-			# Row 4
-			'a4': Piece('red', 'soldier'), 'b4': None, 'c4': Piece('red', 'soldier'),
-			'd4': None, 'e4': Piece('red', 'soldier'), 'f4': None,
-			'g4': Piece('red', 'soldier'), 'h4': None, 'i4': Piece('red', 'soldier'),
-
-			# Row 5
-			'a5': None, 'b5': None, 'c5': None, 'd5': None, 'e5': None, 'f5': None,
-			'g5': None, 'h5': None, 'i5': None,
-
-			# Row 6
-			'a6': None, 'b6': None, 'c6': None, 'd6': None, 'e6': None, 'f6': None,
-			'g6': None, 'h6': None, 'i6': None,
-
-			# Row 7
-			'a7': Piece('blue', 'soldier'), 'b7': None, 'c7': Piece('blue', 'soldier'),
-			'd7': None, 'e7': Piece('blue', 'soldier'), 'f7': None,
-			'g7': Piece('blue', 'soldier'), 'h7': None, 'i7': Piece('blue', 'soldier'),
-
-			# Row 8
-			'a8': None, 'b8': Piece('blue', 'cannon'), 'c8': None, 'd8': None,
-			'e8': None, 'f8': None, 'g8': None, 'h8': Piece('blue', 'cannon'),
-			'i8': None,
-
-			# Row 9
-			'a9': None, 'b9': None, 'c9': None, 'd9': None,
-			'e9': Piece('blue', 'general'), 'f9': None, 'g9': None, 'h9': None,
-			'i9': None,
-
-			# Row 10
-			'a10': Piece('blue', 'chariot'), 'b10': Piece('blue', 'elephant'),
-			'c10': Piece('blue', 'horse'), 'd10': Piece('blue', 'guard'),
-			'e10': None, 'f10': Piece('blue', 'guard'),
-			'g10': Piece('blue', 'elephant'), 'h10': Piece('blue', 'horse'),
-			'i10': Piece('blue', 'chariot'),
+		self._board = [None] * 90
+		self._pieces = BoardView(self)
+
+		# The squares each player has pieces on, both all together and split
+		# up by rank, so nothing has to scan all 90 squares to find a piece
+		self._occupied = {player: set() for player in PLAYERS}
+		self._ranks = {player: {rank: set() for rank in RANKS} for player in PLAYERS}
+
+		# Zobrist hash of the pieces on the board, kept up to date as they move
+		self._hash = 0
+
+		# The evaluation's running total for the pieces on the board, from
+		# blue's point of view
+		self._score = 0
 
-		}
 		self._turn = 'blue'
-		# An ordered list of the board's columns for calculating moves
-		self._columns = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h', 'i']
+
+		# Undo records for every move made, so moves can be taken back
+		self._history = []
+
+	def _copy_state(self, other):
+		"""Makes this game a copy of another game of the same class. Pieces
+		and the move tables are shared, since they never change; only the
+		board list, the sets of squares and the history are copied."""
+		self._game_state = other._game_state
+		self._board = other._board[:]
+		self._pieces = BoardView(self)
+		self._occupied = {player: set(squares) for player, squares in other._occupied.items()}
+		self._ranks = {
+			player: {rank: set(squares) for rank, squares in ranks.items()}
+			for player, ranks in other._ranks.items()
+		}
+		self._hash = other._hash
+		self._weights = other._weights
+		self._score = other._score
+		self._turn = other._turn
+		self._history = other._history[:]
+
+	def clone(self):
+		"""Returns a new game in exactly the same state as this one, moves
+		to take back included. Moves made in either game don't affect the
+		other. Much faster than copy.deepcopy."""
+		game = type(self).__new__(type(self))
+		game._copy_state(self)
+		return game
+
+	@classmethod
+	def from_position(cls, position, turn='blue', game_state='UNFINISHED'):
+		"""Returns a new game set up in the given position without playing
+		any moves. The position can be bytes from to_bytes or a string from
+		to_fen (which already say whose turn it is and the game state), or a
+		dictionary of square names to pieces, with the turn and game state
+		given separately. The new game has no moves to take back."""
+		if isinstance(position, (bytes, bytearray)):
+			return cls.from_bytes(position)
+		if isinstance(position, str):
+			return cls.from_fen(position)
+
+		board = [None] * 90
+		for square, piece in position.items():
+			board[SQUARE_INDEX[square]] = piece
+		return cls._with_board(board, turn, game_state)
 
 	def print_board(self):
 		"""Print a representation of the current state of the Janggi
 		board. No parameters, no return value."""
-		for row in range(1, 11):
+		for row in range(10):
 			line = ""
-			for column in ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h', 'i']:
-				square = column + str(row)
-				piece = self._pieces[square]
+			for piece in self._board[row * 9:row * 9 + 9]:
 				if piece:
 					line += piece.to_string()
 				else:
@@ -127,6 +641,166 @@ class JanggiGame:
 		one of: 'UNFINISHED', 'BLUE_WON', 'RED_WON'"""
 		return self._game_state
 
+	def position_key(self):
+		"""Returns a 64-bit integer identifying the current position (the
+		pieces on the board and whose turn it is). Two games with the same
+		position have the same key. The key is kept up to date as pieces
+		move, so this is instant."""
+		if self._turn == 'red':
+			return self._hash ^ ZOBRIST_TURN
+		return self._hash
+
+	def compute_position_key(self):
+		"""Works out the same key as position_key from scratch by looking at
+		every piece on the board. Slower, but useful for checking the key
+		that is kept up to date."""
+		key = 0
+		for square, piece in enumerate(self._board):
+			if piece:
+				key ^= ZOBRIST[piece.get_player()][piece.get_rank()][square]
+		if self._turn == 'red':
+			key ^= ZOBRIST_TURN
+		return key
+
+	def evaluate(self):
+		"""Returns how good the position is for the player whose turn it is:
+		the value of their pieces minus the value of their opponent's, with
+		each piece's bonus for the square it stands on (see Evaluation). The
+		total is kept up to date as pieces move, so nothing is added up here."""
+		return self._score if self._turn == 'blue' else -self._score
+
+	def compute_evaluation(self):
+		"""Works out the same score as evaluate from scratch by looking at
+		every piece on the board. Slower, but useful for checking the total
+		that is kept up to date."""
+		weights = self._weights
+		score = 0
+		for square, piece in enumerate(self._board):
+			if piece:
+				score += weights[piece._player_code * 7 + piece._rank_code][square]
+		return score if self._turn == 'blue' else -score
+
+	def set_evaluation(self, evaluation):
+		"""Takes an Evaluation and makes this game use its piece values and
+		piece-square tables from now on. No return value."""
+		self._weights = evaluation.weights
+		score = self.compute_evaluation()
+		self._score = score if self._turn == 'blue' else -score
+
+	# What each piece is worth on each square, from the Evaluation in use
+	_weights = EVALUATION.weights
+
+	def to_bytes(self):
+		"""Returns the position (the pieces, whose turn it is and the game
+		state) packed into POSITION_BYTES bytes. Each square takes 4 bits: 0
+		for an empty square, or 1 more than the piece's index in PIECES.
+		Square 0 is the high half of the first byte. The last byte holds the
+		turn in bit 0 (set for red) and the game state's index in
+		GAME_STATES in the bits above it. Equal positions give equal bytes."""
+		codes = [piece._player_code * 7 + piece._rank_code + 1 if piece else 0 for piece in self._board]
+		data = bytearray(codes[i] << 4 | codes[i + 1] for i in range(0, 90, 2))
+		data.append(PLAYER_CODES[self._turn] | GAME_STATES.index(self._game_state) << 1)
+		return bytes(data)
+
+	@classmethod
+	def from_bytes(cls, data):
+		"""Takes bytes made by to_bytes and returns a new game in that
+		position, with no moves to take back"""
+		if len(data) != POSITION_BYTES:
+			raise ValueError('a position is %d bytes, not %d' % (POSITION_BYTES, len(data)))
+
+		board = []
+		for byte in data[:-1]:
+			for code in (byte >> 4, byte & 15):
+				if code > len(PIECES):
+					raise ValueError('bad piece code %d' % code)
+				board.append(PIECES[code - 1] if code else None)
+
+		flags = data[-1]
+		if flags >> 1 >= len(GAME_STATES):
+			raise ValueError('bad game state %d' % (flags >> 1))
+		return cls._with_board(board, PLAYERS[flags & 1], GAME_STATES[flags >> 1])
+
+	def to_fen(self):
+		"""Returns the position as a FEN-style string: the rows from row 1 to
+		row 10 separated by '/', with a letter for each piece (upper case for
+		blue, lower case for red, see FEN_LETTERS) and a digit for each run of
+		empty squares, then 'b' or 'r' for whose turn it is and the game
+		state. A new game is START_FEN."""
+		rows = []
+		for row in range(10):
+			text = ''
+			empty = 0
+			for piece in self._board[row * 9:row * 9 + 9]:
+				if not piece:
+					empty += 1
+					continue
+				if empty:
+					text += str(empty)
+					empty = 0
+				letter = FEN_LETTERS[piece._rank]
+				text += letter.upper() if piece._player == 'blue' else letter
+			if empty:
+				text += str(empty)
+			rows.append(text)
+		return '%s %s %s' % ('/'.join(rows), FEN_PLAYERS[self._turn], self._game_state)
+
+	@classmethod
+	def from_fen(cls, fen):
+		"""Takes a string made by to_fen and returns a new game in that
+		position, with no moves to take back. The game state can be left
+		off, in which case the game is unfinished."""
+		fields = fen.split()
+		if len(fields) == 2:
+			fields.append('UNFINISHED')
+		if len(fields) != 3:
+			raise ValueError('expected rows, turn and game state: %r' % fen)
+		rows, turn, game_state = fields
+
+		players = {letter: player for player, letter in FEN_PLAYERS.items()}
+		if turn not in players:
+			raise ValueError('bad turn %r' % turn)
+		if game_state not in GAME_STATES:
+			raise ValueError('bad game state %r' % game_state)
+
+		rows = rows.split('/')
+		if len(rows) != 10:
+			raise ValueError('expected 10 rows, not %d' % len(rows))
+
+		board = []
+		for text in rows:
+			row = []
+			for letter in text:
+				if letter.isdigit():
+					row.extend([None] * int(letter))
+				elif letter.lower() in FEN_RANKS:
+					player = 'blue' if letter.isupper() else 'red'
+					row.append(Piece(player, FEN_RANKS[letter.lower()]))
+				else:
+					raise ValueError('bad piece letter %r' % letter)
+			if len(row) != 9:
+				raise ValueError('row %r is not 9 squares long' % text)
+			board.extend(row)
+
+		return cls._with_board(board, players[turn], game_state)
+
+	@classmethod
+	def _with_board(cls, board, turn, game_state):
+		"""Takes a list of 90 pieces (or None), whose turn it is and a game
+		state, and returns a new game set up that way"""
+		if turn not in OPPONENT:
+			raise ValueError('bad turn %r' % turn)
+		if game_state not in GAME_STATES:
+			raise ValueError('bad game state %r' % game_state)
+
+		game = cls._empty()
+		for square, piece in enumerate(board):
+			if piece:
+				game._add(square, piece)
+		game._turn = turn
+		game._game_state = game_state
+		return game
+
 	def legal_move(self, piece, a, b):
 		"""Return true if the given rank can move from square a to square b. It
 		is assumed that b is empty or contains a piece from the opponent of player
@@ -141,426 +815,692 @@ class JanggiGame:
 		as a list of ALL POSSIBLE legal moves, followed by a check for whether
 		the particular move is in that list. I could have just checked the
 		particular move based on the rule set, but this implementation seemed
-		easier without any noticeable drawbacks."""
-
-		rank = piece.get_rank()
-		player = piece.get_player()
-
-		# Functions for finding adjacent squares
-		def above(square):
-			"""Takes a square and returns the square above the provided square"""
-			if not square:
-				return None		# Returns None if the provided square is out of bounds
-								# Sometimes Above/Below etc. get called out of bounds,
-								# like when moving horses
-			col = square[0]
-			row = square[1:]
-			if row == '1':
-				return None
-			else:
-				row = str(int(row) - 1)
-
-			return col + row
-
-		def below(square):
-			"""Takes a square and returns the square below the provided square"""
-			if not square:
-				return None		# Returns None if the provided square is out of bounds
-
-			col = square[0]
-			row = square[1:]
-
-			if row == '10':
-				return None
-			else:
-				row = str(int(row) + 1)
-
-			return col + row
-
-		def right_of(square):
-			"""Takes a square and returns the square to the right of the provided square"""
-			if not square:
-				return None		# Returns None if the provided square is out of bounds
-
-			col = square[0]
-			row = square[1:]
-
-			if col == 'i':
-				return None
-			else:
-				col_index = self._columns.index(col)
-				col = str(self._columns[col_index + 1])
-
-			return col + row
-
-		def left_of(square):
-			"""Takes a square and returns the square to the left of the provided square"""
-			if not square:
-				return None		# Returns None if the provided square is out of bounds
-
-			col = square[0]
-			row = square[1:]
+		easier without any noticeable drawbacks. The list itself is built by
+		_targets, which works on square numbers."""
+		if b is None:
+			return False
 
-			if col == 'a':
-				return None
+		a = SQUARE_INDEX[a]
+		b = SQUARE_INDEX[b]
+
+		# The general and guards only need the palace table, which doesn't
+		# care what is standing on square b
+		if piece._rank_code <= GUARD:
+			return b in PALACE_STEPS[piece._player].get(a, ())
+
+		return b in self._targets(piece, a)
+
+	def _targets(self, piece, a):
+		"""Takes a piece and the number of the square it is moving from and
+		returns a list of the square numbers it can move to. Squares holding
+		one of the piece's teammates are never included. Each rank has its
+		own function, looked up in _rank_targets by the piece's rank code."""
+		return self._rank_targets[piece._rank_code](self, piece, a)
+
+	def _palace_targets(self, piece, a):
+		"""The general and guards move one step along the palace lines"""
+		board = self._board
+		player = piece._player
+		moves = []
+		for b in PALACE_STEPS[player].get(a, ()):
+			target = board[b]
+			if not target or target._player != player:
+				moves.append(b)
+		return moves
+
+	def _horse_targets(self, piece, a):
+		"""The path to each square must be checked for blocking pieces"""
+		return self._leg_targets(piece, a, HORSE_PATHS[a])
+
+	def _elephant_targets(self, piece, a):
+		"""Like the horse, but the elephant goes one square further"""
+		return self._leg_targets(piece, a, ELEPHANT_PATHS[a])
+
+	def _leg_targets(self, piece, a, paths):
+		"""Takes (leg, target) paths and returns the targets whose leg is empty"""
+		board = self._board
+		player = piece._player
+		moves = []
+		for leg, b in paths:
+			if not board[leg]:
+				target = board[b]
+				if not target or target._player != player:
+					moves.append(b)
+		return moves
+
+	def _chariot_targets(self, piece, a):
+		"""Chariots slide along rows, columns and the palace diagonals"""
+		board = self._board
+		player = piece._player
+		moves = []
+
+		"""In some cases, the chariot can move diagonally through a palace"""
+		for b in DIAGONAL_STEPS[a]:
+			target = board[b]
+			if not target or target._player != player:
+				moves.append(b)
+
+		for center, b in DIAGONAL_JUMPS[a]:
+			target = board[b]
+			if not board[center] and (not target or target._player != player):
+				moves.append(b)
+
+		"""In all cases, the chariot can travel orthogonally
+			until reaching a teammate, an enemy, or a border"""
+		for ray in RAYS[a]:
+			for b in ray:
+				target = board[b]
+				if target:
+					if target._player != player:		# Chariot reached an enemy
+						moves.append(b)
+					break								# Chariot reached a piece
+				moves.append(b)
+
+		return moves
+
+	def _cannon_targets(self, piece, a):
+		"""Cannons jump over one piece along rows, columns and the palace
+		diagonals"""
+		board = self._board
+		player = piece._player
+		moves = []
+
+		"""Edge cases where the cannon can jump diagonally
+			over the center of a palace"""
+		for center, b in DIAGONAL_JUMPS[a]:
+			target = board[b]
+			if board[center] and (not target or target._player != player):
+				moves.append(b)
+
+		"""All other standard cannon cases. The cannon needs a piece to
+			jump, and it can never jump another cannon"""
+		for ray in RAYS[a]:
+			piece_to_jump = False
+			for b in ray:
+				target = board[b]
+				if not target:
+					if piece_to_jump:
+						moves.append(b)
+				elif not piece_to_jump:
+					if target._rank_code == CANNON:
+						break
+					piece_to_jump = True
+				else:
+					if target._player != player:
+						moves.append(b)
+					if target._rank_code == CANNON:
+						break
+
+		return moves
+
+	def _soldier_targets(self, piece, a):
+		"""Soldiers move forward or sideways, and can also follow the
+		diagonals of either palace"""
+		board = self._board
+		player = piece._player
+		moves = []
+		for b in DIAGONAL_STEPS[a] + SOLDIER_STEPS[player][a]:
+			target = board[b]
+			if not target or target._player != player:
+				moves.append(b)
+		return moves
+
+	# The function above for each rank, in the order of RANKS. Subclasses get
+	# their own table built from their own functions, so a subclass only has
+	# to override the function for the rank it moves differently.
+	_rank_targets = (_palace_targets, _palace_targets, _elephant_targets,
+		_horse_targets, _chariot_targets, _cannon_targets, _soldier_targets)
+
+	def _reach(self, piece, a):
+		"""Takes a piece and the number of its square and returns a bit mask
+		of every square it attacks, including squares holding its teammates
+		(which it defends). Each rank has its own function, looked up in
+		_rank_reach by the piece's rank code."""
+		return self._rank_reach[piece._rank_code](self, piece, a)
+
+	def _palace_reach(self, piece, a):
+		return PALACE_MASKS[piece._player][a]
+
+	def _horse_reach(self, piece, a):
+		return self._leg_reach(HORSE_PATH_BITS[a])
+
+	def _elephant_reach(self, piece, a):
+		return self._leg_reach(ELEPHANT_PATH_BITS[a])
+
+	def _leg_reach(self, paths):
+		"""Takes (leg, target mask) paths and returns a mask of the targets
+		whose leg is empty"""
+		board = self._board
+		reach = 0
+		for leg, bit in paths:
+			if not board[leg]:
+				reach |= bit
+		return reach
+
+	def _chariot_reach(self, piece, a):
+		board = self._board
+		reach = DIAGONAL_MASKS[a]
+		for center, b in DIAGONAL_JUMPS[a]:
+			if not board[center]:
+				reach |= 1 << b
+
+		for ray, prefixes in RAY_PREFIXES[a]:
+			for b, prefix in zip(ray, prefixes):
+				if board[b]:
+					break
+			reach |= prefix
+		return reach
+
+	def _cannon_reach(self, piece, a):
+		board = self._board
+		reach = 0
+		for center, b in DIAGONAL_JUMPS[a]:
+			if board[center]:
+				reach |= 1 << b
+
+		for ray, prefixes in RAY_PREFIXES[a]:
+			screen = None
+			for index, b in enumerate(ray):
+				target = board[b]
+				if not target:
+					continue
+				if screen is not None:
+					# Everything after the screen up to and including the
+					# first cannon beyond it
+					if target._rank_code == CANNON:
+						reach |= prefixes[index] ^ prefixes[screen]
+						break
+				elif target._rank_code == CANNON:
+					break
+				else:
+					screen = index
 			else:
-				col_index = self._columns.index(col)
-				col = self._columns[col_index - 1]
-
-			return col + row
-
-		if rank == 'general' or rank == 'guard':
-			# Mapping of valid squares the general/guards can move to
-			valid_squares = {
-				'red': {
-					'd1': ['e1', 'd2', 'e2'], 'e1': ['d1', 'f1', 'e2'],
-					'f1': ['e1', 'e2', 'f2'], 'd2': ['d1', 'e2', 'd3'],
-					'e2': ['d1', 'e1', 'f1', 'd2', 'f2', 'd3', 'e3', 'f3'],
-					'f2': ['f1', 'e2', 'f3'], 'd3': ['d2', 'e2', 'e3'],
-					'e3': ['e2', 'd3', 'f3'], 'f3': ['e2', 'f2', 'e3'],
-					},
-
-				'blue': {
-					'd8': ['e8', 'd9', 'e9'], 'e8': ['d8', 'f8', 'e9'],
-					'f8': ['e8', 'e9', 'f9'], 'd9': ['d8', 'e9', 'd10'],
-					'e9': ['d8', 'e8', 'f8', 'd9', 'f9', 'd10', 'e10', 'f10'],
-					'f9': ['f8', 'e9', 'f10'], 'd10': ['d9', 'e9', 'e10'],
-					'e10': ['e9', 'd10', 'f10'], 'f10': ['e9', 'f9', 'e10'],
-					},
-				}
-
-			moves = valid_squares[player][a]
-
-			return b in moves
-
-		elif rank == 'horse':
-			# The horse has eight possible squares to move to
-			# The path to each square must be checked for blocking pieces
-			moves = []
-
-			up = above(a)
-			down = below(a)
-			left = left_of(a)
-			right = right_of(a)
-
-			if up and not self._pieces[up]:				# Up is in bounds and unblocked
-				moves.append(above(left_of(up)))
-				moves.append(above(right_of(up)))
-
-			if down and not self._pieces[down]:			# Down is in bounds and unblocked
-				moves.append(below(left_of(down)))
-				moves.append(below(right_of(down)))
-
-			if left and not self._pieces[left]:			# Left is in bounds and unblocked
-				moves.append(left_of(below(left)))
-				moves.append(left_of(above(left)))
-
-			if right and not self._pieces[right]:		# Right is in bounds and unblocked
-				moves.append(right_of(below(right)))
-				moves.append(right_of(above(right)))
-
-			return b in moves
-
-		elif rank == 'elephant':
-
-			moves = []
-
-			up = above(a)
-			down = below(a)
-			left = left_of(a)
-			right = right_of(a)
-
-			if up and not self._pieces[up]:
-
-				# Up is in bounds and unblocked
-				moves.append(above(left_of(above(left_of(up)))))
-				moves.append(above(right_of(above(right_of(up)))))
-
-			if down and not self._pieces[down]:
-
-				# Down is in bounds and unblocked
-				moves.append(below(left_of(below(left_of(down)))))
-				moves.append(below(right_of(below(right_of(down)))))
-
-			if left and not self._pieces[left]:
-
-				# Left is in bounds and unblocked
-				moves.append(left_of(below(left_of(below(left)))))
-				moves.append(left_of(above(left_of(above(left)))))
-
-			if right and not self._pieces[right]:
-
-				# Right is in bounds and unblocked
-				moves.append(right_of(below(right_of(below(right)))))
-				moves.append(right_of(above(right_of(above(right)))))
-
-			return b in moves
-
-		elif rank == 'chariot':
-			moves = []
-
-			"""In some cases, the chariot can move diagonally through a palace"""
-			red_center = 'e2'
-			red_corners = ['d1', 'd3', 'f1', 'f3']
-
-			if a == red_center:
-				moves += red_corners
-
-			elif a in red_corners:
-				moves.append(red_center)
-				if not self._pieces[red_center]:
-					if a == 'd1': moves.append('f3')
-					elif a == 'f1': moves.append('d3')
-					elif a == 'f3': moves.append('d1')
-					elif a == 'd3': moves.append('f1')
-
-			blue_center = 'e9'
-			blue_corners = ['d8', 'f8', 'd10', 'f10']
-
-			if a == blue_center:
-				moves += blue_corners
-
-			elif a in blue_corners:
-				moves.append(blue_center)
-				if not self._pieces[blue_center]:
-					if a == 'd8': moves.append('f10')
-					elif a == 'f8': moves.append('d10')
-					elif a == 'd10': moves.append('f8')
-					elif a == 'f10': moves.append('d8')
-
-			"""In all cases, the chariot can travel orthogonally 
-				until reaching a teammate, an enemy, or a border"""
-			chariot_paths = [above, below, left_of, right_of]
-
-			for direction in chariot_paths:
-				next_sq = direction(a)
-
-				while next_sq:
-					next_sq_pc = self._pieces[next_sq]
-
-					if next_sq_pc:
-						if next_sq_pc.get_player() == player:  	# Chariot reached a teammate
-							break
-						else:									# Chariot reached an enemy
-							moves.append(next_sq)
-							break
-
-					else:
-						moves.append(next_sq)
-						next_sq = direction(next_sq)
-
-			return b in moves
-
-		elif rank == 'cannon':
-			moves = []
-
-			"""Edge cases where the cannon can jump diagonally 
-				over the center of a palace"""
-			# Red Palace Diagonal Jumps
-			if a in ['d1', 'f1', 'd3', 'f3'] and self._pieces['e2']:
-				red_jumps = {'d1': 'f3', 'f1': 'd3', 'd3': 'f1', 'f3': 'd1'}
-
-				for s, f in red_jumps.items():
-					if a == s:
-						if not self._pieces[f] or self._pieces[f].get_player() != player:
-							moves.append(f)
+				if screen is not None:
+					reach |= prefixes[-1] ^ prefixes[screen]
+		return reach
+
+	def _soldier_reach(self, piece, a):
+		return SOLDIER_MASKS[piece._player][a]
+
+	# The function above for each rank, in the order of RANKS, rebuilt for
+	# subclasses like _rank_targets
+	_rank_reach = (_palace_reach, _palace_reach, _elephant_reach,
+		_horse_reach, _chariot_reach, _cannon_reach, _soldier_reach)
+
+	def __init_subclass__(cls, **kwargs):
+		super().__init_subclass__(**kwargs)
+		cls._rank_targets = tuple(getattr(cls, function.__name__) for function in JanggiGame._rank_targets)
+		cls._rank_reach = tuple(getattr(cls, function.__name__) for function in JanggiGame._rank_reach)
+
+	def count_moves(self, player):
+		"""Takes a player ('blue' or 'red') and returns how many moves they
+		have, counted the way generate_moves counts them (without checking
+		whether a move leaves their general in check, and without passing).
+		No moves are built: each piece's reach is worked out as a bit mask
+		and its squares are counted."""
+		board = self._board
+		rank_reach = self._rank_reach
+		occupied = self._occupied[player]
+		others = ~self._player_bits(player)
+
+		count = 0
+		for a in occupied:
+			piece = board[a]
+			count += _popcount(rank_reach[piece._rank_code](self, piece, a) & others)
+		return count
+
+	def _player_bits(self, player):
+		"""Returns a mask of the squares holding the player's pieces"""
+		return _mask(self._occupied[player])
+
+	def attack_map(self, player):
+		"""Takes a player ('blue' or 'red') and returns a set of the names of
+		the squares they attack: every square one of their pieces could move
+		to if an enemy piece stood there. Squares holding the player's own
+		pieces are included when another of their pieces defends them."""
+		reach = self._attack_bits(player)
+		attacked = set()
+		while reach:
+			bit = reach & -reach
+			attacked.add(SQUARES[bit.bit_length() - 1])
+			reach ^= bit
+		return attacked
+
+	def _attack_bits(self, player):
+		"""Returns attack_map as a bit mask"""
+		board = self._board
+		rank_reach = self._rank_reach
+		reach = 0
+		for a in self._occupied[player]:
+			piece = board[a]
+			reach |= rank_reach[piece._rank_code](self, piece, a)
+		return reach
+
+	def attackers_of(self, square, player=None):
+		"""Takes a square name, and optionally a player ('blue' or 'red'),
+		and returns a sorted list of the names of the squares holding pieces
+		that attack the square, belonging to that player or to either
+		player. Whatever is on the square doesn't matter, so a piece's
+		defenders are its own player's attackers. Works backward from the
+		square like is_square_attacked."""
+		square = SQUARE_INDEX[square]
+		attackers = []
+		for by_player in PLAYERS if player is None else (player,):
+			attackers.extend(self._attack_lines(square, by_player)[0])
+		return [SQUARES[a] for a in sorted(attackers)]
+
+	def generate_moves(self, player):
+		"""Takes a player ('blue' or 'red') and yields a (from, to) pair of
+		square names for every move that player's pieces can make, without
+		checking whether the move leaves the player's own general in check.
+		Passing the turn is not included."""
+		for a, b in self._pseudo_moves(player):
+			yield SQUARES[a], SQUARES[b]
+
+	def generate_legal_moves(self, player):
+		"""Takes a player ('blue' or 'red') and yields a (from, to) pair of
+		square names for every move that player can make that does not leave
+		their general in check. Passing the turn is not included."""
+		for a, b in self._legal_moves(player):
+			yield SQUARES[a], SQUARES[b]
+
+	def legal_moves_from(self, square):
+		"""Takes a square name and returns a tuple of the names of the squares
+		the piece on it can move to without leaving its general in check,
+		whoever's turn it is. An empty square has no moves. Answers are kept
+		in MOVE_CACHE by class and position key, so asking again about the
+		same square in the same position doesn't work anything out."""
+		a = SQUARE_INDEX[square]
+		if not self._board[a]:
+			return ()
+
+		key = (type(self), self.position_key(), a)
+		moves = self._move_cache.get(key)
+		if moves is None:
+			moves = tuple(SQUARES[b] for b in self._legal_targets(a))
+			self._move_cache.put(key, moves)
+		return moves
+
+	# The cache used by legal_moves_from
+	_move_cache = MOVE_CACHE
+
+	def _legal_targets(self, a):
+		"""Takes the number of an occupied square and returns a list of the
+		square numbers its piece can move to without leaving its general in
+		check. Like _legal_moves, only the moves that might are tried."""
+		piece = self._board[a]
+		player = piece._player
+		targets = self._targets(piece, a)
+
+		if a == self._find_general(player) or self.is_in_check(player):
+			risky = targets
+		else:
+			pinned, cannon_lines = self._pins(player)
+			risky = targets if a in pinned else cannon_lines
+
+		moves = []
+		for b in targets:
+			if b in risky:
+				self._push(a, b)
+				in_check = self.is_in_check(player)
+				self._pop()
+				if in_check:
+					continue
+			moves.append(b)
+		return moves
+
+	def _pseudo_moves(self, player):
+		"""Yields (from, to) square number pairs for every move the player's
+		pieces can make, walking each piece's move pattern directly"""
+		board = self._board
+		for a in sorted(self._occupied[player]):
+			for b in self._targets(board[a], a):
+				yield a, b
+
+	def _legal_moves(self, player):
+		"""Yields the (from, to) square number pairs from _pseudo_moves that
+		don't leave the player's general in check. A move that might is tried
+		on the board with _push and then taken back with _pop before the next
+		one is looked at."""
+		if self.is_in_check(player):
+			yield from self._evasions(player)
+			return
+
+		# Outside of check, only a move by the general, a move by a pinned
+		# piece or a move onto a cannon line can put the player in check,
+		# so every other move is legal without trying it
+		general = self._find_general(player)
+		pinned, cannon_lines = self._pins(player)
+
+		for a, b in list(self._pseudo_moves(player)):
+			if a == general or a in pinned or b in cannon_lines:
+				self._push(a, b)
+				in_check = self.is_in_check(player)
+				self._pop()
+
+				if in_check:
+					continue
+
+			yield a, b
+
+	def _pins(self, player):
+		"""Takes a player who is not in check and works out, from their
+		general's square, which of their pieces can't safely be moved without
+		trying the move. Returns two sets of square numbers:
+
+		pinned holds the squares whose piece, if it moved away, might let an
+		enemy attack through: the only piece between the general and an
+		enemy chariot, any piece between the general and an enemy cannon (a
+		screen, or a cannon the enemy cannon can't jump), and the legs of
+		enemy horses and elephants aimed at the general.
+
+		cannon_lines holds the squares between the general and an enemy
+		cannon. Moving any piece onto one of them might give that cannon the
+		screen it needs."""
+		board = self._board
+		general = self._find_general(player)
+		pinned = set()
+		cannon_lines = set()
+		if general is None:
+			return pinned, cannon_lines
+
+		opponent = OPPONENT[player]
+
+		for ray in RAYS[general]:
+			between = []
+			for s in ray:
+				piece = board[s]
+				if not piece:
+					between.append(s)
+					continue
+				if piece._player == opponent:
+					rank = piece._rank_code
+					if rank == CANNON:
+						pinned.update(between)
+						cannon_lines.update(between)
+					elif rank == CHARIOT:
+						occupied = [b for b in between if board[b]]
+						if len(occupied) == 1:
+							pinned.update(occupied)
+				between.append(s)
+
+		for center, s in DIAGONAL_JUMPS[general]:
+			piece = board[s]
+			if piece and piece._player == opponent:
+				if piece._rank_code == CHARIOT:
+					pinned.add(center)
+				elif piece._rank_code == CANNON:
+					pinned.add(center)
+					cannon_lines.add(center)
+
+		for origins, rank in ((HORSE_ORIGINS, HORSE), (ELEPHANT_ORIGINS, ELEPHANT)):
+			for origin, leg in origins[general]:
+				piece = board[origin]
+				if piece and piece._player == opponent and piece._rank_code == rank:
+					pinned.add(leg)
+
+		return pinned, cannon_lines
+
+	def _evasions(self, player):
+		"""Yields the legal (from, to) square number pairs for a player who is
+		in check. Only moves that could possibly get out of check are tried:
+		moves by the general, captures of a checking piece, moves onto the
+		squares between a checking chariot or cannon and the general (or onto
+		a horse or elephant's leg), and moves by a piece that is a cannon's
+		screen. Each one is still tried on the board, since it could uncover
+		a different check."""
+		board = self._board
+		general = self._find_general(player)
+		checkers, blocks, screens = self._attack_lines(general, OPPONENT[player])
+
+		candidates = set((general, b) for b in self._targets(board[general], general))
+
+		for b in blocks:
+			target = board[b]
+			if not target or target._player != player:
+				for a in self._attack_lines(b, player)[0]:
+					if a != general:
+						candidates.add((a, b))
+
+		for a in screens:
+			piece = board[a]
+			if a != general and piece._player == player:
+				for b in self._targets(piece, a):
+					candidates.add((a, b))
+
+		for a, b in sorted(candidates):
+			self._push(a, b)
+			in_check = self.is_in_check(player)
+			self._pop()
+
+			if not in_check:
+				yield a, b
+
+	def is_square_attacked(self, square, by_player):
+		"""Takes a square name and a player ('blue' or 'red') and returns True
+		if any of that player's pieces could move onto the square (as if it held
+		an enemy piece), False otherwise"""
+		return self._is_attacked(SQUARE_INDEX[square], by_player)
+
+	def _is_attacked(self, square, by_player):
+		"""Takes a square number and a player and returns True if one of the
+		player's pieces attacks it. Instead of asking every piece where it can
+		go, this works backward from the square, looking only at the squares an
+		attacker would have to be standing on, and stops at the first one."""
+		return self._line_attacked(square, by_player) or self._step_attacked(square, by_player)
+
+	def _line_attacked(self, square, by_player):
+		"""The part of _is_attacked that looks for chariots and cannons along
+		the rows and columns through the square"""
+		board = self._board
+
+		"""Chariots and cannons along the orthogonal lines. The first piece
+			in each direction can be a chariot; after that first piece (which
+			can't be a cannon) only a cannon jumping over it can attack"""
+		for ray in RAYS[square]:
+			piece_to_jump = False
+			for s in ray:
+				piece = board[s]
+				if not piece:
+					continue
+				rank = piece._rank_code
+				if not piece_to_jump:
+					if rank == CHARIOT and piece._player == by_player:
+						return True
+					if rank == CANNON:
+						break
+					piece_to_jump = True
+				elif rank == CANNON:
+					if piece._player == by_player:
+						return True
+					break
 
-			# Blue Palace Diagonal Jumps
-			if a in ['d8', 'f8', 'd10', 'f10'] and self._pieces['e9']:
-				blue_jumps = {'d8': 'f10', 'f8': 'd10', 'd10': 'f8', 'f10': 'd8'}
+		return False
+
+	def _step_attacked(self, square, by_player):
+		"""The part of _is_attacked that looks for every other kind of attack:
+		along the palace diagonals, and by pieces that step or leap"""
+		board = self._board
+
+		"""Chariots, cannons and soldiers along the palace diagonals"""
+		for s in DIAGONAL_STEPS[square]:
+			piece = board[s]
+			if piece and piece._player == by_player:
+				if piece._rank_code == CHARIOT or piece._rank_code == SOLDIER:
+					return True
+
+		for center, s in DIAGONAL_JUMPS[square]:
+			piece = board[s]
+			if piece and piece._player == by_player:
+				if piece._rank_code == CHARIOT and not board[center]:
+					return True
+				if piece._rank_code == CANNON and board[center]:
+					return True
+
+		"""Horses and elephants, as long as their first step isn't blocked"""
+		for origin, leg in HORSE_ORIGINS[square]:
+			piece = board[origin]
+			if piece and not board[leg] and piece._rank_code == HORSE:
+				if piece._player == by_player:
+					return True
+
+		for origin, leg in ELEPHANT_ORIGINS[square]:
+			piece = board[origin]
+			if piece and not board[leg] and piece._rank_code == ELEPHANT:
+				if piece._player == by_player:
+					return True
+
+		"""Soldiers, generals and guards, which only step one square"""
+		for origin in SOLDIER_SOURCES[by_player][square]:
+			piece = board[origin]
+			if piece and piece._player == by_player and piece._rank_code == SOLDIER:
+				return True
 
-				for s, f in blue_jumps.items():
-					if a == s:
-						if not self._pieces[f] or self._pieces[f].get_player() != player:
-							moves.append(f)
-
-			"""All other standard cannon cases"""
-
-			directions = [above, below, left_of, right_of]
-
-			for direction in directions:
-				if direction(a):
-					next_sq = direction(a)
-					piece_to_jump = False
-
-					while next_sq:
-						if next_sq == b:
-							return piece_to_jump
-						elif self._pieces[next_sq]:
-							if self._pieces[next_sq].get_rank() == 'cannon':
-								break
-							else:
-								piece_to_jump = True
-								next_sq = direction(next_sq)
-						else:
-							next_sq = direction(next_sq)
-
-			return b in moves
-
-		elif rank == 'soldier':
-			moves = []
-
-			"""Special case for when the soldier is in a palace"""
-			# Red Palace
-			red_center = self._pieces['e2']
-			red_corners = ['d1', 'f1', 'd3', 'f3']
-
-			if a in red_corners:
-				if not red_center or (red_center and red_center.get_player() != player):
-					moves.append('e2')
-
-			elif a == 'e2':
-				for corner in red_corners:
-					piece = self._pieces[corner]
-					if not piece or (piece and piece.get_player() != player):
-						moves.append(corner)
-
-			# Blue Palace
-			blue_center = self._pieces['e9']
-			blue_corners = ['d8', 'f8', 'd10', 'f10']
-
-			if a in blue_corners:
-				if not blue_center or (blue_center and blue_center.get_player() != player):
-					moves.append('e9')
-
-			elif a == 'e9':
-				for corner in blue_corners:
-					piece = self._pieces[corner]
-					if not piece or (piece and piece.get_player() != player):
-						moves.append(corner)
-
-			"""All other standard cases"""
-			if player == 'blue': directions = [above, left_of, right_of]
-			if player == 'red': directions = [below, left_of, right_of]
-
-			for direction in directions:
-				next_sq = direction(a)
-				if next_sq:
-					next_pc = self._pieces[next_sq]
-					if not next_pc or (next_pc and next_pc.get_player() != player):
-						# Blank square or enemy piece is adjacent
-						moves.append(next_sq)
-
-			return b in moves
+		for origin in PALACE_SOURCES[by_player][square]:
+			piece = board[origin]
+			if piece and piece._player == by_player:
+				if piece._rank_code == GENERAL or piece._rank_code == GUARD:
+					return True
+
+		return False
+
+	def _attack_lines(self, square, by_player):
+		"""Takes a square number and a player and works backward from the
+		square like _is_attacked, but finds every attacker instead of
+		stopping at the first. Returns a list of the attackers' squares, a
+		set of squares where a piece could block one of the attacks (the
+		attackers' own squares, the squares between a chariot or cannon and
+		the square, and horse and elephant legs), and a set of the squares
+		holding the pieces that cannons are jumping over."""
+		board = self._board
+		attackers = []
+		blocks = set()
+		screens = set()
+
+		for ray in RAYS[square]:
+			between = []
+			piece_to_jump = False
+			for s in ray:
+				piece = board[s]
+				if not piece:
+					between.append(s)
+					continue
+				rank = piece._rank_code
+				if not piece_to_jump:
+					if rank == CHARIOT and piece._player == by_player:
+						attackers.append(s)
+						blocks.update(between)
+					if rank == CANNON:
+						break
+					piece_to_jump = True
+					between.append(s)
+				elif rank == CANNON:
+					if piece._player == by_player:
+						attackers.append(s)
+						blocks.update(between)
+						screens.update(b for b in between if board[b])
+					break
+				else:
+					between.append(s)
+
+		for s in DIAGONAL_STEPS[square]:
+			piece = board[s]
+			if piece and piece._player == by_player:
+				if piece._rank_code == CHARIOT or piece._rank_code == SOLDIER:
+					attackers.append(s)
+
+		for center, s in DIAGONAL_JUMPS[square]:
+			piece = board[s]
+			if piece and piece._player == by_player:
+				if piece._rank_code == CHARIOT and not board[center]:
+					attackers.append(s)
+					blocks.add(center)
+				elif piece._rank_code == CANNON and board[center]:
+					attackers.append(s)
+					screens.add(center)
+
+		for origins, rank in ((HORSE_ORIGINS, HORSE), (ELEPHANT_ORIGINS, ELEPHANT)):
+			for origin, leg in origins[square]:
+				piece = board[origin]
+				if piece and not board[leg] and piece._rank_code == rank:
+					if piece._player == by_player:
+						attackers.append(origin)
+						blocks.add(leg)
+
+		for origin in SOLDIER_SOURCES[by_player][square]:
+			piece = board[origin]
+			if piece and piece._player == by_player and piece._rank_code == SOLDIER:
+				attackers.append(origin)
+
+		for origin in PALACE_SOURCES[by_player][square]:
+			piece = board[origin]
+			if piece and piece._player == by_player:
+				if piece._rank_code == GENERAL or piece._rank_code == GUARD:
+					attackers.append(origin)
+
+		blocks.update(attackers)
+		return attackers, blocks, screens
 
 	def find_general(self, player):
 		"""Takes a player ('blue' or 'red') as a parameter and returns
 		the name of the square which holds that player's general"""
-		for square, piece in self._pieces.items():
-			if piece:
-				if piece.get_player() == player and piece.get_rank() == 'general':
-					return square
+		square = self._find_general(player)
+		if square is not None:
+			return SQUARES[square]
+
+	def _find_general(self, player):
+		"""Takes a player ('blue' or 'red') and returns the number of the
+		square which holds that player's general, or None"""
+		for square in self._ranks[player]['general']:
+			return square
 
 	def is_in_check(self, player):
 		"""Takes a position and returns True if a player is vulnerable there,
 			False otherwise"""
 
-		if player == 'blue':
-			opponent = 'red'
-		else:
-			opponent = 'blue'
-
-		in_check = False
-		# Check each of the other team's pieces to see if they capture
-		for square, piece in self._pieces.items():
-			if piece:
-				if piece.get_player() == opponent:
-					if self.legal_move(piece, square, self.find_general(player)):
-						in_check = True
+		general = self._find_general(player)
+		if general is None:
+			return False
 
-		return in_check
+		return self._is_attacked(general, OPPONENT[player])
 
 	def is_in_checkmate(self, player):
 		"""Takes a player ('blue' or 'red') as a parameter and returns
 		True if that player is in checkmate, False otherwise."""
 
-		# Mapping of valid squares the general/guards can move to
-		valid_squares = {
-			'red': {
-				'd1': ['e1', 'd2', 'e2'], 'e1': ['d1', 'f1', 'e2'],
-				'f1': ['e1', 'e2', 'f2'], 'd2': ['d1', 'e2', 'd3'],
-				'e2': ['d1', 'e1', 'f1', 'd2', 'f2', 'd3', 'e3', 'f3'],
-				'f2': ['f1', 'e2', 'f3'], 'd3': ['d2', 'e2', 'e3'],
-				'e3': ['e2', 'd3', 'f3'], 'f3': ['e2', 'f2', 'e3'],
-			},
-
-			'blue': {
-				'd8': ['e8', 'd9', 'e9'], 'e8': ['d8', 'f8', 'e9'],
-				'f8': ['e8', 'e9', 'f9'], 'd9': ['d8', 'e9', 'd10'],
-				'e9': ['d8', 'e8', 'f8', 'd9', 'f9', 'd10', 'e10', 'f10'],
-				'f9': ['f8', 'e9', 'f10'], 'd10': ['d9', 'e9', 'e10'],
-				'e10': ['e9', 'd10', 'f10'], 'f10': ['e9', 'f9', 'e10'],
-			},
-		}
-
-		hideout = self.find_general(player)
-		moves = valid_squares[player][hideout]
-
-		in_checkmate = True
-
-		for move in moves:
-			# Return false if the general can escape by moving to any legal spaces
-			# Reset the board after each try
-
-			if not self._pieces[move] or (self._pieces[move].get_player() != player):
-				original_board = self._pieces.copy()
-
-				# Simulate an attempted escape
-				self._pieces[hideout] = None
-				self._pieces[move] = Piece(player, 'general')
-
-				self._pieces = original_board.copy()
-
-				if not self.is_in_check(player):
-					in_checkmate = False
-					self._pieces = original_board.copy()
-					break
-
-				self._pieces = original_board.copy()
-
-			# If the general can't escape, try all possible moves for all the general's pieces
-			# After each one, set in_checkmate to false if the general isn't in check
-			if in_checkmate:
-				for square, piece in self._pieces.items():
-					if piece and piece.get_player() == player:
-
-						for square2, piece2 in self._pieces.items():
-							if not piece2 or (piece2 and piece2.get_player() != player):
-								if self.legal_move(piece, square, square2):
-									# Simulate an attempted intervention
-									original_board2 = self._pieces.copy()
-
-									self._pieces[square] = None
-									self._pieces[square2] = piece
-
-									if not self.is_in_check(player):
-										in_checkmate = False
-										self._pieces = original_board2.copy()
-										break
-
-									self._pieces = original_board2.copy()
+		in_checkmate = self.is_in_check(player)
 
+		# The player is only in checkmate if none of their moves (including
+		# moves by the general) get them out of check
+		if in_checkmate:
+			for move in self._evasions(player):
+				return False
 
-			if in_checkmate:
-				if self._turn == 'blue':
-					self._game_state = 'RED_WON'
-				elif self._turn == 'red':
-					self._game_state = 'BLUE_WON'
+			if player == 'blue':
+				self._game_state = 'RED_WON'
+			else:
+				self._game_state = 'BLUE_WON'
 
 		return in_checkmate
 
-	def make_move(self, a, b):
+	def make_move(self, a, b, detect_checkmate=True):
 		"""Takes two strings that represent squares such as 'a2' and 'g7'
 		and moves the piece from the first square into the second square,
-		if possible. Returns true if the move is successful, false otherwise."""
+		if possible. Returns true if the move is successful, false otherwise.
+		If detect_checkmate is False the game state isn't updated when the
+		move gives checkmate, so the caller can call is_in_checkmate later
+		(or somewhere else)."""
+		a = SQUARE_INDEX[a]
+		b = SQUARE_INDEX[b]
+
 		# Check if there is an actual piece being moved
-		if not self._pieces[a]:
+		if not self._board[a]:
 			return False
 
 		else:
-			piece = self._pieces[a]
+			piece = self._board[a]
 
-		target = self._pieces[b]
+		target = self._board[b]
 
 		# Check if the game is finished
 		if self._game_state != 'UNFINISHED':
@@ -576,12 +1516,7 @@ class JanggiGame:
 				return False
 
 			else:
-				if self._turn == 'blue':
-					self._turn = 'red'
-
-				elif self._turn == 'red':
-					self._turn = 'blue'
-
+				self._push(a, b)
 				return True
 
 		# Check if the player has a piece in the intended square
@@ -589,23 +1524,16 @@ class JanggiGame:
 			return False
 
 		# Check if the move is legal
-		if not self.legal_move(piece, a, b):
+		if b not in self._targets(piece, a):
 			return False
 
 		else:
 
 			# MOVE THE PIECE
-			self._pieces[a] = None
-			self._pieces[b] = piece
-
-			if self._turn == 'blue':
-				self._turn = 'red'
-
-			elif self._turn == 'red':
-				self._turn = 'blue'
+			self._push(a, b)
 
 			# SEE IF THE GAME IS WON
-			if self.is_in_check(self._turn):
+			if detect_checkmate and self.is_in_check(self._turn):
 				if self.is_in_checkmate(self._turn):
 					if self._turn == 'blue':
 						self._game_state = 'RED_WON'
@@ -613,3 +1541,153 @@ class JanggiGame:
 						self._game_state = 'BLUE_WON'
 
 			return True
+
+	def search(self, depth=None, time_limit=None, book=None):
+		"""Searches for the best move for the player whose turn it is, up to
+		depth plies deep or for time_limit seconds. Returns an
+		engine.SearchResult with the best (from, to) move, its score, the
+		expected line of play and node counts. If an opening book is given
+		and has a move for the position, that move is returned instead. The
+		game is left unchanged."""
+		from engine import Engine
+		return Engine(self, book=book).search(depth, time_limit)
+
+	def book_moves(self, book):
+		"""Takes an opening book (book.OpeningBook) and returns a list of
+		(from, to, weight) for the book's moves in this position that are
+		legal for the player whose turn it is, most played first"""
+		if self._game_state != 'UNFINISHED':
+			return []
+
+		moves = []
+		for a, b, weight in book.lookup(self.position_key()):
+			piece = self._pieces[a]
+			if a == b:
+				legal = not self.is_in_check(self._turn)
+			else:
+				legal = piece is not None and piece._player == self._turn and b in self.legal_moves_from(a)
+			if legal:
+				moves.append((a, b, weight))
+		return moves
+
+	def probe_tablebase(self, tablebases):
+		"""Takes endgame tablebases (tablebase.Tablebases) and returns
+		(result, plies) for the player whose turn it is, where result is
+		'WIN', 'LOSS' or 'DRAW' and plies is how many plies checkmate is away
+		with perfect play (None for a draw). Returns None if there is no
+		table for the pieces on the board, or if the position can't happen
+		(the player who just moved is in check)."""
+		return tablebases.probe(self)
+
+	def tablebase_move(self, tablebases):
+		"""Takes endgame tablebases (tablebase.Tablebases) and returns the
+		(from, to) move that plays perfectly for the player whose turn it is:
+		the fastest checkmate when winning, holding the draw when drawing and
+		the longest resistance when losing. A pass is returned as the
+		general's square twice. Returns None if there is no table for the
+		position or the game is over."""
+		if self._game_state != 'UNFINISHED':
+			return None
+
+		player = self._turn
+		moves = list(self._legal_moves(player))
+		if not self.is_in_check(player):
+			general = self._find_general(player)
+			moves.append((general, general))
+
+		best = None
+		best_score = None
+		for a, b in moves:
+			self._push(a, b)
+			result = tablebases.probe(self)
+			self._pop()
+			if result is None:
+				continue
+
+			# Rank each move by what it leaves the opponent with
+			outcome, plies = result
+			if outcome == 'LOSS':
+				score = (2, -plies)
+			elif outcome == 'DRAW':
+				score = (1, 0)
+			else:
+				score = (0, plies)
+			if best_score is None or score > best_score:
+				best, best_score = (SQUARES[a], SQUARES[b]), score
+		return best
+
+	def push_move(self, a, b):
+		"""Takes two square names and moves the piece on a to b without
+		checking whether the move is legal, then passes the turn. If a and b
+		are the same square the turn is just passed. The move can be taken
+		back with pop_move. No return value. Raises ValueError, leaving the
+		game as it was, if there is no piece on a to move."""
+		a, b = SQUARE_INDEX[a], SQUARE_INDEX[b]
+		if a != b and not self._board[a]:
+			raise ValueError('no piece on %s to move' % SQUARES[a])
+		self._push(a, b)
+
+	def pop_move(self):
+		"""Takes back the last move made with make_move or push_move,
+		restoring the board, the turn and the game state. Returns True if a
+		move was taken back, False if there were no moves to take back."""
+		if not self._history:
+			return False
+		self._pop()
+		return True
+
+	def _push(self, a, b):
+		"""Takes two square numbers and plays the move on the board, saving an
+		undo record of (from, to, captured piece, turn, game state) so _pop
+		can put everything back without copying the board"""
+		captured = self._board[b]
+		self._history.append((a, b, captured, self._turn, self._game_state))
+
+		if a != b:
+			if captured:
+				self._remove(b)
+			self._add(b, self._remove(a))
+
+		self._turn = OPPONENT[self._turn]
+
+	def _pop(self):
+		"""Takes back the move saved by the most recent _push"""
+		a, b, captured, self._turn, self._game_state = self._history.pop()
+
+		if a != b:
+			self._add(a, self._remove(b))
+			if captured:
+				self._add(b, captured)
+
+	def _add(self, square, piece):
+		"""Takes an empty square number and a piece and puts the piece there,
+		keeping the lists of each player's squares up to date"""
+		self._board[square] = piece
+		player = piece._player
+		rank = piece._rank
+		self._occupied[player].add(square)
+		self._ranks[player][rank].add(square)
+		self._hash ^= ZOBRIST[player][rank][square]
+		self._score += self._weights[piece._player_code * 7 + piece._rank_code][square]
+
+	def _remove(self, square):
+		"""Takes an occupied square number, takes the piece off of it and
+		returns the piece, keeping the lists of each player's squares up
+		to date"""
+		piece = self._board[square]
+		self._board[square] = None
+		player = piece._player
+		rank = piece._rank
+		self._occupied[player].discard(square)
+		self._ranks[player][rank].discard(square)
+		self._hash ^= ZOBRIST[player][rank][square]
+		self._score -= self._weights[piece._player_code * 7 + piece._rank_code][square]
+		return piece
+
+	def _set(self, square, piece):
+		"""Takes a square number and a piece (or None) and replaces whatever
+		was on the square with it"""
+		if self._board[square]:
+			self._remove(square)
+		if piece:
+			self._add(square, piece)
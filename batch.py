@@ -0,0 +1,443 @@
+# Description: Works out attacks, check and moves for a whole batch of
+# JanggiGame positions at once with NumPy. Boards are stacked into an
+# (N, 10, 9) int8 array holding the same piece codes as JanggiGame.to_bytes (0
+# for an empty square, 1 + the piece's index in PIECES otherwise). Every rank's
+# moves are precomputed as lines of squares leading away from each square
+# (rows, columns, palace diagonals, and leg then target for horses and
+# elephants), so each question is answered for every board with a few array
+# operations instead of a Python loop. The answers are the same as the ones
+# the scalar JanggiGame gives.
+#
+# NumPy is optional: JanggiGame doesn't need it, and this module only needs it
+# when one of its functions is called.
+#
+# Usage: python batch.py [boards] [--seed SEED]
+
+import argparse
+import math
+import random
+import sys
+import time
+
+from JanggiGame import (JanggiGame, PLAYERS, OPPONENT, PLAYER_CODES, GENERAL, GUARD,
+	ELEPHANT, HORSE, CHARIOT, CANNON, SOLDIER, RAYS, HORSE_PATHS, ELEPHANT_PATHS, HORSE_ORIGINS,
+	ELEPHANT_ORIGINS, PALACE_STEPS, PALACE_SOURCES, DIAGONAL_STEPS, DIAGONAL_JUMPS, SOLDIER_STEPS,
+	SOLDIER_SOURCES)
+
+try:
+	import numpy as np
+except ImportError:
+	np = None
+
+
+# What the squares before a square on a line must hold for a piece to move
+# between the start of the line and that square: all empty (chariots, and the
+# squares after a horse or elephant's leg), at least one piece (the cannon's
+# diagonal jump), or at least one piece and no cannons (the cannon's jumps
+# along rows and columns). NEVER marks squares that can't be moved to at all,
+# like a horse's leg.
+EMPTY, OCCUPIED, SCREEN, NEVER = 0, 1, 2, 3
+
+# Lines are padded out with square 90, an extra square on the end of every
+# board that is always empty
+PAD = 90
+
+# How many times the benchmark runs each function (the fastest run counts)
+REPEATS = 3
+
+# How many boards the check test looks at in one go when finding legal moves,
+# to keep the arrays it makes a reasonable size
+CHUNK = 16384
+
+
+def _lines(player, rank, square, backward):
+	"""Returns the lines for one of the player's pieces of the given rank on
+	the given square, as lists of (square, need) pairs running away from the
+	square. Going forward, the lines lead to the squares the piece could move
+	to. Going backward, they lead to the squares a piece of that rank would
+	have to be on to attack the square. Palace diagonals, rows and columns
+	work the same both ways; horses, elephants, soldiers and the palace steps
+	don't."""
+	lines = []
+
+	if rank == GENERAL or rank == GUARD:
+		sources = PALACE_SOURCES[player][square] if backward else PALACE_STEPS[player].get(square, ())
+		lines.extend([(s, EMPTY)] for s in sources)
+
+	elif rank == HORSE or rank == ELEPHANT:
+		if backward:
+			paths = (HORSE_ORIGINS if rank == HORSE else ELEPHANT_ORIGINS)[square]
+			lines.extend([(leg, NEVER), (origin, EMPTY)] for origin, leg in paths)
+		else:
+			paths = (HORSE_PATHS if rank == HORSE else ELEPHANT_PATHS)[square]
+			lines.extend([(leg, NEVER), (target, EMPTY)] for leg, target in paths)
+
+	elif rank == CHARIOT:
+		jumps = DIAGONAL_JUMPS[square]
+		lines.extend([(center, EMPTY), (s, EMPTY)] for center, s in jumps)
+		if not jumps:
+			lines.extend([(s, EMPTY)] for s in DIAGONAL_STEPS[square])
+		lines.extend([(s, EMPTY) for s in ray] for ray in RAYS[square] if ray)
+
+	elif rank == CANNON:
+		lines.extend([(center, NEVER), (s, OCCUPIED)] for center, s in DIAGONAL_JUMPS[square])
+		lines.extend([(s, SCREEN) for s in ray] for ray in RAYS[square] if ray)
+
+	elif rank == SOLDIER:
+		steps = SOLDIER_SOURCES[player][square] if backward else SOLDIER_STEPS[player][square]
+		lines.extend([(s, EMPTY)] for s in DIAGONAL_STEPS[square] + steps)
+
+	return lines
+
+
+def _line_table(player, rank, backward):
+	"""Returns the lines for every square as a pair of (90, lines, length)
+	arrays of squares and needs, padded with PAD squares that are NEVER
+	moved to"""
+	return _line_arrays([_lines(player, rank, square, backward) for square in range(90)])
+
+
+def _line_arrays(lines):
+	"""Takes a list of lines for each square and returns them as a pair of
+	(90, lines, length) arrays of squares and needs, padded with PAD squares
+	that are NEVER moved to"""
+	count = max(1, max(len(square_lines) for square_lines in lines))
+	length = max(1, max(len(line) for square_lines in lines for line in square_lines))
+
+	squares = np.full((90, count, length), PAD, np.intp)
+	needs = np.full((90, count, length), NEVER, np.int8)
+	for square, square_lines in enumerate(lines):
+		for index, line in enumerate(square_lines):
+			for position, (s, need) in enumerate(line):
+				squares[square, index, position] = s
+				needs[square, index, position] = need
+	return squares, needs
+
+
+def _attack_table(player, codes):
+	"""Returns the backward lines of all of the player's ranks together, so
+	every attack on a square can be looked for at once: (90, lines, length)
+	arrays of squares and needs like _line_table, and a (90, lines) array of
+	the piece code that attacks along each line (-1 for padding lines, which
+	nothing attacks along)"""
+	lines = []
+	for square in range(90):
+		square_lines = []
+		for rank in range(7):
+			square_lines.extend((codes[rank], line) for line in _lines(player, rank, square, True))
+		lines.append(square_lines)
+
+	squares, needs = _line_arrays([[line for code, line in square_lines] for square_lines in lines])
+	line_codes = np.full(squares.shape[:2], -1, np.int8)
+	for square, square_lines in enumerate(lines):
+		line_codes[square, :len(square_lines)] = [code for code, line in square_lines]
+	return squares, needs, line_codes
+
+
+def _aim_table(player, codes):
+	"""Returns the squares on any of the player's backward lines from each
+	square, as a (90, count) array padded with PAD, and a (90, count, codes)
+	bool array that is True where the piece with that code would be aimed
+	down one of those lines from that square"""
+	aims = []
+	for square in range(90):
+		square_aims = {}
+		for rank in range(7):
+			for line in _lines(player, rank, square, True):
+				for s, need in line:
+					square_aims.setdefault(s, set()).add(codes[rank])
+		aims.append(sorted(square_aims.items()))
+
+	count = max(len(square_aims) for square_aims in aims)
+	squares = np.full((90, count), PAD, np.intp)
+	aimed = np.zeros((90, count, len(PLAYERS) * 7 + 1), bool)
+	for square, square_aims in enumerate(aims):
+		for index, (s, aiming) in enumerate(square_aims):
+			squares[square, index] = s
+			aimed[square, index, sorted(aiming)] = True
+	return squares, aimed
+
+
+class _Tables:
+	"""The forward line tables for each of one player's ranks, the backward
+	lines of all of them together, and the piece code for each rank"""
+
+	def __init__(self, player):
+		player_code = PLAYER_CODES[player]
+		self.codes = [player_code * 7 + rank + 1 for rank in range(7)]
+		self.forward = [_line_table(player, rank, False) for rank in range(7)]
+		self.backward = _attack_table(player, self.codes)
+		self.aims = _aim_table(player, self.codes)
+
+
+_tables = {}
+
+
+def _require_numpy():
+	"""Raises ImportError if NumPy isn't installed"""
+	if np is None:
+		raise ImportError('the batch module needs NumPy')
+
+
+def _get_tables(player):
+	"""Returns the player's _Tables, building them the first time"""
+	_require_numpy()
+	if player not in _tables:
+		_tables[player] = _Tables(player)
+	return _tables[player]
+
+
+def _is_cannon():
+	"""Returns a lookup array that is True for the codes of both cannons"""
+	lookup = np.zeros(len(PLAYERS) * 7 + 1, bool)
+	for player_code in range(len(PLAYERS)):
+		lookup[player_code * 7 + CANNON + 1] = True
+	return lookup
+
+
+_IS_CANNON = _is_cannon() if np is not None else None
+
+
+def stack(games):
+	"""Takes a list of JanggiGames and returns their boards as an (N, 10, 9)
+	int8 array of piece codes"""
+	_require_numpy()
+	data = bytearray()
+	for game in games:
+		data += bytes(piece._player_code * 7 + piece._rank_code + 1 if piece else 0 for piece in game._board)
+	return np.frombuffer(bytes(data), np.int8).reshape(-1, 10, 9).copy()
+
+
+def _flatten(boards):
+	"""Takes stacked boards and returns them as an (N, 91) array with the
+	always empty padding square on the end"""
+	_require_numpy()
+	boards = np.asarray(boards, np.int8)
+	flat = np.zeros((len(boards), 91), np.int8)
+	flat[:, :90] = boards.reshape(len(boards), 90)
+	return flat
+
+
+def _allowed(codes, needs):
+	"""Takes the piece codes on the squares of some lines (running along the
+	last axis) and the needs of those squares, and returns whether a piece at
+	the start of each line could reach each square"""
+	occupied = codes != 0
+	before = np.cumsum(occupied, axis=-1, dtype=np.int8) - occupied
+	allowed = np.where(needs == EMPTY, before == 0, before > 0) & (needs != NEVER)
+
+	screens = needs == SCREEN
+	if screens.any():
+		cannons = _IS_CANNON[codes]
+		cannons_before = np.cumsum(cannons, axis=-1, dtype=np.int8) - cannons
+		allowed &= ~screens | (cannons_before == 0)
+	return allowed
+
+
+def _moves_from(flat, player):
+	"""Works forward from each of the player's pieces, one rank at a time.
+	Returns arrays of board numbers, from squares and to squares with an
+	entry for every square each piece could move to, whatever is on it."""
+	tables = _get_tables(player)
+	found = []
+	for rank, (squares, needs) in enumerate(tables.forward):
+		n, a = np.nonzero(flat[:, :90] == tables.codes[rank])
+		if not len(n):
+			continue
+		lines = squares[a]
+		i, line, position = np.nonzero(_allowed(flat[n[:, None, None], lines], needs[a]))
+		found.append((n[i], a[i], lines[i, line, position]))
+
+	if not found:
+		empty = np.zeros(0, np.intp)
+		return empty, empty, empty
+	return tuple(np.concatenate(column) for column in zip(*found))
+
+
+def _in_check(flat, player, danger=None):
+	"""Returns an (N,) bool array that is True for the boards where the
+	player's general is attacked. Like JanggiGame.is_in_check, a board
+	without the player's general is never in check. This gathers every line
+	an attacker of any rank would use to reach each board's general, works
+	out what can move along them, and looks for an enemy piece of the right
+	rank at the start of a line it can move along, for all of the boards at
+	once.
+
+	If an (N, 91) bool array is given as danger, it is filled in with the
+	squares where moving a piece away or onto could change whether the
+	general is attacked: the general's own square, and the squares on a
+	line between it and an enemy piece of the rank that attacks along that
+	line, like JanggiGame._pins does."""
+	tables = _get_tables(OPPONENT[player])
+	generals = flat[:, :90] == PLAYER_CODES[player] * 7 + GENERAL + 1
+	rows = np.nonzero(generals.any(axis=1))[0]
+	squares = generals[rows].argmax(axis=1)
+	checked = np.zeros(len(flat), bool)
+	if danger is not None:
+		danger[rows, squares] = True
+
+	# Most boards have no enemy piece anywhere an attacker could come from,
+	# which a look at the few dozen squares around each general shows
+	aim_squares, aiming = tables.aims
+	around = flat[rows[:, None], aim_squares[squares]]
+	aimed = aiming[squares[:, None], np.arange(aim_squares.shape[1]), around].any(axis=1)
+	rows, squares = rows[aimed], squares[aimed]
+
+	# Then only the lines with an enemy piece of the right rank on them are
+	# worked out
+	line_squares, needs, line_codes = tables.backward
+	lines = line_squares[squares]
+	codes = flat[rows[:, None, None], lines]
+	aimed = codes == line_codes[squares][..., None]
+	r, line = np.nonzero(aimed.any(axis=2))
+	codes, aimed, lines = codes[r, line], aimed[r, line], lines[r, line]
+	attacks = (aimed & _allowed(codes, needs[squares[r], line])).any(axis=1)
+	checked[rows[r[attacks]]] = True
+
+	if danger is not None:
+		# Everything on a line before an enemy piece aimed down it
+		behind = np.cumsum(aimed[:, ::-1], axis=-1)[:, ::-1] > aimed
+		i, position = np.nonzero(behind)
+		danger[rows[r[i]], lines[i, position]] = True
+		danger[:, PAD] = False
+	return checked
+
+
+def attack_maps(boards, player):
+	"""Takes stacked boards and a player ('blue' or 'red') and returns an
+	(N, 10, 9) bool array that is True on every square the player attacks,
+	the same as JanggiGame.is_square_attacked"""
+	flat = _flatten(boards)
+	n, a, b = _moves_from(flat, player)
+	attacked = np.zeros((len(flat), 90), bool)
+	attacked[n, b] = True
+	return attacked.reshape(-1, 10, 9)
+
+
+def in_check(boards, player):
+	"""Takes stacked boards and a player and returns an (N,) bool array that
+	is True where the player is in check, the same as JanggiGame.is_in_check"""
+	return _in_check(_flatten(boards), player)
+
+
+def _pseudo_moves(flat, player):
+	"""Returns board numbers, from squares and to squares for every move the
+	player's pieces can make, leaving out moves onto their own pieces"""
+	n, a, b = _moves_from(flat, player)
+	targets = flat[n, b]
+	keep = (targets == 0) | ((targets - 1) // 7 != PLAYER_CODES[player])
+	return n[keep], a[keep], b[keep]
+
+
+def _move_masks(count, n, a, b):
+	"""Turns arrays of board numbers, from squares and to squares into an
+	(N, 90, 90) bool array"""
+	moves = np.zeros((count, 90, 90), bool)
+	moves[n, a, b] = True
+	return moves
+
+
+def pseudo_legal_moves(boards, player):
+	"""Takes stacked boards and a player and returns an (N, 90, 90) bool
+	array that is True at [n, a, b] if the player's piece on square number a
+	of board n can move to square number b, the same moves as
+	JanggiGame.generate_moves. Moves that leave the player in check are
+	included."""
+	flat = _flatten(boards)
+	return _move_masks(len(flat), *_pseudo_moves(flat, player))
+
+
+def legal_moves(boards, player):
+	"""Like pseudo_legal_moves, but only the moves that don't leave the
+	player in check, the same moves as JanggiGame.generate_legal_moves. A
+	move that might leave the player in check (any move when they are
+	already in check, or a move from or onto a danger square found by
+	_in_check) is played on a copy of its board, and the copies are all
+	tested for check together."""
+	flat = _flatten(boards)
+	n, a, b = _pseudo_moves(flat, player)
+
+	danger = np.zeros(flat.shape, bool)
+	checked = _in_check(flat, player, danger)
+	risky = np.nonzero(checked[n] | danger[n, a] | danger[n, b])[0]
+
+	legal = np.ones(len(n), bool)
+	for start in range(0, len(risky), CHUNK):
+		moves = risky[start:start + CHUNK]
+		rows = np.arange(len(moves))
+		after = flat[n[moves]]
+		after[rows, b[moves]] = after[rows, a[moves]]
+		after[rows, a[moves]] = 0
+		legal[moves] = ~_in_check(after, player)
+
+	return _move_masks(len(flat), n[legal], a[legal], b[legal])
+
+
+def random_games(count, seed=None, max_moves=60):
+	"""Returns a list of count JanggiGames, each played from the start for a
+	random number of random legal moves, for testing and benchmarking"""
+	rng = random.Random(seed)
+	games = []
+	while len(games) < count:
+		game = JanggiGame()
+		for ply in range(rng.randrange(max_moves)):
+			moves = list(game._legal_moves(game._turn))
+			if not moves:
+				break
+			game._push(*rng.choice(moves))
+		games.append(game)
+	return games
+
+
+def main(argv=None):
+	"""Command line entry point. Times the batch functions against the scalar
+	JanggiGame on random positions and prints boards per second, from the
+	best of REPEATS runs of each."""
+	parser = argparse.ArgumentParser(description='Time batched attack, check and move generation.')
+	parser.add_argument('boards', type=int, nargs='?', default=1000, help='number of random positions (default 1000)')
+	parser.add_argument('--seed', type=int, default=0, help='seed for the random positions')
+	args = parser.parse_args(argv)
+
+	_require_numpy()
+	games = random_games(args.boards, args.seed)
+	players = [game._turn for game in games]
+
+	# Each side is batched separately, like a caller would
+	sides = []
+	for player in PLAYERS:
+		side = stack([game for game in games if game._turn == player])
+		_get_tables(player)
+		sides.append((side, player))
+
+	def scalar_check():
+		return [game.is_in_check(player) for game, player in zip(games, players)]
+
+	def scalar_attack_maps():
+		return [game.attack_map(player) for game, player in zip(games, players)]
+
+	def scalar_moves():
+		return [list(game._legal_moves(player)) for game, player in zip(games, players)]
+
+	def batched(function):
+		return lambda: [function(side, player) for side, player in sides]
+
+	print('%d positions' % len(games))
+	for name, scalar, batch in (
+			('check', scalar_check, batched(in_check)),
+			('attack maps', scalar_attack_maps, batched(attack_maps)),
+			('legal moves', scalar_moves, batched(legal_moves))):
+		line = '  %-12s' % name
+		for label, function in (('scalar', scalar), ('batch', batch)):
+			elapsed = None
+			for repeat in range(REPEATS):
+				start = time.perf_counter()
+				function()
+				elapsed = min(elapsed or math.inf, time.perf_counter() - start)
+			line += '  %s %9.0f boards/s' % (label, len(games) / elapsed)
+		print(line)
+
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,186 @@
+# Description: An optional bitboard backend for JanggiGame. BitboardGame
+# plays exactly like JanggiGame, but it also keeps the squares occupied by each
+# player and by each of their ranks as bits of a Python integer (bit 0 is
+# 'a1', bit 89 is 'i10'). Chariot and cannon moves and attacks are then worked
+# out a whole line at a time with bit operations instead of one square at a
+# time, and occupancy and attack sets can be combined with & and |.
+
+from JanggiGame import (JanggiGame, PLAYERS, RANKS, OPPONENT, SQUARE_INDEX, RAYS,
+	DIAGONAL_MASKS, DIAGONAL_JUMPS, _mask)
+
+
+def squares_of(bits):
+	"""Takes a bitboard and yields the square number of each bit that is set,
+	lowest first"""
+	while bits:
+		low = bits & -bits
+		yield low.bit_length() - 1
+		bits ^= low
+
+
+# RAY_MASKS[square][direction] has a bit for every square a chariot on the
+# square could slide through in that direction on an empty board
+RAY_MASKS = [tuple(_mask(ray) for ray in RAYS[square]) for square in range(90)]
+
+# Moving DOWN or RIGHT the square numbers get bigger, so the nearest piece is
+# the lowest bit; moving UP or LEFT it is the highest bit
+_INCREASING = (False, True, False, True)
+
+
+def _nearest(bits, direction):
+	"""Takes a bitboard of the pieces on one ray and returns the square number
+	of the one nearest to where the ray starts"""
+	if _INCREASING[direction]:
+		return (bits & -bits).bit_length() - 1
+	return bits.bit_length() - 1
+
+
+def chariot_lines(square, occupied):
+	"""Takes a square number and a bitboard of every occupied square, and
+	returns a bitboard of the squares a chariot there reaches along its row
+	and column: every empty square up to the first piece in each direction,
+	plus that piece's square"""
+	reach = 0
+	for direction, ray in enumerate(RAY_MASKS[square]):
+		blockers = occupied & ray
+		if blockers:
+			reach |= ray ^ RAY_MASKS[_nearest(blockers, direction)][direction]
+		else:
+			reach |= ray
+	return reach
+
+
+def cannon_lines(square, occupied, cannons):
+	"""Takes a square number and bitboards of every occupied square and of
+	every cannon, and returns a bitboard of the squares a cannon there reaches
+	along its row and column. The cannon needs a piece to jump that isn't a
+	cannon, and after that it carries on over other pieces until the board
+	ends or it reaches a cannon, which it can land on but not jump."""
+	reach = 0
+	for direction, ray in enumerate(RAY_MASKS[square]):
+		blockers = occupied & ray
+		if not blockers:
+			continue
+		screen = _nearest(blockers, direction)
+		if cannons >> screen & 1:
+			continue
+		beyond = RAY_MASKS[screen][direction]
+		stops = cannons & beyond
+		if stops:
+			beyond ^= RAY_MASKS[_nearest(stops, direction)][direction]
+		reach |= beyond
+	return reach
+
+
+class BitboardGame(JanggiGame):
+	"""A JanggiGame that also keeps bitboards of where each player's pieces
+	are, and uses them for chariot and cannon moves and attacks. Everything
+	else, including the rules for every other rank, comes from JanggiGame."""
+
+	def _clear(self):
+		"""Empties the board like JanggiGame._clear, and clears every bit"""
+		JanggiGame._clear(self)
+		self._bits = {player: 0 for player in PLAYERS}
+		self._rank_bits = {player: {rank: 0 for rank in RANKS} for player in PLAYERS}
+
+	def _copy_state(self, other):
+		"""Copies another BitboardGame like JanggiGame._copy_state, bitboards
+		included"""
+		JanggiGame._copy_state(self, other)
+		self._bits = dict(other._bits)
+		self._rank_bits = {player: dict(ranks) for player, ranks in other._rank_bits.items()}
+
+	def occupancy(self, player=None):
+		"""Returns a bitboard of the squares holding the player's pieces, or
+		every piece if no player is given"""
+		if player is None:
+			return self._bits['blue'] | self._bits['red']
+		return self._bits[player]
+
+	def rank_occupancy(self, player, rank):
+		"""Returns a bitboard of the squares holding the player's pieces of
+		the given rank"""
+		return self._rank_bits[player][rank]
+
+	def line_attacks(self, square):
+		"""Takes a square name and returns a bitboard of the squares the
+		chariot or cannon on it attacks along its row and column (whatever is
+		on those squares), or 0 if there isn't a chariot or cannon there"""
+		square = SQUARE_INDEX[square]
+		piece = self._board[square]
+		if not piece:
+			return 0
+		return self._line_reach(piece.get_rank(), square)
+
+	def _line_reach(self, rank, square):
+		"""Returns chariot_lines or cannon_lines for the square, depending on
+		the rank, using this game's bitboards"""
+		occupied = self._bits['blue'] | self._bits['red']
+		if rank == 'chariot':
+			return chariot_lines(square, occupied)
+		if rank == 'cannon':
+			cannons = self._rank_bits['blue']['cannon'] | self._rank_bits['red']['cannon']
+			return cannon_lines(square, occupied, cannons)
+		return 0
+
+	def _add(self, square, piece):
+		"""Puts the piece on the square like JanggiGame._add, and sets its bits"""
+		JanggiGame._add(self, square, piece)
+		bit = 1 << square
+		player = piece._player
+		self._bits[player] |= bit
+		self._rank_bits[player][piece._rank] |= bit
+
+	def _remove(self, square):
+		"""Takes the piece off the square like JanggiGame._remove, and clears
+		its bits"""
+		piece = JanggiGame._remove(self, square)
+		bit = 1 << square
+		player = piece._player
+		self._bits[player] ^= bit
+		self._rank_bits[player][piece._rank] ^= bit
+		return piece
+
+	def _player_bits(self, player):
+		return self._bits[player]
+
+	def _chariot_reach(self, piece, a):
+		"""Works out what a chariot attacks with bitboards"""
+		reach = self._line_reach('chariot', a) | DIAGONAL_MASKS[a]
+		for center, b in DIAGONAL_JUMPS[a]:
+			if not self._board[center]:
+				reach |= 1 << b
+		return reach
+
+	def _cannon_reach(self, piece, a):
+		"""Works out what a cannon attacks with bitboards"""
+		reach = self._line_reach('cannon', a)
+		for center, b in DIAGONAL_JUMPS[a]:
+			if self._board[center]:
+				reach |= 1 << b
+		return reach
+
+	def _chariot_targets(self, piece, a):
+		"""Works out chariot moves with bitboards"""
+		return list(squares_of(self._chariot_reach(piece, a) & ~self._bits[piece._player]))
+
+	def _cannon_targets(self, piece, a):
+		"""Works out cannon moves with bitboards"""
+		return list(squares_of(self._cannon_reach(piece, a) & ~self._bits[piece._player]))
+
+	def _line_attacked(self, square, by_player):
+		"""Looks for chariots and cannons attacking the square along its row
+		and column. A line attack works the same in both directions, so this
+		is the set of squares a chariot or cannon on the square would reach,
+		checked against where by_player's chariots and cannons are."""
+		ranks = self._rank_bits[by_player]
+		occupied = self._bits['blue'] | self._bits['red']
+		if chariot_lines(square, occupied) & ranks['chariot']:
+			return True
+
+		if ranks['cannon']:
+			cannons = ranks['cannon'] | self._rank_bits[OPPONENT[by_player]]['cannon']
+			if cannon_lines(square, occupied, cannons) & ranks['cannon']:
+				return True
+
+		return False
@@ -0,0 +1,198 @@
+# Description: An opening book for JanggiGame. BookBuilder plays through game
+# records and counts how often each move was played from each position in
+# the first few plies. It writes the counts to a binary file of fixed-size
+# records sorted by position key. OpeningBook memory-maps that file and looks
+# positions up with a binary search right on the mapped pages, so any number
+# of processes can share one copy of the book in the page cache without
+# reading it in. JanggiGame.book_moves asks a book about the current position.
+#
+# The file is a 16 byte header (MAGIC and the number of records) followed by
+# RECORD-sized records: position key, from square number, to square number
+# and how many times the move was played.
+#
+# A game record file has one game per line: optionally the blue and red
+# setups (see JanggiGame.SETUPS), then the moves as from-to square names.
+# Anything after a '#' is ignored.
+#
+#     eheh hehe c7-c6 c4-c5 b10-d7
+#
+# Usage: python book.py build GAMES BOOK [--max-ply N]
+#        python book.py probe BOOK [FEN]
+
+import argparse
+import collections
+import mmap
+import os
+import struct
+import sys
+
+from JanggiGame import JanggiGame, SETUPS, SQUARES, SQUARE_INDEX
+
+
+MAGIC = b'JGBOOK1\n'
+HEADER = struct.Struct('<8sQ')
+RECORD = struct.Struct('<QBB2xI')
+
+# How many plies into each game are put in the book
+DEFAULT_MAX_PLY = 20
+
+MAX_WEIGHT = 2 ** 32 - 1
+
+
+def parse_record(line):
+	"""Takes one line of a game record file and returns (blue setup, red
+	setup, moves), where moves is a list of (from, to) square names, or None
+	for a blank line. Raises ValueError for anything it can't read."""
+	tokens = line.split('#')[0].split()
+	if not tokens:
+		return None
+
+	blue_setup = red_setup = 'eheh'
+	if tokens[0] in SETUPS:
+		if len(tokens) < 2 or tokens[1] not in SETUPS:
+			raise ValueError('expected a setup for each player: %r' % line)
+		blue_setup, red_setup = tokens[:2]
+		tokens = tokens[2:]
+
+	moves = []
+	for token in tokens:
+		move = tuple(token.split('-'))
+		if len(move) != 2 or move[0] not in SQUARE_INDEX or move[1] not in SQUARE_INDEX:
+			raise ValueError('bad move %r' % token)
+		moves.append(move)
+	return blue_setup, red_setup, moves
+
+
+class BookBuilder:
+	"""Counts the moves played from each position in the first max_ply
+	plies of the games it is given, and writes them out as a book file"""
+
+	def __init__(self, max_ply=DEFAULT_MAX_PLY):
+		self._max_ply = max_ply
+		self._counts = collections.Counter()
+		self.games = 0
+
+	def __len__(self):
+		"""Returns how many different (position, move) pairs have been seen"""
+		return len(self._counts)
+
+	def add_game(self, moves, blue_setup='eheh', red_setup='eheh'):
+		"""Takes a list of (from, to) square name pairs played from the start
+		with the given setups and counts the first max_ply of them. Raises
+		ValueError if one of those moves isn't legal."""
+		game = JanggiGame(blue_setup, red_setup)
+		for ply, (a, b) in enumerate(moves[:self._max_ply]):
+			key = game.position_key()
+			if not game.make_move(a, b):
+				raise ValueError('illegal move %s-%s at ply %d' % (a, b, ply + 1))
+			self._counts[key, SQUARE_INDEX[a], SQUARE_INDEX[b]] += 1
+		self.games += 1
+
+	def add_records(self, lines):
+		"""Takes the lines of a game record file and adds every game in it"""
+		for number, line in enumerate(lines, 1):
+			try:
+				record = parse_record(line)
+				if record is not None:
+					blue_setup, red_setup, moves = record
+					self.add_game(moves, blue_setup, red_setup)
+			except ValueError as error:
+				raise ValueError('line %d: %s' % (number, error))
+
+	def write(self, path):
+		"""Writes the book to a file, sorted by position key and then most
+		played move first. The file is written next to the old one and moved
+		into place, so processes that have the old book mapped keep working."""
+		records = sorted(self._counts.items(), key=lambda item: (item[0][0], -item[1], item[0][1:]))
+		temporary = path + '.tmp'
+		with open(temporary, 'wb') as f:
+			f.write(HEADER.pack(MAGIC, len(records)))
+			for (key, a, b), count in records:
+				f.write(RECORD.pack(key, a, b, min(count, MAX_WEIGHT)))
+		os.replace(temporary, path)
+
+
+class OpeningBook:
+	"""A book file, memory-mapped for reading. Lookups read the records
+	straight out of the mapped pages."""
+
+	def __init__(self, path):
+		"""Takes the path of a file written by BookBuilder.write"""
+		with open(path, 'rb') as f:
+			self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+		magic, self._count = HEADER.unpack_from(self._map) if len(self._map) >= HEADER.size else (None, 0)
+		if magic != MAGIC or len(self._map) != HEADER.size + self._count * RECORD.size:
+			self._map.close()
+			raise ValueError('%s is not an opening book' % path)
+
+	def __len__(self):
+		return self._count
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+	def close(self):
+		"""Unmaps the file"""
+		self._map.close()
+
+	def _record(self, index):
+		return RECORD.unpack_from(self._map, HEADER.size + index * RECORD.size)
+
+	def lookup(self, key):
+		"""Takes a position key and returns a list of (from, to, weight) for
+		the moves the book has for it, with square names, most played first"""
+		low, high = 0, self._count
+		while low < high:
+			middle = (low + high) // 2
+			if self._record(middle)[0] < key:
+				low = middle + 1
+			else:
+				high = middle
+
+		moves = []
+		for index in range(low, self._count):
+			record_key, a, b, weight = self._record(index)
+			if record_key != key:
+				break
+			moves.append((SQUARES[a], SQUARES[b], weight))
+		return moves
+
+
+def main(argv=None):
+	"""Command line entry point for building a book and looking up a
+	position in one"""
+	parser = argparse.ArgumentParser(description='Build or probe a Janggi opening book.')
+	commands = parser.add_subparsers(dest='command', required=True)
+
+	build = commands.add_parser('build', help='build a book from a game record file')
+	build.add_argument('games', help='game record file, one game per line')
+	build.add_argument('book', help='book file to write')
+	build.add_argument('--max-ply', type=int, default=DEFAULT_MAX_PLY, help='plies of each game to use')
+
+	probe = commands.add_parser('probe', help='list the book moves for a position')
+	probe.add_argument('book', help='book file to read')
+	probe.add_argument('fen', nargs='?', help='position to look up (default is the start)')
+
+	args = parser.parse_args(argv)
+
+	if args.command == 'build':
+		builder = BookBuilder(args.max_ply)
+		with open(args.games) as f:
+			builder.add_records(f)
+		builder.write(args.book)
+		print('%d games, %d positions and moves' % (builder.games, len(builder)))
+		return 0
+
+	game = JanggiGame.from_fen(args.fen) if args.fen else JanggiGame()
+	with OpeningBook(args.book) as book:
+		for a, b, weight in game.book_moves(book):
+			print('%s-%s %d' % (a, b, weight))
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
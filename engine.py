@@ -0,0 +1,448 @@
+# Description: An alpha-beta search engine for JanggiGame. Given a position it
+# searches the tree of legal moves (negamax with alpha-beta pruning and
+# iterative deepening, a capture-only quiescence search at the leaves, and
+# PV / capture / killer / history move ordering) and returns the best move
+# it found, the line it expects to follow and some statistics.
+
+import time
+from array import array
+
+from JanggiGame import PIECE_VALUES, RANKS, SQUARES
+
+
+MATE = 100000		# Score for delivering checkmate right now
+INFINITY = 1000000
+DEFAULT_DEPTH = 3	# Depth to search to when neither a depth nor a time is given
+MAX_DEPTH = 64		# Deepest iteration a timed search will start
+MAX_PLY = 128		# Deepest the main search plus quiescence can go
+CHECK_EVERY = 1024	# How many nodes to search between looks at the clock
+DEFAULT_TABLE_MB = 8	# Size of the transposition table an Engine makes for itself
+
+# Transposition table bound types. EXACT scores are the true value, LOWER
+# scores failed high (the true value is at least this), UPPER scores failed
+# low (the true value is at most this).
+EXACT, LOWER, UPPER = 0, 1, 2
+
+# Move ordering bands. Captures always come before killers, and killers before
+# quiet moves, which are ordered by their history scores (capped below KILLER).
+PV_MOVE = 1 << 30
+CAPTURE = 1 << 20
+KILLER = 1 << 19
+
+# Capture ordering scores, indexed by rank code: what taking a piece of each
+# rank is worth, and what moving one to take with costs. The victim counts for
+# far more, so the attacker only breaks ties.
+VICTIM_SCORES = tuple(PIECE_VALUES[rank] * 16 for rank in RANKS)
+ATTACKER_COSTS = tuple(PIECE_VALUES[rank] // 100 for rank in RANKS)
+
+
+class SearchResult:
+	"""What Engine.search found. best_move is a (from, to) pair of square
+	names (None if there are no legal moves), score is in centipawn-like
+	units from the point of view of the player to move (MATE - n means they
+	mate in n plies), and pv is the line of moves the engine expects. depth is
+	the last depth that was searched to completion, and nodes/qnodes count the
+	positions visited by the main and quiescence searches. table_stats is a
+	snapshot of the transposition table's counters when the search ended.
+	from_book is True if the move came from an opening book instead of a
+	search, in which case there is no score or node count."""
+
+	def __init__(self):
+		self.best_move = None
+		self.score = 0
+		self.pv = []
+		self.depth = 0
+		self.nodes = 0
+		self.qnodes = 0
+		self.table_stats = {}
+		self.elapsed = 0.0
+		self.from_book = False
+
+	def nodes_per_second(self):
+		"""Returns how many positions per second the search visited"""
+		if not self.elapsed:
+			return 0.0
+		return (self.nodes + self.qnodes) / self.elapsed
+
+	def __repr__(self):
+		return 'SearchResult(best_move=%r, score=%d, depth=%d, nodes=%d, qnodes=%d)' % (
+			self.best_move, self.score, self.depth, self.nodes, self.qnodes)
+
+
+class TranspositionTable:
+	"""A fixed-size table of search results keyed by position_key, so a
+	position reached again by a different move order doesn't have to be
+	searched again. The memory is allocated up front and never grows.
+
+	Each entry is two 64-bit numbers (the position key and the packed
+	depth, bound, score, best move and search age), stored in two
+	preallocated arrays. Entries are grouped in buckets of two: the first
+	slot keeps the deepest result (replaced only by a result at least as deep,
+	or one from an older search), and the second slot always takes whatever
+	didn't go into the first."""
+
+	ENTRY_BYTES = 16
+
+	def __init__(self, megabytes=DEFAULT_TABLE_MB):
+		"""Takes the number of megabytes the table may use"""
+		entries = int(megabytes * 1024 * 1024) // self.ENTRY_BYTES
+		buckets = 1
+		while buckets * 4 <= entries:
+			buckets *= 2
+		self._mask = buckets - 1
+		self._keys = array('Q', bytes(8 * buckets * 2))
+		self._data = array('Q', bytes(8 * buckets * 2))
+		self._age = 0
+		self.reset_stats()
+
+	def reset_stats(self):
+		"""Sets the hit, collision and overwrite counters back to zero"""
+		self.probes = 0
+		self.hits = 0
+		self.collisions = 0
+		self.stores = 0
+		self.overwrites = 0
+
+	def clear(self):
+		"""Empties the table (and resets the counters) without reallocating it"""
+		size = len(self._keys)
+		self._keys = array('Q', bytes(8 * size))
+		self._data = array('Q', bytes(8 * size))
+		self._age = 0
+		self.reset_stats()
+
+	def new_search(self):
+		"""Marks the start of a new search. Results from earlier searches stay
+		usable but no longer get priority over new ones."""
+		self._age = (self._age + 1) & 0xff
+
+	def size_bytes(self):
+		"""Returns the number of bytes taken by the table's entries"""
+		return len(self._keys) * self.ENTRY_BYTES
+
+	def stats(self):
+		"""Returns a dictionary of the table's size and counters. A collision
+		is a probe that found its bucket full of other positions, and an
+		overwrite is a store that pushed out another position's entry."""
+		return {
+			'entries': len(self._keys), 'bytes': self.size_bytes(),
+			'probes': self.probes, 'hits': self.hits, 'collisions': self.collisions,
+			'stores': self.stores, 'overwrites': self.overwrites,
+		}
+
+	def probe(self, key):
+		"""Takes a position key and returns (depth, bound, score, move) if the
+		table has an entry for it, or None. move is a (from, to) pair of square
+		numbers or None."""
+		self.probes += 1
+		slot = (key & self._mask) << 1
+		keys = self._keys
+		if keys[slot] != key:
+			slot += 1
+			if keys[slot] != key:
+				if keys[slot - 1]:
+					self.collisions += 1
+				return None
+
+		self.hits += 1
+		data = self._data[slot]
+		move = data >> 32 & 0x3fff
+		return (data >> 22 & 0xff, data >> 30 & 0x3, (data & 0x3fffff) - 0x200000,
+			divmod(move - 1, 90) if move else None)
+
+	def store(self, key, depth, bound, score, move):
+		"""Saves a search result for the position key: the depth searched, the
+		bound type (EXACT, LOWER or UPPER), the score and the best move (a
+		(from, to) pair of square numbers, or None)"""
+		self.stores += 1
+		code = move[0] * 90 + move[1] + 1 if move else 0
+		data = ((score + 0x200000) & 0x3fffff | min(depth, 0xff) << 22 | bound << 30
+			| code << 32 | self._age << 46)
+
+		slot = (key & self._mask) << 1
+		keys = self._keys
+		old = self._data[slot]
+		if keys[slot] == key or not keys[slot] or depth >= (old >> 22 & 0xff) or (old >> 46) != self._age:
+			if keys[slot] and keys[slot] != key:
+				# The deep slot's old entry moves down to the always-replace slot
+				if keys[slot + 1] and keys[slot + 1] != key:
+					self.overwrites += 1
+				keys[slot + 1] = keys[slot]
+				self._data[slot + 1] = old
+			elif keys[slot + 1] == key:
+				keys[slot + 1] = 0
+			keys[slot] = key
+			self._data[slot] = data
+		else:
+			slot += 1
+			if keys[slot] and keys[slot] != key:
+				self.overwrites += 1
+			keys[slot] = key
+			self._data[slot] = data
+
+
+class _OutOfTime(Exception):
+	"""Raised inside the search when the time limit runs out"""
+
+
+class Engine:
+	"""Searches a JanggiGame for the best move for whoever's turn it is. The
+	game is used as the search board (moves are pushed and popped on it) and
+	is left as it was found when search returns."""
+
+	def __init__(self, game, table=None, book=None):
+		"""Takes the JanggiGame to search, and optionally a TranspositionTable
+		to use (which can be shared between engines). Otherwise the engine
+		makes its own table of DEFAULT_TABLE_MB megabytes. An opening book
+		(book.OpeningBook) can be given too, and the engine plays its most
+		played move without searching whenever it has one."""
+		self._game = game
+		self.table = table if table is not None else TranspositionTable()
+		self.book = book
+
+	def search(self, depth=None, time_limit=None):
+		"""Searches one ply deeper at a time, up to depth plies or until
+		time_limit seconds have passed (whichever comes first), and returns a
+		SearchResult for the deepest search that finished. With neither
+		limit the search goes to DEFAULT_DEPTH. The first ply is always
+		searched completely, even if that takes longer than time_limit."""
+		game = self._game
+		start = time.perf_counter()
+		if depth is None:
+			depth = MAX_DEPTH if time_limit else DEFAULT_DEPTH
+		self._deadline = start + time_limit if time_limit else None
+
+		self._nodes = 0
+		self._qnodes = 0
+		self._killers = [[None, None] for ply in range(MAX_PLY)]
+		self._history = [0] * (90 * 90)
+		self._pv = [[] for ply in range(MAX_PLY + 1)]
+		self._root_depth = len(game._history)
+		self._last_pv = []		# The principal variation of the last finished iteration
+		self.table.new_search()
+
+		result = SearchResult()
+		if game.get_game_state() != 'UNFINISHED':
+			return result
+
+		if self.book is not None:
+			book_moves = game.book_moves(self.book)
+			if book_moves:
+				result.best_move = book_moves[0][:2]
+				result.pv = [result.best_move]
+				result.from_book = True
+				result.elapsed = time.perf_counter() - start
+				return result
+
+		for iteration in range(1, depth + 1):
+			try:
+				score = self._negamax(iteration, -INFINITY, INFINITY, 0, iteration > 1)
+			except _OutOfTime:
+				# Take back whatever the unfinished iteration left on the board
+				while len(game._history) > self._root_depth:
+					game._pop()
+				break
+
+			result.depth = iteration
+			result.score = score
+			result.pv = [(SQUARES[a], SQUARES[b]) for a, b in self._pv[0]]
+			result.best_move = result.pv[0] if result.pv else None
+			self._last_pv = list(self._pv[0])
+
+			# No point searching deeper once a forced mate has been found
+			if abs(score) >= MATE - MAX_PLY:
+				break
+
+		result.nodes = self._nodes
+		result.qnodes = self._qnodes
+		result.table_stats = self.table.stats()
+		result.elapsed = time.perf_counter() - start
+		return result
+
+	def evaluate(self):
+		"""Returns the game's evaluation (material and piece-square bonuses)
+		from the point of view of the player whose turn it is"""
+		return self._game.evaluate()
+
+	def _negamax(self, depth, alpha, beta, ply, timed):
+		"""Returns the score of the current position searched depth plies
+		deep, from the point of view of the player to move. Scores at or below
+		alpha and at or above beta are only bounds. Fills in self._pv[ply]."""
+		self._nodes += 1
+		if timed and not self._nodes % CHECK_EVERY and self._deadline is not None:
+			if time.perf_counter() > self._deadline:
+				raise _OutOfTime()
+
+		self._pv[ply] = []
+		if depth <= 0 or ply >= MAX_PLY:
+			return self._quiesce(alpha, beta, ply, timed)
+
+		game = self._game
+		player = game._turn
+		key = game.position_key()
+
+		# A result from the table can end the search here if it was searched
+		# at least as deep, and otherwise its move gets searched first
+		entry = self.table.probe(key)
+		first_move = self._pv_move(ply)
+		if entry:
+			entry_depth, bound, score, move = entry
+			if first_move is None:
+				first_move = move
+			if ply and entry_depth >= depth:
+				score = _from_table(score, ply)
+				if bound == EXACT or (bound == LOWER and score >= beta) or (bound == UPPER and score <= alpha):
+					return score
+
+		original_alpha = alpha
+		best_score = -INFINITY
+		best_move = None
+
+		for a, b in self._ordered(list(game._pseudo_moves(player)), ply, first_move):
+			capture = game._board[b]
+			game._push(a, b)
+			if game.is_in_check(player):
+				game._pop()
+				continue
+
+			score = -self._negamax(depth - 1, -beta, -alpha, ply + 1, timed)
+			game._pop()
+
+			if score > best_score:
+				best_score = score
+				best_move = (a, b)
+			if score > alpha:
+				alpha = score
+				self._pv[ply] = [(a, b)] + self._pv[ply + 1]
+				if score >= beta:
+					if not capture:
+						self._remember_cutoff(a, b, depth, ply)
+					break
+
+		if best_move is None:
+			if game.is_in_check(player):
+				return -MATE + ply
+
+			# Not in check but nothing to move, so the only move is to pass
+			game._push(0, 0)
+			score = -self._negamax(depth - 1, -beta, -alpha, ply + 1, timed)
+			game._pop()
+			return score
+
+		if best_score >= beta:
+			bound = LOWER
+		elif best_score > original_alpha:
+			bound = EXACT
+		else:
+			bound = UPPER
+		self.table.store(key, depth, bound, _to_table(best_score, ply), best_move)
+
+		return best_score
+
+	def _quiesce(self, alpha, beta, ply, timed):
+		"""Searches only captures until the position is quiet, so the
+		evaluation isn't taken in the middle of an exchange. The player to
+		move can always stop capturing, so the evaluation is a lower bound."""
+		self._qnodes += 1
+		if timed and not self._qnodes % CHECK_EVERY and self._deadline is not None:
+			if time.perf_counter() > self._deadline:
+				raise _OutOfTime()
+
+		stand_pat = self.evaluate()
+		if stand_pat >= beta or ply >= MAX_PLY:
+			return stand_pat
+		if stand_pat > alpha:
+			alpha = stand_pat
+
+		game = self._game
+		board = game._board
+		player = game._turn
+		captures = [(a, b) for a, b in game._pseudo_moves(player) if board[b]]
+
+		for a, b in self._ordered(captures, ply, None):
+			game._push(a, b)
+			if game.is_in_check(player):
+				game._pop()
+				continue
+			score = -self._quiesce(-beta, -alpha, ply + 1, timed)
+			game._pop()
+
+			if score >= beta:
+				return score
+			if score > alpha:
+				alpha = score
+
+		return alpha
+
+	def _pv_move(self, ply):
+		"""Returns the move the previous iteration's principal variation made
+		at this ply, if the search is still following that line"""
+		previous = self._last_pv
+		if ply < len(previous) and self._pv_line_followed(ply):
+			return previous[ply]
+		return None
+
+	def _pv_line_followed(self, ply):
+		"""Returns True if the moves played from the root to this ply are the
+		first moves of the previous iteration's principal variation"""
+		history = self._game._history
+		start = self._root_depth
+		previous = self._last_pv
+		for i in range(ply):
+			a, b = history[start + i][0], history[start + i][1]
+			if previous[i] != (a, b):
+				return False
+		return True
+
+	def _ordered(self, moves, ply, pv_move):
+		"""Takes a list of (from, to) moves and returns them sorted best-first:
+		the previous principal variation's move, then captures (most valuable
+		victim first, cheapest attacker breaking ties), then this ply's killer
+		moves, then everything else by history score"""
+		board = self._game._board
+		killers = self._killers[ply]
+		history = self._history
+
+		def key(move):
+			if move == pv_move:
+				return PV_MOVE
+			a, b = move
+			victim = board[b]
+			if victim:
+				return CAPTURE + VICTIM_SCORES[victim._rank_code] - ATTACKER_COSTS[board[a]._rank_code]
+			if move == killers[0]:
+				return KILLER + 1
+			if move == killers[1]:
+				return KILLER
+			return history[a * 90 + b]
+
+		return sorted(moves, key=key, reverse=True)
+
+	def _remember_cutoff(self, a, b, depth, ply):
+		"""Records a quiet move that caused a beta cutoff as a killer for this
+		ply and bumps its history score"""
+		killers = self._killers[ply]
+		if killers[0] != (a, b):
+			killers[1] = killers[0]
+			killers[0] = (a, b)
+		index = a * 90 + b
+		self._history[index] = min(self._history[index] + depth * depth, KILLER - 1)
+
+
+def _to_table(score, ply):
+	"""Mate scores count plies from the root, but a table entry can be
+	reached at any ply, so they are stored counting from the entry instead"""
+	if score >= MATE - MAX_PLY:
+		return score + ply
+	if score <= -MATE + MAX_PLY:
+		return score - ply
+	return score
+
+
+def _from_table(score, ply):
+	"""Turns a score saved by _to_table back into one counted from the root"""
+	if score >= MATE - MAX_PLY:
+		return score - ply
+	if score <= -MATE + MAX_PLY:
+		return score + ply
+	return score
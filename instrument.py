@@ -0,0 +1,217 @@
+# Description: Opt-in counters and timers for JanggiGame's hot paths. While
+# instrumentation is enabled, the methods below are swapped on the class for
+# wrappers that count calls, count _targets calls for each rank, time check
+# and checkmate detection (a running total plus a histogram), and count the
+# moves tried on the board and the board copies made, both overall and while
+# looking for checkmate. Disabling puts the original methods back, so when
+# instrumentation is off there is nothing extra on any call.
+#
+# Usage:
+#     instrument.enable()
+#     ... play ...
+#     print(instrument.stats())
+#     instrument.reset()
+#     instrument.disable()
+
+import bisect
+import functools
+import time
+
+from JanggiGame import JanggiGame, RANKS
+
+
+# Methods whose calls are counted
+COUNTED = ('legal_move', 'find_general', '_find_general', 'is_square_attacked', 'make_move',
+	'_legal_moves', '_evasions', 'clone')
+
+# Methods whose calls are counted and timed
+TIMED = ('is_in_check', 'is_in_checkmate')
+
+# Upper edges in seconds of the timing histogram's buckets. There is one more
+# bucket after the last edge for anything slower.
+BUCKETS = (1e-6, 1e-5, 1e-4, 1e-3, 1e-2, 1e-1)
+
+
+class _Timing:
+	"""The number of calls to a timed method, their total time in seconds
+	and how many fell in each of the BUCKETS"""
+
+	def __init__(self):
+		self.count = 0
+		self.total = 0.0
+		self.histogram = [0] * (len(BUCKETS) + 1)
+
+	def add(self, seconds):
+		self.count += 1
+		self.total += seconds
+		self.histogram[bisect.bisect_left(BUCKETS, seconds)] += 1
+
+	def snapshot(self):
+		labels = ['<%gs' % edge for edge in BUCKETS] + ['>=%gs' % BUCKETS[-1]]
+		return {
+			'count': self.count,
+			'total': self.total,
+			'mean': self.total / self.count if self.count else 0.0,
+			'histogram': dict(zip(labels, self.histogram)),
+		}
+
+
+class _Stats:
+	"""Everything recorded since instrumentation was last reset"""
+
+	def __init__(self):
+		self.calls = dict.fromkeys(COUNTED + TIMED + ('_push', '_copy_state'), 0)
+		self.ranks = dict.fromkeys(RANKS, 0)
+		self.timings = {name: _Timing() for name in TIMED}
+		self.checkmate_depth = 0
+		self.checkmate_moves = 0
+		self.checkmate_copies = 0
+
+
+_stats = _Stats()
+
+# (owner, attribute name, original value) for everything swapped by enable
+_patched = []
+
+
+def _counted(name, function):
+	"""Wraps a method to count its calls"""
+	@functools.wraps(function)
+	def wrapper(*args, **kwargs):
+		_stats.calls[name] += 1
+		return function(*args, **kwargs)
+	return wrapper
+
+
+def _timed(name, function):
+	"""Wraps a method to count and time its calls"""
+	clock = time.perf_counter
+
+	@functools.wraps(function)
+	def wrapper(*args, **kwargs):
+		_stats.calls[name] += 1
+		start = clock()
+		try:
+			return function(*args, **kwargs)
+		finally:
+			_stats.timings[name].add(clock() - start)
+	return wrapper
+
+
+def _checkmate(function):
+	"""Wraps is_in_checkmate so that moves tried and boards copied while it
+	runs are counted separately"""
+	@functools.wraps(function)
+	def wrapper(*args, **kwargs):
+		_stats.checkmate_depth += 1
+		try:
+			return function(*args, **kwargs)
+		finally:
+			_stats.checkmate_depth -= 1
+	return wrapper
+
+
+def _push(function):
+	"""Wraps _push to count the moves tried on the board"""
+	@functools.wraps(function)
+	def wrapper(game, a, b):
+		_stats.calls['_push'] += 1
+		if _stats.checkmate_depth:
+			_stats.checkmate_moves += 1
+		return function(game, a, b)
+	return wrapper
+
+
+def _copy_state(function):
+	"""Wraps _copy_state to count board copies (new games and clones)"""
+	@functools.wraps(function)
+	def wrapper(game, other):
+		_stats.calls['_copy_state'] += 1
+		if _stats.checkmate_depth:
+			_stats.checkmate_copies += 1
+		return function(game, other)
+	return wrapper
+
+
+def _rank_targets(rank, function):
+	"""Wraps one rank's _targets function to count its calls"""
+	def wrapper(game, piece, a):
+		_stats.ranks[rank] += 1
+		return function(game, piece, a)
+	return wrapper
+
+
+def _subclasses(game_class):
+	"""Returns the class and every class that inherits from it"""
+	classes = [game_class]
+	for subclass in game_class.__subclasses__():
+		classes.extend(_subclasses(subclass))
+	return classes
+
+
+def _patch(owner, name, value):
+	"""Sets an attribute on a class, remembering what to put back. None is
+	remembered if the class only inherited the attribute."""
+	_patched.append((owner, name, owner.__dict__.get(name)))
+	setattr(owner, name, value)
+
+
+def enable(game_class=JanggiGame):
+	"""Turns instrumentation on for the class (JanggiGame by default) and
+	every class that inherits from it. Does nothing if it is already on."""
+	if _patched:
+		return
+
+	for name in COUNTED:
+		_patch(game_class, name, _counted(name, getattr(game_class, name)))
+	for name in TIMED:
+		_patch(game_class, name, _timed(name, getattr(game_class, name)))
+	_patch(game_class, 'is_in_checkmate', _checkmate(game_class.is_in_checkmate))
+
+	for owner in _subclasses(game_class):
+		if '_push' in owner.__dict__:
+			_patch(owner, '_push', _push(owner._push))
+		if '_copy_state' in owner.__dict__:
+			_patch(owner, '_copy_state', _copy_state(owner._copy_state))
+		wrapped = tuple(_rank_targets(rank, function) for rank, function in zip(RANKS, owner._rank_targets))
+		_patch(owner, '_rank_targets', wrapped)
+
+
+def disable():
+	"""Turns instrumentation off, putting back every original method. The
+	stats recorded so far are kept until reset is called."""
+	while _patched:
+		owner, name, original = _patched.pop()
+		if original is None:
+			delattr(owner, name)
+		else:
+			setattr(owner, name, original)
+
+
+def is_enabled():
+	"""Returns True if instrumentation is on"""
+	return bool(_patched)
+
+
+def reset():
+	"""Throws away everything recorded so far"""
+	global _stats
+	depth = _stats.checkmate_depth
+	_stats = _Stats()
+	_stats.checkmate_depth = depth
+
+
+def stats():
+	"""Returns a snapshot of everything recorded since the last reset: call
+	counts for each method, _targets calls for each rank, timings for check
+	and checkmate detection, and the moves tried and board copies made, in
+	total and while looking for checkmate"""
+	return {
+		'calls': dict(_stats.calls),
+		'ranks': dict(_stats.ranks),
+		'timings': {name: timing.snapshot() for name, timing in _stats.timings.items()},
+		'simulated_moves': _stats.calls['_push'],
+		'checkmate_simulated_moves': _stats.checkmate_moves,
+		'board_copies': _stats.calls['_copy_state'],
+		'checkmate_board_copies': _stats.checkmate_copies,
+	}
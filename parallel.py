@@ -0,0 +1,251 @@
+# Description: Runs deep analysis of a JanggiGame on several processes at once.
+# Threads can't run Python code side by side, so the work is split into
+# independent subtrees and handed to a ProcessPoolExecutor: root moves for a
+# search, and root moves (or the moves after them, when there are too few
+# root moves to keep every worker busy) for perft. Each task is sent as the
+# 46 byte JanggiGame.to_bytes encoding of the position it starts from, and
+# the answers and node counts are merged when they come back.
+#
+# The root search gives up the alpha-beta bounds one root move would pass to
+# the next, so it visits more nodes than a search on one process does. The
+# scaling report shows how much of the extra processes' time that costs.
+#
+# Usage: python parallel.py perft|search [--depth N] [--workers 1,2,4]
+#                                        [--position NAME] [--bitboard]
+
+import argparse
+import concurrent.futures
+import os
+import sys
+import time
+
+import perft
+from engine import Engine, MATE, MAX_PLY, SearchResult, TranspositionTable
+from JanggiGame import JanggiGame, SQUARE_INDEX, SQUARES
+
+
+# How many tasks each process should get before perft splits the tree a
+# second ply down
+TASKS_PER_PROCESS = 4
+
+# Size of the transposition table each search process keeps between tasks
+WORKER_TABLE_MB = 16
+
+# The transposition table of this process, when it is a search worker
+_table = None
+
+
+def _perft_task(game_class, data, depth):
+	"""Counts perft from an encoded position. Runs in a worker process."""
+	return perft.perft(game_class.from_bytes(data), depth)
+
+
+def _search_task(game_class, data, depth):
+	"""Searches an encoded position and returns (score, pv as square number
+	pairs, nodes, qnodes). Runs in a worker process, which keeps one
+	transposition table for every task it is given."""
+	global _table
+	if _table is None:
+		_table = TranspositionTable(WORKER_TABLE_MB)
+
+	engine = Engine(game_class.from_bytes(data), _table)
+	result = engine.search(depth)
+	pv = [(SQUARE_INDEX[a], SQUARE_INDEX[b]) for a, b in result.pv]
+	return result.score, pv, result.nodes, result.qnodes
+
+
+def _children(game):
+	"""Returns (move, to_bytes of the position after it) for every legal
+	move of the player to move, as square number pairs"""
+	children = []
+	for a, b in list(game._legal_moves(game._turn)):
+		game._push(a, b)
+		children.append(((a, b), game.to_bytes()))
+		game._pop()
+	return children
+
+
+def _executor(processes, executor):
+	"""Returns (executor, whether it should be shut down afterward)"""
+	if executor is not None:
+		return executor, False
+	return concurrent.futures.ProcessPoolExecutor(processes), True
+
+
+def parallel_divide(game, depth, processes=None, executor=None):
+	"""Takes a JanggiGame and a depth and returns what perft.divide would:
+	a dictionary mapping each legal (from, to) move to the perft count below
+	it. The counting is spread over a pool of processes (os.cpu_count() by
+	default), or over an executor that is passed in. The game is left the
+	way it was found."""
+	processes = processes or os.cpu_count() or 1
+	if depth < 1:
+		return {}
+
+	# Each task is (root move, encoded position, depth left to count)
+	children = _children(game)
+	tasks = [(move, data, depth - 1) for move, data in children]
+	if depth >= 3 and len(tasks) < processes * TASKS_PER_PROCESS:
+		tasks = []
+		for move, data in children:
+			game._push(*move)
+			tasks.extend((move, child, depth - 2) for reply, child in _children(game))
+			game._pop()
+
+	counts = {(SQUARES[a], SQUARES[b]): 0 for (a, b), data in children}
+	pool, owned = _executor(processes, executor)
+	try:
+		futures = {pool.submit(_perft_task, type(game), data, left): move for move, data, left in tasks}
+		for future in concurrent.futures.as_completed(futures):
+			a, b = futures[future]
+			counts[SQUARES[a], SQUARES[b]] += future.result()
+	finally:
+		if owned:
+			pool.shutdown()
+	return counts
+
+
+def parallel_perft(game, depth, processes=None, executor=None):
+	"""Like perft.perft, but spread over a pool of processes (see
+	parallel_divide)"""
+	if depth == 0:
+		return 1
+	return sum(parallel_divide(game, depth, processes, executor).values())
+
+
+def parallel_search(game, depth, processes=None, executor=None):
+	"""Takes a JanggiGame and a depth, searches every legal root move to
+	depth - 1 plies in a pool of processes (os.cpu_count() by default, or an
+	executor that is passed in) and returns an engine.SearchResult for the
+	best one, with the node counts of all of the searches added up. Searches
+	of depth 1 or less are done in this process. The game is left the way it
+	was found."""
+	processes = processes or os.cpu_count() or 1
+	if depth <= 1 or game.get_game_state() != 'UNFINISHED':
+		return Engine(game).search(depth)
+
+	start = time.perf_counter()
+	result = SearchResult()
+	result.depth = depth
+	result.nodes = 1
+	children = _children(game)
+	if not children:
+		return Engine(game).search(depth)
+
+	best_score = None
+	pool, owned = _executor(processes, executor)
+	try:
+		futures = {pool.submit(_search_task, type(game), data, depth - 1): move for move, data in children}
+		for future in concurrent.futures.as_completed(futures):
+			move = futures[future]
+			score, pv, nodes, qnodes = future.result()
+			result.nodes += nodes
+			result.qnodes += qnodes
+
+			# The child's score is from the opponent's point of view, and a
+			# mate it sees is one ply further away from the root
+			score = -score
+			if score >= MATE - MAX_PLY:
+				score -= 1
+			elif score <= -(MATE - MAX_PLY):
+				score += 1
+
+			# Break ties by move, so the answer doesn't depend on which
+			# search happens to finish first
+			if best_score is None or score > best_score or (score == best_score and move < best_move):
+				best_score = score
+				best_move = move
+				best_pv = [move] + pv
+	finally:
+		if owned:
+			pool.shutdown()
+
+	result.score = best_score
+	result.pv = [(SQUARES[a], SQUARES[b]) for a, b in best_pv]
+	result.best_move = result.pv[0]
+	result.elapsed = time.perf_counter() - start
+	return result
+
+
+def scaling(game, depth, worker_counts, kind='perft'):
+	"""Takes a JanggiGame, a depth, a list of process counts and 'perft' or
+	'search'. Runs the work once in this process and then once in a pool of
+	each size, and returns a list of dictionaries (the single process run
+	first, with 0 workers) holding the workers, seconds, nodes, nodes per
+	second, speedup over the single process run and efficiency (speedup
+	per worker)."""
+	rows = []
+
+	def record(workers, seconds, nodes):
+		speedup = rows[0]['seconds'] / seconds if rows else 1.0
+		rows.append({
+			'workers': workers,
+			'seconds': seconds,
+			'nodes': nodes,
+			'nodes_per_second': nodes / seconds if seconds else 0.0,
+			'speedup': speedup,
+			'efficiency': speedup / workers if workers else 1.0,
+		})
+
+	start = time.perf_counter()
+	if kind == 'perft':
+		nodes = perft.perft(game, depth)
+	else:
+		result = Engine(game).search(depth)
+		nodes = result.nodes + result.qnodes
+	record(0, time.perf_counter() - start, nodes)
+
+	for workers in worker_counts:
+		# Start the processes before the clock so their start-up isn't counted
+		with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+			list(pool.map(abs, range(workers)))
+			start = time.perf_counter()
+			if kind == 'perft':
+				nodes = parallel_perft(game, depth, workers, pool)
+			else:
+				result = parallel_search(game, depth, workers, pool)
+				nodes = result.nodes + result.qnodes
+			record(workers, time.perf_counter() - start, nodes)
+
+	return rows
+
+
+def format_scaling(rows):
+	"""Returns the rows from scaling as a table of text"""
+	lines = ['workers   seconds        nodes     nodes/s  speedup  efficiency']
+	for row in rows:
+		lines.append('%7s %9.3f %12d %11.0f %8.2f %10.0f%%' % (
+			row['workers'] or 'serial', row['seconds'], row['nodes'], row['nodes_per_second'],
+			row['speedup'], row['efficiency'] * 100))
+	return '\n'.join(lines)
+
+
+def main(argv=None):
+	"""Command line entry point for the scaling report"""
+	parser = argparse.ArgumentParser(description='Report how perft or search scales over processes.')
+	parser.add_argument('kind', choices=('perft', 'search'), help='what to run')
+	parser.add_argument('--depth', type=int, default=4, help='depth to count or search to')
+	parser.add_argument('--workers', default=None, help='comma separated process counts (default 1, 2, 4, ... up to the CPU count)')
+	parser.add_argument('--position', default='start', choices=sorted(perft.POSITIONS), help='stored position to start from')
+	parser.add_argument('--bitboard', action='store_true', help='use the bitboard backend')
+	args = parser.parse_args(argv)
+
+	if args.workers:
+		worker_counts = [int(count) for count in args.workers.split(',')]
+	else:
+		worker_counts = [1]
+		while worker_counts[-1] * 2 <= (os.cpu_count() or 1):
+			worker_counts.append(worker_counts[-1] * 2)
+
+	game_class = JanggiGame
+	if args.bitboard:
+		from bitboard import BitboardGame
+		game_class = BitboardGame
+
+	game = perft.load_position(args.position, game_class)
+	print(format_scaling(scaling(game, args.depth, worker_counts, args.kind)))
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -0,0 +1,237 @@
+# Description: Perft ("performance test") for JanggiGame. Counts every
+# sequence of legal moves to a fixed depth from a set of stored positions and
+# compares the totals with known answers. A wrong count means move generation
+# or check detection is broken; the nodes per second tell us how fast it is.
+#
+# Usage: python perft.py [depth] [--position NAME] [--profile] [--bitboard]
+
+import argparse
+import sys
+import time
+
+from JanggiGame import JanggiGame, Piece, SQUARES
+
+
+# Positions to count from. Each one is either a list of moves played from the
+# starting layout or a list of pieces on an otherwise empty board, along with
+# the expected leaf counts for depths 1, 2, 3, ...
+POSITIONS = {
+	'start': {
+		'moves': [],
+		'counts': [31, 965, 31001, 996558],
+	},
+
+	# Both sides have traded pieces and blue's cannons have crossed the river
+	'midgame': {
+		'moves': [
+			('d10', 'e10'), ('i4', 'i5'), ('b10', 'd7'), ('g4', 'h4'), ('a7', 'b7'),
+			('c1', 'd3'), ('a10', 'a4'), ('d1', 'e1'), ('h8', 'h3'), ('a1', 'a4'),
+			('h3', 'b3'), ('a4', 'a3'), ('b8', 'b4'), ('i5', 'i6'), ('b3', 'h3'),
+			('e2', 'd2'), ('b4', 'h4'), ('i6', 'i7'), ('h3', 'a3'), ('e4', 'f4'),
+			('h4', 'c4'), ('g1', 'i4'), ('c4', 'c9'), ('i4', 'g7'),
+		],
+		'counts': [37, 1166, 42475, 1354134],
+	},
+
+	# Blue is in check from the red cannon jumping the soldier on e7
+	'endgame': {
+		'pieces': {
+			'e9': ('blue', 'general'), 'f10': ('blue', 'guard'), 'a5': ('blue', 'chariot'),
+			'e7': ('blue', 'soldier'), 'h8': ('blue', 'cannon'),
+			'e1': ('red', 'general'), 'd1': ('red', 'guard'), 'e5': ('red', 'cannon'),
+			'g8': ('red', 'horse'), 'd8': ('red', 'soldier'), 'c3': ('red', 'elephant'),
+		},
+		'turn': 'blue',
+		'counts': [4, 78, 1723, 34511],
+	},
+}
+
+
+def load_position(name, game_class=JanggiGame):
+	"""Takes the name of one of the stored POSITIONS and returns a new
+	JanggiGame set up in that position. A JanggiGame subclass (like the
+	BitboardGame backend) can be given to use instead."""
+	position = POSITIONS[name]
+
+	if 'pieces' in position:
+		pieces = {square: Piece(player, rank) for square, (player, rank) in position['pieces'].items()}
+		game = game_class.from_position(pieces, position['turn'])
+	else:
+		game = game_class()
+
+	for a, b in position.get('moves', []):
+		if not game.make_move(a, b):
+			raise ValueError('illegal move %s-%s in position %s' % (a, b, name))
+
+	return game
+
+
+def perft(game, depth):
+	"""Takes a JanggiGame and a depth and returns the number of move
+	sequences that many moves long that can be played from the current
+	position, moving for whoever's turn it is. Passing is not counted as a
+	move. The game is left the way it was found."""
+	if depth == 0:
+		return 1
+
+	moves = list(game._legal_moves(game._turn))
+	if depth == 1:
+		return len(moves)
+
+	nodes = 0
+	for a, b in moves:
+		game._push(a, b)
+		nodes += perft(game, depth - 1)
+		game._pop()
+
+	return nodes
+
+
+def divide(game, depth):
+	"""Takes a JanggiGame and a depth and returns a dictionary mapping each
+	legal (from, to) move to the perft count below it. Handy for finding
+	which move a wrong total comes from."""
+	counts = {}
+	for a, b in list(game._legal_moves(game._turn)):
+		game._push(a, b)
+		counts[SQUARES[a], SQUARES[b]] = perft(game, depth - 1)
+		game._pop()
+	return counts
+
+
+def profile_perft(game, depth):
+	"""Like perft, but times each part of the work separately, following the
+	same path as JanggiGame._legal_moves. Returns a dictionary with the node
+	count and the seconds spent generating moves, detecting check (whether
+	the player to move is in check, and trying the moves the pin shortcut
+	can't vouch for), finding pins, finding evasions when in check, and
+	making/taking back moves. Reading the clock this often slows things
+	down, so the times add up to more than a plain perft would take."""
+	clock = time.perf_counter
+	times = {'nodes': 0, 'movegen': 0.0, 'check': 0.0, 'pins': 0.0, 'evasions': 0.0, 'make': 0.0}
+
+	def legal_moves(player):
+		start = clock()
+		in_check = game.is_in_check(player)
+		times['check'] += clock() - start
+
+		if in_check:
+			start = clock()
+			moves = list(game._evasions(player))
+			times['evasions'] += clock() - start
+			return moves
+
+		start = clock()
+		general = game._find_general(player)
+		pinned, cannon_lines = game._pins(player)
+		times['pins'] += clock() - start
+
+		start = clock()
+		pseudo_moves = list(game._pseudo_moves(player))
+		times['movegen'] += clock() - start
+
+		moves = []
+		for a, b in pseudo_moves:
+			if a == general or a in pinned or b in cannon_lines:
+				start = clock()
+				game._push(a, b)
+				times['make'] += clock() - start
+
+				start = clock()
+				in_check = game.is_in_check(player)
+				times['check'] += clock() - start
+
+				start = clock()
+				game._pop()
+				times['make'] += clock() - start
+
+				if in_check:
+					continue
+
+			moves.append((a, b))
+		return moves
+
+	def search(depth):
+		moves = legal_moves(game._turn)
+		if depth == 1:
+			times['nodes'] += len(moves)
+			return
+
+		for a, b in moves:
+			start = clock()
+			game._push(a, b)
+			times['make'] += clock() - start
+
+			search(depth - 1)
+
+			start = clock()
+			game._pop()
+			times['make'] += clock() - start
+
+	if depth == 0:
+		times['nodes'] = 1
+	else:
+		search(depth)
+
+	return times
+
+
+def run(names, depth, profile=False, game_class=JanggiGame, out=sys.stdout):
+	"""Takes a list of position names and a maximum depth, counts each
+	position at every depth up to the maximum and prints the results.
+	Returns True if every count that has a known answer matched it."""
+	all_passed = True
+
+	for name in names:
+		expected = POSITIONS[name]['counts']
+		out.write('%s\n' % name)
+
+		for d in range(1, depth + 1):
+			game = load_position(name, game_class)
+			start = time.perf_counter()
+			if profile:
+				times = profile_perft(game, d)
+				nodes = times['nodes']
+			else:
+				nodes = perft(game, d)
+			elapsed = time.perf_counter() - start
+
+			if d <= len(expected):
+				passed = nodes == expected[d - 1]
+				all_passed = all_passed and passed
+				result = 'ok' if passed else 'MISMATCH (expected %d)' % expected[d - 1]
+			else:
+				result = 'no stored count'
+
+			nps = nodes / elapsed if elapsed else 0.0
+			out.write('  depth %d: %10d nodes %8.3fs %10.0f nodes/s  %s\n' % (d, nodes, elapsed, nps, result))
+			if profile:
+				out.write('           movegen %.3fs  check %.3fs  pins %.3fs  evasions %.3fs  make %.3fs\n'
+					% (times['movegen'], times['check'], times['pins'], times['evasions'], times['make']))
+
+	return all_passed
+
+
+def main(argv=None):
+	"""Command line entry point. Returns an exit code of 0 if every count
+	matched and 1 otherwise."""
+	parser = argparse.ArgumentParser(description='Count legal move sequences from stored Janggi positions.')
+	parser.add_argument('depth', type=int, nargs='?', default=3, help='deepest depth to count (default 3)')
+	parser.add_argument('--position', choices=sorted(POSITIONS), action='append',
+		help='position to count from (can be repeated, default is all of them)')
+	parser.add_argument('--profile', action='store_true',
+		help='break the time down into move generation, check detection and making moves')
+	parser.add_argument('--bitboard', action='store_true', help='use the bitboard backend')
+	args = parser.parse_args(argv)
+
+	game_class = JanggiGame
+	if args.bitboard:
+		from bitboard import BitboardGame
+		game_class = BitboardGame
+
+	passed = run(args.position or list(POSITIONS), args.depth, args.profile, game_class)
+	return 0 if passed else 1
+
+
+if __name__ == '__main__':
+	sys.exit(main())
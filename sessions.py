@@ -0,0 +1,213 @@
+# Description: An asyncio host for many JanggiGames being played at once.
+# Moves for the same game are made one at a time (each game has its own lock),
+# while moves for different games can overlap. Working out whether a move gave
+# checkmate is the slow part of a move, so it is handed to an executor instead
+# of running on the event loop. Games nobody has moved in for a while are
+# packed down to JanggiGame.to_bytes and unpacked again on their next move.
+# Every move's latency (including any wait for the game's lock) is recorded
+# for each game and for the host as a whole.
+
+import asyncio
+import collections
+import itertools
+import time
+
+from JanggiGame import JanggiGame
+
+
+# How many of the most recent move latencies are kept for percentiles
+LATENCY_SAMPLES = 1000
+
+# Seconds a game can go without a move before evict_idle packs it away
+DEFAULT_IDLE_TIMEOUT = 300.0
+
+
+def _checkmate_state(game_class, data):
+	"""Takes a JanggiGame class and a position from its to_bytes and returns
+	the game state it has once checkmate of the player to move has been
+	looked for. A plain function of a class and bytes, so it can run in a
+	thread or a process pool."""
+	game = game_class.from_bytes(data)
+	game.is_in_checkmate(game._turn)
+	return game.get_game_state()
+
+
+class LatencyStats:
+	"""Keeps the count, total and worst of a stream of latencies in seconds,
+	along with the most recent ones for working out percentiles"""
+
+	def __init__(self, samples=LATENCY_SAMPLES):
+		self.count = 0
+		self.total = 0.0
+		self.worst = 0.0
+		self._recent = collections.deque(maxlen=samples)
+
+	def add(self, seconds):
+		"""Records one latency"""
+		self.count += 1
+		self.total += seconds
+		self.worst = max(self.worst, seconds)
+		self._recent.append(seconds)
+
+	def percentile(self, fraction):
+		"""Takes a fraction like 0.99 and returns that percentile of the
+		recent latencies, or 0.0 if there aren't any"""
+		if not self._recent:
+			return 0.0
+		ordered = sorted(self._recent)
+		return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+	def snapshot(self):
+		"""Returns a dictionary of the count and the mean, median, 99th
+		percentile and worst latencies"""
+		return {
+			'count': self.count,
+			'mean': self.total / self.count if self.count else 0.0,
+			'p50': self.percentile(0.5),
+			'p99': self.percentile(0.99),
+			'max': self.worst,
+		}
+
+
+class _Session:
+	"""One hosted game. Exactly one of game and data is set: the game while
+	it is in memory, or its to_bytes encoding while it is evicted."""
+
+	__slots__ = ('game', 'data', 'lock', 'last_used', 'latency')
+
+	def __init__(self, game, now):
+		self.game = game
+		self.data = None
+		self.lock = asyncio.Lock()
+		self.last_used = now
+		self.latency = LatencyStats()
+
+
+class SessionHost:
+	"""Owns many games, each known by an id. All of the methods that touch a
+	game must be called from the event loop the host is used on."""
+
+	def __init__(self, executor=None, idle_timeout=DEFAULT_IDLE_TIMEOUT, game_class=JanggiGame,
+			clock=time.monotonic):
+		"""Takes the executor to look for checkmate in (None means the event
+		loop's default thread pool; a process pool works too), how many
+		seconds a game can sit idle before it may be evicted, the JanggiGame
+		class to play with and a clock to measure idleness by"""
+		self._executor = executor
+		self._idle_timeout = idle_timeout
+		self._game_class = game_class
+		self._clock = clock
+		self._sessions = {}
+		self._ids = itertools.count(1)
+		self._latency = LatencyStats()
+		self._evictions = 0
+		self._restores = 0
+
+	def __len__(self):
+		return len(self._sessions)
+
+	def __contains__(self, game_id):
+		return game_id in self._sessions
+
+	def create_game(self, game_id=None, position=None):
+		"""Starts hosting a new game and returns its id. An id can be given,
+		otherwise the next number is used. A position (anything
+		JanggiGame.from_position takes) can be given to start from instead
+		of the starting layout."""
+		if game_id is None:
+			game_id = next(self._ids)
+			while game_id in self._sessions:
+				game_id = next(self._ids)
+		elif game_id in self._sessions:
+			raise ValueError('game %r already exists' % (game_id,))
+
+		if position is None:
+			game = self._game_class()
+		else:
+			game = self._game_class.from_position(position)
+		self._sessions[game_id] = _Session(game, self._clock())
+		return game_id
+
+	def close_game(self, game_id):
+		"""Stops hosting a game. Raises KeyError for an unknown id."""
+		del self._sessions[game_id]
+
+	def _resident(self, session):
+		"""Returns the session's game, unpacking it first if it was evicted"""
+		if session.game is None:
+			session.game = self._game_class.from_bytes(session.data)
+			session.data = None
+			self._restores += 1
+		return session.game
+
+	async def make_move(self, game_id, a, b):
+		"""Makes a move in a hosted game like JanggiGame.make_move, waiting
+		for any move already being made in the same game to finish first.
+		If the move gives check, the search for checkmate runs in the
+		executor. Returns True if the move was made, False otherwise. Raises
+		KeyError for an unknown id."""
+		start = time.perf_counter()
+		session = self._sessions[game_id]
+
+		async with session.lock:
+			game = self._resident(session)
+			moved = game.make_move(a, b, detect_checkmate=False)
+			if moved and a != b and game.is_in_check(game._turn):
+				loop = asyncio.get_running_loop()
+				game._game_state = await loop.run_in_executor(self._executor, _checkmate_state, self._game_class,
+					game.to_bytes())
+			session.last_used = self._clock()
+
+		elapsed = time.perf_counter() - start
+		session.latency.add(elapsed)
+		self._latency.add(elapsed)
+		return moved
+
+	async def get_state(self, game_id):
+		"""Returns a dictionary with a hosted game's state, whose turn it is
+		and its position as to_fen, once any move being made has finished"""
+		session = self._sessions[game_id]
+		async with session.lock:
+			game = self._resident(session)
+			return {'state': game.get_game_state(), 'turn': game._turn, 'fen': game.to_fen()}
+
+	def evict_idle(self):
+		"""Packs every game that has gone idle_timeout seconds without a move
+		(and isn't in the middle of one) down to bytes. Evicted games are
+		unpacked on their next move, but can no longer take back moves made
+		before they were evicted. Returns how many games were evicted."""
+		cutoff = self._clock() - self._idle_timeout
+		evicted = 0
+		for session in self._sessions.values():
+			if session.game is not None and session.last_used <= cutoff and not session.lock.locked():
+				session.data = session.game.to_bytes()
+				session.game = None
+				evicted += 1
+		self._evictions += evicted
+		return evicted
+
+	async def run_evictor(self, interval=60.0):
+		"""Calls evict_idle every interval seconds until cancelled. Meant to
+		be started as a task next to the games."""
+		while True:
+			await asyncio.sleep(interval)
+			self.evict_idle()
+
+	def latency(self, game_id):
+		"""Returns LatencyStats.snapshot for one game's moves"""
+		return self._sessions[game_id].latency.snapshot()
+
+	def stats(self):
+		"""Returns a dictionary describing the host: how many games there
+		are, how many are in memory and how many are evicted, how many
+		evictions and restores there have been, and the latency snapshot for
+		every move made on the host"""
+		resident = sum(1 for session in self._sessions.values() if session.game is not None)
+		return {
+			'games': len(self._sessions),
+			'resident': resident,
+			'evicted': len(self._sessions) - resident,
+			'evictions': self._evictions,
+			'restores': self._restores,
+			'latency': self._latency.snapshot(),
+		}
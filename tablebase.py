@@ -0,0 +1,520 @@
+# Description: Endgame tablebases for JanggiGame, built by retrograde analysis.
+# A table covers one material signature, such as 'KAA-kr' (blue's general and
+# two guards against red's general and chariot; blue's letters are upper case
+# and red's lower case, as in FEN_LETTERS). It has an entry for every
+# placement of those pieces with either player to move. Generals and guards
+# only go in their own palace, elephants and soldiers only on squares they
+# could ever reach, and two identical pieces only in one order.
+#
+# Building a table takes two passes:
+#
+# 1. Forward: for every position, find out whether it can happen at all (the
+#    player who just moved can't be in check), whether the player to move is
+#    checkmated, and which positions each legal move leads to. Captures lead
+#    to a smaller signature, whose table is built first and simply looked up.
+#    This pass is split into chunks and run in a process pool.
+# 2. Backward: starting from the checkmates, walk the moves in reverse one ply
+#    at a time. A position with a move into a loss is a win, and a position
+#    whose moves all lead into wins is a loss. Whatever is never reached is a
+#    draw (passing means nobody can be forced to move, so a draw is a draw).
+#
+# The table is written as a header followed by one byte per position: the
+# number of plies to checkmate with perfect play (even for a loss for the
+# player to move, odd for a win), DRAW, or INVALID for placements that can't
+# happen. Tablebase memory-maps the file, so probing reads a single byte.
+#
+# Usage: python tablebase.py build DIRECTORY SIGNATURE... [--processes N]
+#        python tablebase.py probe DIRECTORY FEN
+
+import argparse
+import concurrent.futures
+import itertools
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from JanggiGame import (
+	ELEPHANT_PATHS, FEN_LETTERS, FEN_RANKS, JanggiGame, PALACE_STEPS, PLAYERS, Piece, RANKS, SETUPS,
+	SOLDIER_STEPS, SQUARE_INDEX, start_layout,
+)
+
+
+MAGIC = b'JGTB1\n\0\0'
+HEADER = struct.Struct('<8s16sQ')
+
+# Values below DRAW are distances to checkmate in plies
+DRAW = 254
+INVALID = 255
+MAX_DISTANCE = DRAW - 1
+
+# How many chunks each process gets in the forward pass, so a slow chunk
+# doesn't leave the other processes waiting
+CHUNKS_PER_PROCESS = 8
+
+EXTENSION = '.jtb'
+
+
+def parse_signature(text):
+	"""Takes a signature like 'KAA-kr' (the letters in each half can be in
+	any order) and returns its pieces as a list, blue's first and each
+	player's in RANKS order. Raises ValueError unless each player has
+	exactly one general."""
+	halves = text.split('-')
+	if len(halves) != 2:
+		raise ValueError('expected blue and red pieces separated by "-": %r' % text)
+
+	pieces = []
+	for player, half in zip(PLAYERS, halves):
+		ranks = []
+		for letter in half:
+			rank = FEN_RANKS.get(letter.lower())
+			if rank is None:
+				raise ValueError('unknown piece %r in %r' % (letter, text))
+			ranks.append(rank)
+		if ranks.count('general') != 1:
+			raise ValueError('each player needs exactly one general: %r' % text)
+		pieces.extend(Piece(player, rank) for rank in sorted(ranks, key=RANKS.index))
+	return pieces
+
+
+def signature_of(pieces):
+	"""Takes pieces (in any order) and returns their signature, such as
+	'KAA-kr'"""
+	halves = {player: [] for player in PLAYERS}
+	for piece in sorted(pieces, key=lambda piece: (piece._player_code, piece._rank_code)):
+		halves[piece._player].append(FEN_LETTERS[piece._rank])
+	return '%s-%s' % (''.join(halves['blue']).upper(), ''.join(halves['red']))
+
+
+def game_signature(game):
+	"""Returns the signature of the pieces on a game's board"""
+	ranks = game._ranks
+	return signature_of(Piece(player, rank) for player in PLAYERS for rank in RANKS
+		for square in ranks[player][rank])
+
+
+def sub_signatures(signature):
+	"""Returns the signatures that a capture can turn a signature into"""
+	pieces = parse_signature(signature)
+	return sorted(set(signature_of(pieces[:slot] + pieces[slot + 1:])
+		for slot, piece in enumerate(pieces) if piece._rank != 'general'))
+
+
+def _reachable(starts, steps):
+	"""Takes some squares and a table of the squares a piece can step to
+	from each square, and returns every square it can get to from them"""
+	seen = set(starts)
+	frontier = list(starts)
+	while frontier:
+		for target in steps[frontier.pop()]:
+			if target not in seen:
+				seen.add(target)
+				frontier.append(target)
+	return seen
+
+
+def allowed_squares(piece):
+	"""Returns a sorted tuple of the squares a piece could ever stand on"""
+	rank = piece._rank
+	if rank in ('general', 'guard'):
+		return tuple(sorted(PALACE_STEPS[piece._player]))
+	if rank not in ('elephant', 'soldier'):
+		return tuple(range(90))
+
+	starts = set(SQUARE_INDEX[square] for setup in SETUPS
+		for square, other in start_layout(setup, setup).items() if other is piece)
+	if rank == 'elephant':
+		steps = [tuple(target for leg, target in paths) for paths in ELEPHANT_PATHS]
+	else:
+		steps = SOLDIER_STEPS[piece._player]
+	return tuple(sorted(_reachable(starts, steps)))
+
+
+class Layout:
+	"""How the positions of one signature are numbered. Each piece is a
+	digit counting through its allowed squares, and the lowest bit is the
+	player to move (0 for blue, 1 for red)."""
+
+	def __init__(self, signature):
+		self.pieces = parse_signature(signature)
+		self.signature = signature_of(self.pieces)
+		self.squares = [allowed_squares(piece) for piece in self.pieces]
+		self.digits = [{square: digit for digit, square in enumerate(squares)} for squares in self.squares]
+
+		# (start, stop) slots of each run of identical pieces. Their squares
+		# are kept in increasing order, so each placement has one index.
+		self.groups = []
+		start = 0
+		for slot in range(1, len(self.pieces) + 1):
+			if slot == len(self.pieces) or self.pieces[slot] is not self.pieces[start]:
+				self.groups.append((start, slot))
+				start = slot
+
+		self.size = 2
+		for squares in self.squares:
+			self.size *= len(squares)
+
+	def encode(self, squares, turn_code):
+		"""Takes the square of each piece (in slot order, identical pieces
+		in increasing order) and the player to move's code, and returns the
+		position's index"""
+		index = 0
+		for slot in range(len(squares) - 1, -1, -1):
+			index = index * len(self.squares[slot]) + self.digits[slot][squares[slot]]
+		return index * 2 + turn_code
+
+	def decode(self, index):
+		"""Takes an index and returns (squares, turn code)"""
+		turn_code = index & 1
+		index >>= 1
+		squares = []
+		for slot_squares in self.squares:
+			index, digit = divmod(index, len(slot_squares))
+			squares.append(slot_squares[digit])
+		return squares, turn_code
+
+	def canonical(self, squares):
+		"""Sorts the squares of each run of identical pieces in place"""
+		for start, stop in self.groups:
+			if stop - start > 1:
+				squares[start:stop] = sorted(squares[start:stop])
+
+	def is_canonical(self, squares):
+		"""Returns True if no two pieces share a square and identical pieces
+		are in increasing order"""
+		if len(set(squares)) != len(squares):
+			return False
+		for start, stop in self.groups:
+			for slot in range(start + 1, stop):
+				if squares[slot - 1] > squares[slot]:
+					return False
+		return True
+
+	def index_of(self, game):
+		"""Returns the index of a game's position, or None if one of its
+		pieces is on a square this layout leaves out. The game's signature
+		must be this layout's."""
+		squares = []
+		ranks = game._ranks
+		for start, stop in self.groups:
+			piece = self.pieces[start]
+			squares.extend(sorted(ranks[piece._player][piece._rank]))
+		for slot, square in enumerate(squares):
+			if square not in self.digits[slot]:
+				return None
+		return self.encode(squares, PLAYERS.index(game._turn))
+
+
+def describe(value):
+	"""Takes a table byte and returns (result, plies) from the point of view
+	of the player to move, where result is 'WIN', 'LOSS' or 'DRAW' and plies
+	is the distance to checkmate (None for a draw). Returns None for INVALID."""
+	if value == INVALID:
+		return None
+	if value == DRAW:
+		return 'DRAW', None
+	return ('LOSS' if value % 2 == 0 else 'WIN'), value
+
+
+class Tablebase:
+	"""One table file, memory-mapped for reading"""
+
+	def __init__(self, path):
+		"""Takes the path of a file written by build"""
+		with open(path, 'rb') as f:
+			self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+		magic, signature, size = HEADER.unpack_from(self._map) if len(self._map) >= HEADER.size else (None, b'', 0)
+		if magic != MAGIC or len(self._map) != HEADER.size + size:
+			self._map.close()
+			raise ValueError('%s is not a tablebase' % path)
+		self.layout = Layout(signature.rstrip(b'\0').decode('ascii'))
+		if self.layout.size != size:
+			self._map.close()
+			raise ValueError('%s has the wrong size for %s' % (path, self.layout.signature))
+
+	def __len__(self):
+		return self.layout.size
+
+	def close(self):
+		"""Unmaps the file"""
+		self._map.close()
+
+	def value(self, index):
+		"""Returns the table byte for a position index"""
+		return self._map[HEADER.size + index]
+
+
+class Tablebases:
+	"""The tables in a directory, opened as they are first needed"""
+
+	def __init__(self, directory):
+		self.directory = directory
+		self._tables = {}
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+	def close(self):
+		"""Unmaps every table that has been opened"""
+		for table in self._tables.values():
+			if table is not None:
+				table.close()
+		self._tables.clear()
+
+	def path(self, signature):
+		"""Returns the path of a signature's table file"""
+		return os.path.join(self.directory, signature + EXTENSION)
+
+	def table(self, signature):
+		"""Returns the Tablebase for a signature, or None if there isn't one"""
+		table = self._tables.get(signature)
+		if table is None and signature not in self._tables:
+			path = self.path(signature)
+			table = Tablebase(path) if os.path.exists(path) else None
+			self._tables[signature] = table
+		return table
+
+	def value(self, game):
+		"""Returns the table byte for a game's position, or None if there is
+		no table for its signature"""
+		table = self.table(game_signature(game))
+		if table is None:
+			return None
+		index = table.layout.index_of(game)
+		return INVALID if index is None else table.value(index)
+
+	def probe(self, game):
+		"""Returns describe() of a game's position, or None if there is no
+		table for it"""
+		value = self.value(game)
+		return None if value is None else describe(value)
+
+
+# What each process in the forward pass keeps between chunks
+_workers = {}
+
+
+def _worker(signature, directory):
+	state = _workers.get((signature, directory))
+	if state is None:
+		state = _workers[signature, directory] = (Layout(signature), JanggiGame._empty(), Tablebases(directory))
+	return state
+
+
+def _forward(signature, directory, start, stop):
+	"""Runs the forward pass over the positions start to stop. Returns the
+	bytes of four arrays: a status for each position (0 if it can't happen, 1
+	if it can, 2 if the player to move is checkmated), the number of moves
+	from each position that stay in this signature, the indexes those moves
+	lead to, and pairs of (index, table byte) for captures, whose values
+	come from smaller tables."""
+	layout, game, tablebases = _worker(signature, directory)
+	pieces = layout.pieces
+
+	status = bytearray(stop - start)
+	counts = array('H', bytes(2 * (stop - start)))
+	successors = array('I')
+	captures = array('I')
+
+	for index in range(start, stop):
+		squares, turn_code = layout.decode(index)
+		if not layout.is_canonical(squares):
+			continue
+
+		game._clear()
+		for piece, square in zip(pieces, squares):
+			game._add(square, piece)
+		player = PLAYERS[turn_code]
+		opponent = PLAYERS[1 - turn_code]
+		game._turn = player
+		if game.is_in_check(opponent):
+			continue
+
+		moves = list(game._legal_moves(player))
+		in_check = game.is_in_check(player)
+		if in_check and not moves:
+			status[index - start] = 2
+			continue
+		status[index - start] = 1
+
+		count = 0
+		if not in_check:
+			successors.append(index ^ 1)
+			count += 1
+		board = game._board
+		for a, b in moves:
+			if board[b]:
+				game._push(a, b)
+				captures.append(index)
+				captures.append(tablebases.value(game))
+				game._pop()
+				continue
+			moved = list(squares)
+			moved[squares.index(a)] = b
+			layout.canonical(moved)
+			successors.append(layout.encode(moved, 1 - turn_code))
+			count += 1
+		counts[index - start] = count
+
+	return status, counts.tobytes(), successors.tobytes(), captures.tobytes()
+
+
+def _retrograde(size, status, counts, successors, captures):
+	"""Runs the backward pass over the results of the forward pass and
+	returns the table bytes"""
+	values = bytearray([INVALID]) * size
+	remaining = array('H', bytes(2 * size))
+	buckets = [[]]
+
+	# Turn the moves around: for each position, the positions that move
+	# into it
+	predecessor_counts = array('I', bytes(4 * (size + 1)))
+	for successor in successors:
+		predecessor_counts[successor + 1] += 1
+	for index in range(size):
+		predecessor_counts[index + 1] += predecessor_counts[index]
+	offsets = array('I', predecessor_counts)
+	predecessors = array('I', bytes(4 * len(successors)))
+
+	edge = 0
+	for index in range(size):
+		if status[index] == 0:
+			continue
+		values[index] = DRAW
+		count = counts[index]
+		remaining[index] = count
+		for successor in successors[edge:edge + count]:
+			predecessors[offsets[successor]] = index
+			offsets[successor] += 1
+		edge += count
+		if status[index] == 2:
+			values[index] = 0
+			buckets[0].append(index)
+
+	# A capture counts as one more move, whose value is known from the start
+	captured = [[] for value in range(DRAW)]
+	for position in range(0, len(captures), 2):
+		index, value = captures[position], captures[position + 1]
+		remaining[index] += 1
+		if value < DRAW:
+			captured[value].append(index)
+
+	# Each bucket holds positions whose distance is its number. Working
+	# through them in order means the first loss a position can move into is
+	# its shortest win, and the last win it can only move into is its longest
+	# loss.
+	last_capture = max((value for value in range(DRAW) if captured[value]), default=-1)
+	distance = 0
+	while buckets[distance] or distance <= last_capture:
+		following = []
+		buckets.append(following)
+		wins = distance % 2 == 0
+		reached = itertools.chain(captured[distance], *(
+			predecessors[predecessor_counts[successor]:predecessor_counts[successor + 1]]
+			for successor in buckets[distance]))
+
+		for index in reached:
+			if values[index] != DRAW:
+				continue
+			if not wins:
+				remaining[index] -= 1
+				if remaining[index]:
+					continue
+			if distance == MAX_DISTANCE:
+				raise ValueError('distance to checkmate is more than %d plies' % MAX_DISTANCE)
+			values[index] = distance + 1
+			following.append(index)
+		distance += 1
+
+	return values
+
+
+def build(signature, directory, processes=None):
+	"""Builds the table for a signature in a directory, first building any
+	smaller tables a capture could lead to that aren't there yet. The
+	forward pass runs in a pool of processes (os.cpu_count() by default, or
+	in this process when processes is 1). Returns the path of the table."""
+	layout = Layout(signature)
+	path = os.path.join(directory, layout.signature + EXTENSION)
+	for smaller in sub_signatures(layout.signature):
+		if not os.path.exists(os.path.join(directory, smaller + EXTENSION)):
+			build(smaller, directory, processes)
+
+	processes = processes or os.cpu_count() or 1
+	size = layout.size
+	chunk = -(-size // (processes * CHUNKS_PER_PROCESS))
+	starts = range(0, size, chunk)
+	arguments = ([layout.signature] * len(starts), [directory] * len(starts), starts,
+		[min(start + chunk, size) for start in starts])
+
+	if processes == 1:
+		results = list(map(_forward, *arguments))
+		while _workers:
+			_workers.popitem()[1][2].close()
+	else:
+		with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+			results = list(executor.map(_forward, *arguments))
+
+	status = bytearray()
+	counts = array('H')
+	successors = array('I')
+	captures = array('I')
+	for chunk_status, chunk_counts, chunk_successors, chunk_captures in results:
+		status += chunk_status
+		counts.frombytes(chunk_counts)
+		successors.frombytes(chunk_successors)
+		captures.frombytes(chunk_captures)
+	del results
+
+	values = _retrograde(size, status, counts, successors, captures)
+
+	temporary = path + '.tmp'
+	with open(temporary, 'wb') as f:
+		f.write(HEADER.pack(MAGIC, layout.signature.encode('ascii'), size))
+		f.write(values)
+	os.replace(temporary, path)
+	return path
+
+
+def main(argv=None):
+	"""Command line entry point for building tables and probing positions"""
+	parser = argparse.ArgumentParser(description='Build or probe Janggi endgame tablebases.')
+	commands = parser.add_subparsers(dest='command', required=True)
+
+	build_command = commands.add_parser('build', help='build the tables for some signatures')
+	build_command.add_argument('directory', help='directory to keep the tables in')
+	build_command.add_argument('signatures', nargs='+', help="material signatures, like 'KAA-kr'")
+	build_command.add_argument('--processes', type=int, help='processes for the forward pass')
+
+	probe = commands.add_parser('probe', help='look up a position')
+	probe.add_argument('directory', help='directory the tables are in')
+	probe.add_argument('fen', help='position to look up')
+
+	args = parser.parse_args(argv)
+
+	if args.command == 'build':
+		for signature in args.signatures:
+			print(build(signature, args.directory, args.processes))
+		return 0
+
+	game = JanggiGame.from_fen(args.fen)
+	with Tablebases(args.directory) as tablebases:
+		result = game.probe_tablebase(tablebases)
+		if result is None:
+			print('no table for %s' % game_signature(game))
+			return 1
+		print('%s %s' % result)
+		move = game.tablebase_move(tablebases)
+		if move:
+			print('best move %s-%s' % move)
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
@@ -1,5 +1,23 @@
 # TESTS FOR JANGGIGAME ARE HERE
 from JanggiGame import *
+import array
+import asyncio
+import batch
+import bitboard
+import book
+import copy
+import engine
+import io
+import instrument
+import os
+import parallel
+import perft
+import pickle
+import random
+import sessions
+import tablebase
+import tempfile
+import tournament
 import unittest
 
 
@@ -184,6 +202,168 @@ class TestLegalMove(unittest.TestCase):
 
 
 
+class TestBoard(unittest.TestCase):
+	# Tests the square numbering and the precomputed move tables
+
+	def test_square_numbers(self):
+		self.assertEqual(SQUARE_INDEX['a1'], 0)
+		self.assertEqual(SQUARE_INDEX['i1'], 8)
+		self.assertEqual(SQUARE_INDEX['a2'], 9)
+		self.assertEqual(SQUARE_INDEX['i10'], 89)
+		self.assertEqual(SQUARES[SQUARE_INDEX['e9']], 'e9')
+
+		# Squares on the edge have no neighbor past the edge
+		self.assertIsNone(NEIGHBORS[SQUARE_INDEX['a1']][UP])
+		self.assertIsNone(NEIGHBORS[SQUARE_INDEX['a1']][LEFT])
+		self.assertEqual(NEIGHBORS[SQUARE_INDEX['a1']][DOWN], SQUARE_INDEX['a2'])
+
+	def test_leg_paths(self):
+		# A horse in the corner has two moves, one through each leg
+		paths = HORSE_PATHS[SQUARE_INDEX['a10']]
+		named = sorted((SQUARES[leg], SQUARES[target]) for leg, target in paths)
+		self.assertEqual(named, [('a9', 'b8'), ('b10', 'c9')])
+
+		# An elephant in the corner has two moves as well
+		paths = ELEPHANT_PATHS[SQUARE_INDEX['a10']]
+		named = sorted((SQUARES[leg], SQUARES[target]) for leg, target in paths)
+		self.assertEqual(named, [('a9', 'c7'), ('b10', 'd8')])
+
+	def test_piece_lists(self):
+		game = JanggiGame()
+
+		def squares_of(player, rank):
+			return sorted(SQUARES[square] for square in game._ranks[player][rank])
+
+		self.assertEqual(len(game._occupied['blue']), 16)
+		self.assertEqual(squares_of('red', 'cannon'), ['b3', 'h3'])
+
+		# Moves, captures and take backs all keep the lists up to date
+		game.make_move('e9', 'e8')
+		game.make_move('a4', 'a5')
+		game.make_move('a7', 'a6')
+		game.make_move('a5', 'b5')
+		game.make_move('a6', 'a5')
+		game.make_move('b5', 'b6')
+		game.make_move('a5', 'b5')
+		self.assertEqual(game.find_general('blue'), 'e8')
+		self.assertEqual(squares_of('red', 'soldier'), ['b6', 'c4', 'e4', 'g4', 'i4'])
+
+		game.make_move('b6', 'b7')
+		game.make_move('b5', 'b4')
+		game.make_move('b7', 'c7')		# Red soldier takes the blue soldier on c7
+		self.assertEqual(squares_of('blue', 'soldier'), ['b4', 'e7', 'g7', 'i7'])
+
+		for move in range(10):
+			game.pop_move()
+		self.assertEqual(game.find_general('blue'), 'e9')
+		self.assertEqual(squares_of('red', 'soldier'), ['a4', 'c4', 'e4', 'g4', 'i4'])
+		self.assertEqual(squares_of('blue', 'soldier'), ['a7', 'c7', 'e7', 'g7', 'i7'])
+
+		# Writing to the board by name does too
+		game._pieces['e9'] = None
+		self.assertIsNone(game.find_general('blue'))
+		self.assertEqual(len(game._occupied['blue']), 15)
+
+	def test_board_view(self):
+		game = JanggiGame()
+
+		# Writing through the view by name is the same as writing the square
+		game._pieces['e5'] = Piece('red', 'horse')
+		self.assertEqual(game._board[SQUARE_INDEX['e5']].get_rank(), 'horse')
+		self.assertEqual(game.find_general('blue'), 'e9')
+		self.assertEqual(game.find_general('red'), 'e2')
+
+
+class TestPiece(unittest.TestCase):
+
+	def test_shared_instances(self):
+		self.assertIs(Piece('blue', 'horse'), Piece('blue', 'horse'))
+		self.assertIsNot(Piece('blue', 'horse'), Piece('red', 'horse'))
+		self.assertEqual(len(PIECES), 14)
+
+		# Two games use the very same pieces
+		self.assertIs(JanggiGame()._pieces['c10'], JanggiGame()._pieces['c10'])
+
+	def test_codes(self):
+		piece = Piece('red', 'cannon')
+		self.assertEqual(piece.get_player(), 'red')
+		self.assertEqual(piece.get_rank(), 'cannon')
+		self.assertEqual(piece.get_player_code(), 1)
+		self.assertEqual(piece.get_rank_code(), CANNON)
+		self.assertIs(PIECES[1 * 7 + CANNON], piece)
+
+	def test_immutable(self):
+		piece = Piece('blue', 'soldier')
+		with self.assertRaises(AttributeError):
+			piece._rank = 'chariot'
+		with self.assertRaises(AttributeError):
+			piece.color = 'green'
+		with self.assertRaises(ValueError):
+			Piece('green', 'soldier')
+		self.assertEqual(piece.get_rank(), 'soldier')
+
+	def test_pickle_and_copy(self):
+		piece = Piece('blue', 'elephant')
+		self.assertIs(pickle.loads(pickle.dumps(piece)), piece)
+		self.assertIs(copy.copy(piece), piece)
+		self.assertIs(copy.deepcopy(piece), piece)
+
+
+class TestAttacks(unittest.TestCase):
+
+	def test_square_attacked(self):
+		game = JanggiGame()
+
+		# Blue's soldier on c7 and horse on c10 both reach c6 / d8
+		self.assertTrue(game.is_square_attacked('c6', 'blue'))
+		self.assertTrue(game.is_square_attacked('d8', 'blue'))
+		self.assertFalse(game.is_square_attacked('c6', 'red'))
+
+		# A red cannon can hit e9 over the soldier on e7, but not over a cannon
+		game._pieces['e4'] = Piece('red', 'cannon')
+		self.assertTrue(game.is_square_attacked('e9', 'red'))
+		game._pieces['e6'] = Piece('blue', 'cannon')
+		self.assertFalse(game.is_square_attacked('e9', 'red'))
+
+	def test_palace_diagonals(self):
+		game = JanggiGame()
+		game._pieces['d10'] = Piece('red', 'chariot')
+		game._pieces['e9'] = None
+
+		# The chariot can run along the empty diagonal, the cannon needs a screen
+		self.assertTrue(game.is_square_attacked('f8', 'red'))
+		game._pieces['d10'] = Piece('red', 'cannon')
+		self.assertFalse(game.is_square_attacked('f8', 'red'))
+		game._pieces['e9'] = Piece('blue', 'guard')
+		self.assertTrue(game.is_square_attacked('f8', 'red'))
+
+
+	def test_evasions(self):
+		game = JanggiGame()
+
+		# The red cannon on e5 checks the blue general by jumping the soldier
+		game._pieces['e4'] = None
+		game._pieces['e5'] = Piece('red', 'cannon')
+		self.assertTrue(game.is_in_check('blue'))
+
+		def legal(moves):
+			return sorted((SQUARES[a], SQUARES[b]) for a, b in moves)
+
+		evasions = legal(game._evasions('blue'))
+		self.assertIn(('e7', 'd7'), evasions)		# Take the screen away
+		self.assertIn(('e9', 'd9'), evasions)		# Step out of the line
+		self.assertNotIn(('e7', 'e6'), evasions)	# Still a screen
+
+		# Exactly the moves that don't leave blue in check
+		brute_force = []
+		for a, b in game._pseudo_moves('blue'):
+			game._push(a, b)
+			if not game.is_in_check('blue'):
+				brute_force.append((a, b))
+			game._pop()
+		self.assertEqual(evasions, legal(brute_force))
+		self.assertEqual(sorted(game.generate_legal_moves('blue')), evasions)
+
 class TestMakeMove(unittest.TestCase):
 
 	def test_move_general(self):
@@ -237,6 +417,49 @@ class TestMakeMove(unittest.TestCase):
 		self.assertTrue(game.make_move('a4', 'a4'))
 		game = JanggiGame()
 
+	def test_take_back(self):
+		game = JanggiGame()
+
+		self.assertFalse(game.pop_move())
+
+		self.assertTrue(game.make_move('c7', 'c6'))
+		self.assertTrue(game.make_move('c4', 'c5'))
+		self.assertTrue(game.make_move('c6', 'c5'))		# Blue takes the red soldier
+		self.assertEqual(game._pieces['c5'].get_player(), 'blue')
+
+		self.assertTrue(game.pop_move())
+		self.assertEqual(game._pieces['c5'].get_player(), 'red')
+		self.assertEqual(game._pieces['c6'].get_player(), 'blue')
+		self.assertEqual(game._turn, 'blue')
+
+		# Passing can be taken back too
+		self.assertTrue(game.make_move('e9', 'e9'))
+		self.assertEqual(game._turn, 'red')
+		self.assertTrue(game.pop_move())
+		self.assertEqual(game._turn, 'blue')
+
+	def test_push_pop(self):
+		game = JanggiGame()
+		before = game._pieces.copy()
+
+		# push_move doesn't check the rules, it just moves the piece
+		game.push_move('a10', 'a2')
+		self.assertEqual(game._pieces['a2'].get_rank(), 'chariot')
+		self.assertIsNone(game._pieces['a10'])
+		self.assertEqual(game._turn, 'red')
+
+		game.pop_move()
+		self.assertEqual(game._pieces.copy(), before)
+		self.assertEqual(game._turn, 'blue')
+
+		# Moving from an empty square is refused without touching anything
+		key = game.position_key()
+		with self.assertRaises(ValueError):
+			game.push_move('e5', 'a7')
+		self.assertEqual(game._pieces.copy(), before)
+		self.assertEqual(game.position_key(), key)
+		self.assertFalse(game.pop_move())
+
 	def test_check_mate(self):
 		game = JanggiGame()
 		self.assertEqual(game.get_game_state(), 'UNFINISHED')
@@ -257,7 +480,924 @@ class TestMakeMove(unittest.TestCase):
 		self.assertEqual(game.get_game_state(), 'RED_WON')
 
 
-if __name__ == '__main__':
-	unittest.main()
+class TestMoveGeneration(unittest.TestCase):
+
+	def test_opening_moves(self):
+		game = JanggiGame()
+
+		moves = list(game.generate_moves('blue'))
+		self.assertEqual(len(moves), 31)
+		self.assertIn(('a7', 'a6'), moves)
+		self.assertIn(('c10', 'd8'), moves)
+		self.assertNotIn(('b8', 'b7'), moves)
+
+		# Nobody is in check at the start, so every move is legal
+		self.assertEqual(sorted(game.generate_legal_moves('blue')), sorted(moves))
+
+	def test_moves_match_legal_move(self):
+		game = JanggiGame()
+		game._pieces['e5'] = Piece('red', 'cannon')
+		game._pieces['d9'] = Piece('blue', 'chariot')
+
+		for a, b in game.generate_moves('red'):
+			self.assertTrue(game.legal_move(game._pieces[a], a, b))
+
+	def test_legal_moves_leave_general_safe(self):
+		game = JanggiGame()
+
+		# The blue soldier on e7 is all that stands between the red chariot
+		# and the blue general, so moving it sideways would be moving into check
+		game._pieces['e4'] = None
+		game._pieces['e5'] = Piece('red', 'chariot')
+
+		self.assertIn(('e7', 'd7'), list(game.generate_moves('blue')))
+		self.assertIn(('e7', 'e6'), list(game.generate_legal_moves('blue')))
+		self.assertNotIn(('e7', 'd7'), list(game.generate_legal_moves('blue')))
+
+
+	def test_pinned_pieces(self):
+		game = JanggiGame()
+		game._pieces['e7'] = None
+		game._pieces['e5'] = Piece('red', 'cannon')
+		game._pieces['c8'] = Piece('blue', 'horse')
+		game._pieces['g8'] = Piece('red', 'horse')
+		game._pieces['f8'] = Piece('blue', 'soldier')
+
+		# The red cannon needs a screen on e6, e7 or e8, and the soldier on
+		# f8 is blocking the red horse's leg
+		pinned, cannon_lines = game._pins('blue')
+		self.assertEqual(sorted(SQUARES[s] for s in pinned), ['e6', 'e7', 'e8', 'f8'])
+		self.assertEqual(sorted(SQUARES[s] for s in cannon_lines), ['e6', 'e7', 'e8'])
+
+		moves = list(game.generate_moves('blue'))
+		legal = list(game.generate_legal_moves('blue'))
+		self.assertIn(('c8', 'e7'), moves)
+		self.assertNotIn(('c8', 'e7'), legal)
+		self.assertIn(('f8', 'f7'), moves)
+		self.assertNotIn(('f8', 'f7'), legal)
+		self.assertIn(('c7', 'c6'), legal)
+
+
+class TestMoveHints(unittest.TestCase):
+
+	def setUp(self):
+		MOVE_CACHE.clear()
+
+	def test_moves_from(self):
+		game = JanggiGame()
+		self.assertEqual(sorted(game.legal_moves_from('h10')), ['g8', 'i8'])
+		self.assertEqual(game.legal_moves_from('e5'), ())
+
+		# Red's pieces can be asked about on blue's turn too
+		self.assertEqual(sorted(game.legal_moves_from('a4')), ['a5', 'b4'])
+
+	def test_pinned_piece(self):
+		game = JanggiGame()
+		game._pieces['e4'] = None
+		game._pieces['e5'] = Piece('red', 'chariot')
+		self.assertEqual(game.legal_moves_from('e7'), ('e6',))
+
+	def test_cache(self):
+		game = JanggiGame()
+		first = game.legal_moves_from('h10')
+		self.assertIs(game.legal_moves_from('h10'), first)
+		self.assertEqual(MOVE_CACHE.stats()['hits'], 1)
+		self.assertEqual(MOVE_CACHE.hit_rate(), 0.5)
+
+		# A move, or a pass, changes the position the answers are kept for
+		game.make_move('c7', 'c6')
+		game.make_move('c4', 'c5')
+		game.make_move('e9', 'e9')
+		self.assertEqual(MOVE_CACHE.stats()['hits'], 1)
+		self.assertEqual(sorted(game.legal_moves_from('h10')), ['g8', 'i8'])
+		self.assertEqual(MOVE_CACHE.stats()['misses'], 2)
+
+		# So does changing the board directly
+		self.assertNotIn('d10', game.legal_moves_from('e9'))
+		game._pieces['d10'] = None
+		self.assertIn('d10', game.legal_moves_from('e9'))
+
+	def test_cache_per_class(self):
+		class NoHorses(JanggiGame):
+			def _horse_targets(self, piece, a):
+				return []
+
+		self.assertEqual(sorted(JanggiGame().legal_moves_from('h10')), ['g8', 'i8'])
+		self.assertEqual(NoHorses().legal_moves_from('h10'), ())
+		self.assertEqual(sorted(JanggiGame().legal_moves_from('h10')), ['g8', 'i8'])
 
+	def test_eviction(self):
+		cache = MoveCache(2)
+		for key in range(3):
+			cache.put(key, (key,))
+		self.assertIsNone(cache.get(0))
+		self.assertEqual(cache.get(2), (2,))
+		self.assertEqual(cache.stats()['evictions'], 1)
+		self.assertEqual(cache.stats()['size'], 2)
 
+
+class TestPositionKey(unittest.TestCase):
+
+	def test_key_follows_moves(self):
+		game = JanggiGame()
+		start = game.position_key()
+		self.assertEqual(start, game.compute_position_key())
+
+		game.make_move('c7', 'c6')
+		game.make_move('c4', 'c5')
+		game.make_move('c6', 'c5')
+		self.assertNotEqual(game.position_key(), start)
+		self.assertEqual(game.position_key(), game.compute_position_key())
+
+		for move in range(3):
+			game.pop_move()
+		self.assertEqual(game.position_key(), start)
+
+	def test_key_includes_turn(self):
+		game = JanggiGame()
+		start = game.position_key()
+
+		# Passing doesn't move anything, but it is a different position
+		game.make_move('e9', 'e9')
+		self.assertNotEqual(game.position_key(), start)
+		game.make_move('e2', 'e2')
+		self.assertEqual(game.position_key(), start)
+
+	def test_transposition(self):
+		# The same position reached in a different order has the same key
+		first = JanggiGame()
+		for a, b in [('a7', 'a6'), ('a4', 'a5'), ('i7', 'i6'), ('i4', 'i5')]:
+			first.make_move(a, b)
+
+		second = JanggiGame()
+		for a, b in [('i7', 'i6'), ('i4', 'i5'), ('a7', 'a6'), ('a4', 'a5')]:
+			second.make_move(a, b)
+
+		self.assertEqual(first.position_key(), second.position_key())
+
+
+class TestSerialization(unittest.TestCase):
+
+	def test_start_fen(self):
+		game = JanggiGame()
+		self.assertEqual(game.to_fen(), START_FEN)
+		self.assertEqual(JanggiGame.from_fen(START_FEN)._pieces.copy(), game._pieces.copy())
+
+	def test_round_trip(self):
+		game = perft.load_position('midgame')
+		loaded = JanggiGame.from_fen(game.to_fen())
+		self.assertEqual(loaded._pieces.copy(), game._pieces.copy())
+		self.assertEqual(loaded.position_key(), game.position_key())
+		self.assertEqual(loaded._history, [])
+
+		data = game.to_bytes()
+		self.assertEqual(len(data), POSITION_BYTES)
+		loaded = JanggiGame.from_bytes(data)
+		self.assertEqual(loaded.to_bytes(), data)
+		self.assertEqual(loaded.to_fen(), game.to_fen())
+
+	def test_turn_and_state(self):
+		game = JanggiGame()
+		game.make_move('c7', 'c6')
+		game._game_state = 'BLUE_WON'
+
+		fen = game.to_fen()
+		self.assertTrue(fen.endswith(' r BLUE_WON'))
+		for loaded in (JanggiGame.from_fen(fen), JanggiGame.from_bytes(game.to_bytes())):
+			self.assertEqual(loaded._turn, 'red')
+			self.assertEqual(loaded.get_game_state(), 'BLUE_WON')
+		self.assertNotEqual(game.to_bytes(), JanggiGame().to_bytes())
+
+	def test_subclass(self):
+		game = bitboard.BitboardGame.from_fen(perft.load_position('endgame').to_fen())
+		self.assertIsInstance(game, bitboard.BitboardGame)
+		self.assertEqual(perft.perft(game, 2), 78)
+
+	def test_bad_fen(self):
+		for fen in ('9/9 b', START_FEN.replace('4k4', '4k5'), START_FEN.replace(' b ', ' x '),
+				START_FEN.replace('K', 'Q')):
+			with self.assertRaises(ValueError):
+				JanggiGame.from_fen(fen)
+		with self.assertRaises(ValueError):
+			JanggiGame.from_bytes(b'\xff' * POSITION_BYTES)
+
+
+class TestClone(unittest.TestCase):
+
+	def test_new_games_are_separate(self):
+		first = JanggiGame()
+		first.make_move('c7', 'c6')
+		second = JanggiGame()
+		self.assertEqual(second.to_fen(), START_FEN)
+		self.assertEqual(second._history, [])
+
+	def test_clone(self):
+		game = perft.load_position('midgame')
+		clone = game.clone()
+		self.assertEqual(clone.to_fen(), game.to_fen())
+		self.assertEqual(clone.position_key(), game.position_key())
+
+		# Moves in the clone don't show up in the original, and the clone
+		# can take back moves made before it was cloned
+		clone.make_move(*next(clone.generate_legal_moves(clone._turn)))
+		self.assertNotEqual(clone.to_fen(), game.to_fen())
+		while clone.pop_move():
+			pass
+		self.assertEqual(clone.to_fen(), START_FEN)
+		self.assertEqual(len(game._history), 24)
+
+	def test_clone_bitboard(self):
+		game = perft.load_position('midgame', bitboard.BitboardGame)
+		clone = game.clone()
+		self.assertIsInstance(clone, bitboard.BitboardGame)
+		clone.make_move('c9', 'i9')
+		self.assertNotEqual(clone.occupancy('blue'), game.occupancy('blue'))
+		self.assertEqual(perft.perft(game.clone(), 2), 1166)
+
+	def test_from_position(self):
+		pieces = {'e9': Piece('blue', 'general'), 'e2': Piece('red', 'general'), 'e5': Piece('red', 'chariot')}
+		game = JanggiGame.from_position(pieces, 'red')
+		self.assertEqual(game._pieces.copy(), JanggiGame.from_fen('9/4k4/9/9/4r4/9/9/9/4K4/9 r')._pieces.copy())
+		self.assertEqual(game._turn, 'red')
+		self.assertEqual(game.compute_position_key(), game.position_key())
+
+		midgame = perft.load_position('midgame')
+		for position in (midgame.to_bytes(), midgame.to_fen()):
+			self.assertEqual(JanggiGame.from_position(position).to_fen(), midgame.to_fen())
+
+
+class TestPerft(unittest.TestCase):
+
+	def test_stored_counts(self):
+		# Only the shallow depths, the deep ones are for perft.py itself
+		for name, position in perft.POSITIONS.items():
+			game = perft.load_position(name)
+			for depth in (1, 2):
+				self.assertEqual(perft.perft(game, depth), position['counts'][depth - 1], name)
+
+	def test_divide_and_profile(self):
+		game = perft.load_position('endgame')
+		key = game.position_key()
+
+		self.assertEqual(sum(perft.divide(game, 3).values()), 1723)
+		self.assertEqual(perft.profile_perft(game, 3)['nodes'], 1723)
+		midgame = perft.load_position('midgame')
+		self.assertEqual(perft.profile_perft(midgame, 2)['nodes'], perft.POSITIONS['midgame']['counts'][1])
+
+		# Counting leaves the game the way it was
+		self.assertEqual(game.position_key(), key)
+
+
+class TestBitboard(unittest.TestCase):
+
+	def test_matches_janggi_game(self):
+		for name in perft.POSITIONS:
+			game = perft.load_position(name)
+			bit_game = perft.load_position(name, bitboard.BitboardGame)
+
+			for player in ('blue', 'red'):
+				self.assertEqual(sorted(bit_game.generate_moves(player)), sorted(game.generate_moves(player)))
+				for square in SQUARES:
+					self.assertEqual(bit_game.is_square_attacked(square, player),
+						game.is_square_attacked(square, player), square)
+
+			self.assertEqual(perft.perft(bit_game, 2), perft.POSITIONS[name]['counts'][1])
+
+	def test_occupancy(self):
+		game = bitboard.BitboardGame()
+		self.assertEqual(bin(game.occupancy('blue')).count('1'), 16)
+		self.assertEqual(game.occupancy(), game.occupancy('blue') | game.occupancy('red'))
+		self.assertEqual(list(bitboard.squares_of(game.rank_occupancy('red', 'cannon'))),
+			[SQUARE_INDEX['b3'], SQUARE_INDEX['h3']])
+
+		game.make_move('b8', 'b8')
+		game.make_move('b3', 'b3')
+		self.assertTrue(game.make_move('c7', 'c6'))
+		self.assertEqual(bin(game.occupancy('blue')).count('1'), 16)
+		self.assertFalse(game.occupancy('blue') & 1 << SQUARE_INDEX['c7'])
+
+	def test_cannon_lines(self):
+		game = bitboard.BitboardGame()
+
+		# The b8 cannon can't jump the red cannon on b3 or anything in front
+		# of it, and has nothing to jump sideways
+		self.assertEqual(game.line_attacks('b8'), 0)
+
+		# Once there's a screen on b6 it reaches b5 and b4, and on up to b3
+		game._pieces['b6'] = Piece('red', 'soldier')
+		reach = sorted(SQUARES[square] for square in bitboard.squares_of(game.line_attacks('b8')))
+		self.assertEqual(reach, ['b3', 'b4', 'b5'])
+
+
+class TestEngine(unittest.TestCase):
+
+	def test_finds_mate(self):
+		game = JanggiGame()
+		game._pieces['d3'] = Piece('red', 'chariot')
+		game._pieces['f4'] = Piece('red', 'chariot')
+		game._pieces['e10'] = Piece('red', 'cannon')
+		game._pieces['e8'] = Piece('blue', 'soldier')
+		game._turn = 'red'
+		key = game.position_key()
+
+		result = game.search(depth=3)
+		self.assertEqual(result.best_move, ('b3', 'e3'))
+		self.assertEqual(result.score, engine.MATE - 1)
+		self.assertEqual(game.position_key(), key)
+
+		self.assertTrue(game.make_move(*result.best_move))
+		self.assertEqual(game.get_game_state(), 'RED_WON')
+
+	def test_takes_free_piece(self):
+		game = JanggiGame()
+
+		# The red chariot can take the blue chariot that wandered onto a5
+		game._pieces['a4'] = None
+		game._pieces['a5'] = Piece('blue', 'chariot')
+		game._turn = 'red'
+
+		result = game.search(depth=2)
+		self.assertEqual(result.best_move, ('a1', 'a5'))
+		self.assertEqual(result.pv[0], result.best_move)
+		self.assertGreater(result.nodes, 0)
+
+	def test_time_limit(self):
+		game = JanggiGame()
+		key = game.position_key()
+
+		result = game.search(time_limit=0.2)
+		self.assertIsNotNone(result.best_move)
+		self.assertGreaterEqual(result.depth, 1)
+		self.assertIn(result.best_move, list(game.generate_legal_moves('blue')))
+		self.assertEqual(game.position_key(), key)
+		self.assertEqual(game._history, [])
+
+
+class TestTranspositionTable(unittest.TestCase):
+
+	def test_store_and_probe(self):
+		table = engine.TranspositionTable(megabytes=1)
+		self.assertLessEqual(table.size_bytes(), 1024 * 1024)
+
+		table.store(12345, 4, engine.LOWER, -250, (3, 12))
+		self.assertEqual(table.probe(12345), (4, engine.LOWER, -250, (3, 12)))
+		self.assertIsNone(table.probe(54321))
+
+		table.store(777, 0, engine.EXACT, engine.MATE - 3, None)
+		self.assertEqual(table.probe(777), (0, engine.EXACT, engine.MATE - 3, None))
+
+		stats = table.stats()
+		self.assertEqual(stats['hits'], 2)
+		self.assertEqual(stats['probes'], 3)
+
+	def test_replacement(self):
+		table = engine.TranspositionTable(megabytes=1)
+		buckets = table.stats()['entries'] // 2
+
+		# Three positions that land in the same bucket
+		first, second, third = 5, 5 + buckets, 5 + 2 * buckets
+
+		table.store(first, 6, engine.EXACT, 10, None)
+		table.store(second, 2, engine.EXACT, 20, None)		# Too shallow for the deep slot
+		self.assertIsNotNone(table.probe(first))
+		self.assertIsNotNone(table.probe(second))
+
+		table.store(third, 1, engine.EXACT, 30, None)		# Replaces second, not first
+		self.assertIsNotNone(table.probe(first))
+		self.assertIsNone(table.probe(second))
+		self.assertIsNotNone(table.probe(third))
+		self.assertEqual(table.stats()['overwrites'], 1)
+		self.assertEqual(table.stats()['collisions'], 1)
+
+		# A new search can take over the deep slot
+		table.new_search()
+		table.store(second, 1, engine.EXACT, 20, None)
+		self.assertEqual(table.probe(second)[2], 20)
+		self.assertIsNotNone(table.probe(first))
+
+	def test_engine_uses_table(self):
+		table = engine.TranspositionTable(megabytes=1)
+		game = JanggiGame()
+
+		first = engine.Engine(game, table).search(depth=3)
+		self.assertGreater(first.table_stats['stores'], 0)
+
+		# Searching again with the same table finds the old results
+		hits = table.hits
+		second = engine.Engine(game, table).search(depth=3)
+		self.assertGreater(table.hits, hits)
+		self.assertEqual(second.best_move, first.best_move)
+		self.assertLessEqual(second.nodes, first.nodes)
+
+
+@unittest.skipIf(batch.np is None, 'NumPy is not installed')
+class TestBatch(unittest.TestCase):
+
+	def setUp(self):
+		self.games = batch.random_games(40, seed=16)
+		self.games += [perft.load_position(name) for name in perft.POSITIONS]
+		self.boards = batch.stack(self.games)
+
+	def test_stack(self):
+		self.assertEqual(self.boards.shape, (len(self.games), 10, 9))
+		start = batch.stack([JanggiGame()])[0]
+		self.assertEqual(start[8, 4], PIECES.index(Piece('blue', 'general')) + 1)
+		self.assertEqual(start[4, 1], 0)
+
+	def test_attacks_and_check(self):
+		for player in PLAYERS:
+			attacked = batch.attack_maps(self.boards, player)
+			checked = batch.in_check(self.boards, player)
+			for n, game in enumerate(self.games):
+				self.assertEqual(checked[n], game.is_in_check(player))
+				for square in SQUARES:
+					row, column = divmod(SQUARE_INDEX[square], 9)
+					self.assertEqual(attacked[n, row, column], game.is_square_attacked(square, player))
+
+	def test_moves(self):
+		for player in PLAYERS:
+			pseudo = batch.pseudo_legal_moves(self.boards, player)
+			legal = batch.legal_moves(self.boards, player)
+			for n, game in enumerate(self.games):
+				self.assertEqual(set(zip(*pseudo[n].nonzero())), set(game._pseudo_moves(player)))
+				self.assertEqual(set(zip(*legal[n].nonzero())), set(game._legal_moves(player)))
+
+
+class TestSessions(unittest.IsolatedAsyncioTestCase):
+
+	def mate_in_one(self):
+		"""Returns the FEN of a position where red mates with b3-e3"""
+		game = JanggiGame()
+		game._pieces['d3'] = Piece('red', 'chariot')
+		game._pieces['f4'] = Piece('red', 'chariot')
+		game._pieces['e10'] = Piece('red', 'cannon')
+		game._pieces['e8'] = Piece('blue', 'soldier')
+		game._turn = 'red'
+		return game.to_fen()
+
+	async def test_moves(self):
+		host = sessions.SessionHost()
+		first = host.create_game()
+		second = host.create_game()
+		self.assertNotEqual(first, second)
+
+		self.assertTrue(await host.make_move(first, 'c7', 'c6'))
+		self.assertFalse(await host.make_move(first, 'c6', 'c5'))
+		self.assertEqual((await host.get_state(first))['turn'], 'red')
+		self.assertEqual((await host.get_state(second))['fen'], START_FEN)
+
+		with self.assertRaises(KeyError):
+			await host.make_move('nobody', 'c7', 'c6')
+
+	async def test_moves_in_one_game_take_turns(self):
+		host = sessions.SessionHost()
+		game_id = host.create_game()
+
+		# Both try the same move at once; only the first can succeed
+		results = await asyncio.gather(*[host.make_move(game_id, 'c7', 'c6') for i in range(2)])
+		self.assertEqual(sorted(results), [False, True])
+		self.assertEqual(host.latency(game_id)['count'], 2)
+
+	async def test_checkmate(self):
+		host = sessions.SessionHost()
+		game_id = host.create_game(position=self.mate_in_one())
+		self.assertTrue(await host.make_move(game_id, 'b3', 'e3'))
+		self.assertEqual((await host.get_state(game_id))['state'], 'RED_WON')
+
+		# Checkmate is looked for with the host's own game class
+		class NoMates(JanggiGame):
+			def is_in_checkmate(self, player):
+				return False
+
+		host = sessions.SessionHost(game_class=NoMates)
+		game_id = host.create_game(position=self.mate_in_one())
+		self.assertTrue(await host.make_move(game_id, 'b3', 'e3'))
+		self.assertEqual((await host.get_state(game_id))['state'], 'UNFINISHED')
+
+	async def test_eviction(self):
+		now = [0.0]
+		host = sessions.SessionHost(idle_timeout=10, clock=lambda: now[0])
+		idle = host.create_game()
+		busy = host.create_game()
+		await host.make_move(idle, 'c7', 'c6')
+		fen = (await host.get_state(idle))['fen']
+
+		now[0] = 8.0
+		await host.make_move(busy, 'c7', 'c6')
+		now[0] = 12.0
+		self.assertEqual(host.evict_idle(), 1)
+		self.assertEqual(host.stats()['evicted'], 1)
+
+		# The evicted game picks up where it left off
+		self.assertEqual((await host.get_state(idle))['fen'], fen)
+		self.assertTrue(await host.make_move(idle, 'c4', 'c5'))
+		stats = host.stats()
+		self.assertEqual((stats['resident'], stats['restores']), (2, 1))
+		self.assertEqual(stats['latency']['count'], 3)
+
+
+class TestInstrument(unittest.TestCase):
+
+	def setUp(self):
+		instrument.reset()
+
+	def tearDown(self):
+		instrument.disable()
+		instrument.reset()
+
+	def test_off_by_default(self):
+		self.assertFalse(instrument.is_enabled())
+		original = JanggiGame.is_in_check
+		JanggiGame().make_move('c7', 'c6')
+		self.assertEqual(instrument.stats()['calls']['make_move'], 0)
+
+		instrument.enable()
+		self.assertIsNot(JanggiGame.is_in_check, original)
+		instrument.disable()
+		self.assertIs(JanggiGame.is_in_check, original)
+
+	def test_counts(self):
+		instrument.enable()
+		game = JanggiGame()
+		game.make_move('c7', 'c6')
+		game.legal_move(game._pieces['c10'], 'c10', 'd8')
+		perft.perft(game, 2)
+
+		stats = instrument.stats()
+		self.assertEqual(stats['calls']['make_move'], 1)
+		self.assertEqual(stats['calls']['legal_move'], 1)
+		self.assertEqual(stats['board_copies'], 1)
+		self.assertGreater(stats['ranks']['chariot'], 0)
+		self.assertGreater(stats['simulated_moves'], 0)
+
+		timing = stats['timings']['is_in_check']
+		self.assertEqual(timing['count'], stats['calls']['is_in_check'])
+		self.assertEqual(sum(timing['histogram'].values()), timing['count'])
+
+		instrument.reset()
+		self.assertEqual(instrument.stats()['calls']['make_move'], 0)
+
+	def test_checkmate(self):
+		game = JanggiGame()
+		game._pieces['d3'] = Piece('red', 'chariot')
+		game._pieces['f4'] = Piece('red', 'chariot')
+		game._pieces['e5'] = Piece('red', 'cannon')
+		game._pieces['e8'] = Piece('blue', 'soldier')
+
+		instrument.enable()
+		self.assertTrue(game.is_in_checkmate('blue'))
+		stats = instrument.stats()
+		self.assertEqual(stats['timings']['is_in_checkmate']['count'], 1)
+		self.assertGreater(stats['checkmate_simulated_moves'], 0)
+		self.assertEqual(stats['checkmate_board_copies'], 0)
+
+
+class TestBook(unittest.TestCase):
+
+	GAMES = [
+		'c7-c6 c4-c5 b10-d7',
+		'c7-c6 c4-c5 h10-g8  # a comment',
+		'c7-c6 g4-g5',
+		'g7-g6 c4-c5',
+		'',
+		'hehe ehhe c7-c6',
+	]
+
+	def setUp(self):
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+		self.path = os.path.join(directory.name, 'book.bin')
+		builder = book.BookBuilder(max_ply=2)
+		builder.add_records(self.GAMES)
+		builder.write(self.path)
+		self.book = book.OpeningBook(self.path)
+		self.addCleanup(self.book.close)
+
+	def test_setups(self):
+		game = JanggiGame('hehe', 'ehhe')
+		self.assertEqual(game._pieces['b10'], Piece('blue', 'horse'))
+		self.assertEqual(game._pieces['c10'], Piece('blue', 'elephant'))
+		self.assertEqual(game._pieces['b1'], Piece('red', 'elephant'))
+		self.assertEqual(game._pieces['c1'], Piece('red', 'horse'))
+		self.assertEqual(game._pieces['g1'], Piece('red', 'horse'))
+		self.assertNotEqual(game.position_key(), JanggiGame().position_key())
+		self.assertEqual(JanggiGame('eheh', 'eheh').to_fen(), START_FEN)
+		self.assertEqual(len(start_layout('heeh', 'heeh')), 32)
+		with self.assertRaises(ValueError):
+			JanggiGame('hhee')
+
+	def test_lookup(self):
+		# Only the first two plies of each game go in
+		self.assertEqual(len(self.book), 6)
+		self.assertEqual(JanggiGame().book_moves(self.book), [('c7', 'c6', 3), ('g7', 'g6', 1)])
+
+		game = JanggiGame()
+		game.make_move('c7', 'c6')
+		self.assertEqual(game.book_moves(self.book), [('c4', 'c5', 2), ('g4', 'g5', 1)])
+		game.make_move('c4', 'c5')
+		self.assertEqual(game.book_moves(self.book), [])
+
+		self.assertEqual(JanggiGame('hehe', 'ehhe').book_moves(self.book), [('c7', 'c6', 1)])
+
+	def test_engine_plays_book_move(self):
+		game = JanggiGame()
+		result = game.search(depth=2, book=self.book)
+		self.assertTrue(result.from_book)
+		self.assertEqual(result.best_move, ('c7', 'c6'))
+		self.assertEqual(result.nodes, 0)
+
+		game.make_move('a7', 'a6')
+		result = game.search(depth=1, book=self.book)
+		self.assertFalse(result.from_book)
+		self.assertIsNotNone(result.best_move)
+
+	def test_bad_records(self):
+		builder = book.BookBuilder()
+		with self.assertRaises(ValueError):
+			builder.add_records(['c7-c6 c7-c6'])
+		with self.assertRaises(ValueError):
+			builder.add_records(['c7c6'])
+		with self.assertRaises(ValueError):
+			builder.add_records(['hehe c7-c6'])
+
+	def test_not_a_book(self):
+		with open(self.path, 'r+b') as f:
+			f.write(b'NOTABOOK')
+		with self.assertRaises(ValueError):
+			book.OpeningBook(self.path)
+
+
+class TestTablebase(unittest.TestCase):
+
+	def setUp(self):
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+		self.directory = directory.name
+
+	def test_signatures(self):
+		self.assertEqual(tablebase.signature_of(tablebase.parse_signature('AKA-rk')), 'KAA-kr')
+		self.assertEqual(tablebase.game_signature(JanggiGame.from_fen('4k4/3a5/9/9/9/9/9/9/4K4/4R4 b')), 'KR-ka')
+		self.assertEqual(tablebase.sub_signatures('KAA-kr'), ['KA-kr', 'KAA-k'])
+		for text in ('KR', 'R-k', 'KK-k', 'KX-k'):
+			with self.assertRaises(ValueError):
+				tablebase.parse_signature(text)
+
+		# Generals stay in the palace and soldiers can't go backward
+		self.assertEqual(len(tablebase.allowed_squares(Piece('blue', 'general'))), 9)
+		soldier = tablebase.allowed_squares(Piece('red', 'soldier'))
+		self.assertIn(SQUARE_INDEX['e10'], soldier)
+		self.assertNotIn(SQUARE_INDEX['a1'], soldier)
+
+	def test_layout(self):
+		layout = tablebase.Layout('KAA-kr')
+		self.assertEqual(layout.size, 9 * 9 * 9 * 9 * 90 * 2)
+		game = JanggiGame.from_fen('4k4/9/9/9/4r4/9/9/3A1A3/4K4/9 r')
+		index = layout.index_of(game)
+		squares, turn_code = layout.decode(index)
+		self.assertEqual([SQUARES[square] for square in squares], ['e9', 'd8', 'f8', 'e1', 'e5'])
+		self.assertEqual(turn_code, 1)
+		self.assertEqual(layout.encode(squares, turn_code), index)
+		self.assertFalse(layout.is_canonical([squares[0], squares[2], squares[1]] + squares[3:]))
+
+	def test_retrograde(self):
+		# 0 is checkmated, 1 can move into 0, 2 can only move into 1, 3 and 4
+		# move into each other, 5 can't happen, 6 can only capture into a
+		# win and 7 can move into 2 or capture into a draw
+		status = bytearray([2, 1, 1, 1, 1, 0, 1, 1])
+		counts = array.array('H', [0, 2, 1, 1, 1, 0, 0, 1])
+		successors = array.array('I', [0, 2, 1, 4, 3, 2])
+		captures = array.array('I', [6, 1, 7, tablebase.DRAW])
+		values = tablebase._retrograde(8, status, counts, successors, captures)
+		self.assertEqual(list(values), [0, 1, 2, tablebase.DRAW, tablebase.DRAW, tablebase.INVALID, 2, 3])
+		self.assertEqual(tablebase.describe(values[1]), ('WIN', 1))
+		self.assertEqual(tablebase.describe(values[2]), ('LOSS', 2))
+		self.assertEqual(tablebase.describe(values[3]), ('DRAW', None))
+
+	def test_build_and_probe(self):
+		path = tablebase.build('K-kr', self.directory, processes=1)
+		self.assertTrue(os.path.exists(os.path.join(self.directory, 'K-k.jtb')))
+
+		with tablebase.Tablebases(self.directory) as tablebases:
+			self.assertEqual(len(tablebases.table('K-kr')), os.path.getsize(path) - tablebase.HEADER.size)
+
+			# A lone chariot can't checkmate, since the general can always
+			# step out of the line or pass
+			game = JanggiGame.from_fen('4k4/9/9/9/9/9/9/9/4K4/4r4 b')
+			self.assertEqual(game.probe_tablebase(tablebases), ('DRAW', None))
+			move = game.tablebase_move(tablebases)
+			self.assertIn(move[1], game.legal_moves_from(move[0]))
+
+			# Blue in check with red to move can't happen
+			game = JanggiGame.from_fen('4k4/9/9/9/9/9/9/9/4K4/4r4 r')
+			self.assertIsNone(game.probe_tablebase(tablebases))
+
+			# Nor is there a table for the start
+			self.assertIsNone(JanggiGame().probe_tablebase(tablebases))
+			self.assertIsNone(JanggiGame().tablebase_move(tablebases))
+
+	def test_processes(self):
+		single = os.path.join(self.directory, 'single')
+		pooled = os.path.join(self.directory, 'pooled')
+		os.mkdir(single)
+		os.mkdir(pooled)
+		with open(tablebase.build('KA-k', single, processes=1), 'rb') as f:
+			expected = f.read()
+		with open(tablebase.build('KA-k', pooled, processes=2), 'rb') as f:
+			self.assertEqual(f.read(), expected)
+
+	def test_not_a_tablebase(self):
+		path = os.path.join(self.directory, 'K-k.jtb')
+		with open(path, 'wb') as f:
+			f.write(b'NOTATABLEBASE')
+		with self.assertRaises(ValueError):
+			tablebase.Tablebase(path)
+
+
+class TestParallel(unittest.TestCase):
+
+	def test_perft(self):
+		game = JanggiGame()
+		self.assertEqual(parallel.parallel_perft(game, 3, processes=2), 31001)
+		self.assertEqual(game.to_fen(), START_FEN)
+
+		midgame = perft.load_position('midgame')
+		self.assertEqual(parallel.parallel_divide(midgame, 2, processes=2), perft.divide(midgame, 2))
+
+	def test_search(self):
+		game = perft.load_position('midgame')
+		fen = game.to_fen()
+		serial = engine.Engine(game).search(depth=2)
+		result = parallel.parallel_search(game, 2, processes=2)
+		self.assertEqual(result.score, serial.score)
+		self.assertEqual(result.best_move, result.pv[0])
+		self.assertEqual(game.to_fen(), fen)
+
+	def test_search_mate(self):
+		# The general stepping aside gives the cannon its screen
+		game = JanggiGame.from_fen('3c5/4k4/9/9/9/9/9/9/3KA4/9 r')
+		result = parallel.parallel_search(game, 2, processes=2)
+		self.assertEqual(result.score, engine.MATE - 1)
+		self.assertEqual(result.score, engine.Engine(game).search(depth=2).score)
+		game.make_move(*result.best_move)
+		self.assertEqual(game.get_game_state(), 'RED_WON')
+
+	def test_scaling(self):
+		rows = parallel.scaling(JanggiGame(), 2, [1], 'perft')
+		self.assertEqual([row['workers'] for row in rows], [0, 1])
+		self.assertEqual([row['nodes'] for row in rows], [965, 965])
+		self.assertIn('serial', parallel.format_scaling(rows))
+
+
+class TestTournament(unittest.TestCase):
+
+	def test_policies(self):
+		rng = random.Random(1)
+		game = JanggiGame.from_fen('4k4/9/9/9/9/9/9/4r4/4K4/R8 b')
+		self.assertEqual(tournament.make_policy('greedy').choose(game, rng), ('e9', 'e8'))
+		self.assertIn(tournament.make_policy('random').choose(game, rng), list(game.generate_legal_moves('blue')))
+		self.assertEqual(tournament.make_policy('engine:1').choose(game, rng), ('e9', 'e8'))
+		for spec in ('engine', 'engine:0', 'minimax'):
+			with self.assertRaises(ValueError):
+				tournament.make_policy(spec)
+
+	def test_play_game(self):
+		greedy = tournament.make_policy('greedy')
+		record = tournament.play_game(greedy, greedy, random.Random(3), opening_plies=4, random_setups=True, max_plies=60)
+		self.assertIn(record.result, ('BLUE_WON', 'RED_WON', 'DRAW'))
+		self.assertLessEqual(record.plies, 60)
+
+		# The record replays to the same result
+		game = JanggiGame(record.blue_setup, record.red_setup)
+		for a, b in record.moves:
+			self.assertTrue(game.make_move(a, b))
+		self.assertEqual(game.get_game_state(), 'UNFINISHED' if record.result == 'DRAW' else record.result)
+
+	def test_run_tournament(self):
+		log = io.StringIO()
+		result = tournament.run_tournament('greedy', 'random', 6, processes=1, max_plies=80, seed=5, log=log)
+		self.assertEqual(result.games, 6)
+		self.assertEqual(result.wins + result.draws + result.losses, 6)
+		self.assertGreater(result.plies_per_second(), 0)
+
+		# The log has a line per game that book.py can read
+		lines = log.getvalue().splitlines()
+		self.assertEqual(len(lines), 6)
+		self.assertEqual(sum(int(line.split()[-1]) for line in lines), result.plies)
+		builder = book.BookBuilder()
+		builder.add_records(lines)
+		self.assertEqual(builder.games, 6)
+
+		# Worker processes play the same games
+		pooled = tournament.run_tournament('greedy', 'random', 6, processes=2, max_plies=80, seed=5)
+		self.assertEqual((pooled.wins, pooled.draws, pooled.losses, pooled.plies),
+			(result.wins, result.draws, result.losses, result.plies))
+
+	def test_elo(self):
+		self.assertEqual(tournament.elo_difference(5, 0, 5)[0], 0)
+		elo, margin = tournament.elo_difference(60, 20, 20)
+		self.assertAlmostEqual(elo, 147.2, places=1)
+		self.assertGreater(margin, 0)
+		self.assertEqual(tournament.elo_difference(3, 0, 0)[0], float('inf'))
+
+
+class TestEvaluation(unittest.TestCase):
+
+	def test_start_is_even(self):
+		game = JanggiGame()
+		self.assertEqual(game.evaluate(), 0)
+		self.assertEqual(JanggiGame('hehe', 'hehe').evaluate(), 0)
+
+	def test_kept_up_to_date(self):
+		game = perft.load_position('midgame')
+		self.assertEqual(game.evaluate(), game.compute_evaluation())
+		self.assertEqual(engine.Engine(game).evaluate(), game.evaluate())
+
+		# Through captures, passes and take-backs
+		rng = random.Random(7)
+		for ply in range(40):
+			moves = list(game.generate_legal_moves(game._turn))
+			if not moves:
+				break
+			game.make_move(*rng.choice(moves))
+			self.assertEqual(game.evaluate(), game.compute_evaluation())
+		general = SQUARES[game._find_general(game._turn)]
+		if game.make_move(general, general):
+			self.assertEqual(game.evaluate(), game.compute_evaluation())
+		while game.pop_move():
+			self.assertEqual(game.evaluate(), game.compute_evaluation())
+		self.assertEqual(game.evaluate(), 0)
+
+		for other in (game.clone(), JanggiGame.from_bytes(game.to_bytes()), perft.load_position('midgame', bitboard.BitboardGame)):
+			self.assertEqual(other.evaluate(), other.compute_evaluation())
+
+	def test_piece_square_tables(self):
+		game = JanggiGame.from_fen('9/4k4/9/9/9/9/4P4/9/4K4/9 b')
+		soldier = PIECE_VALUES['soldier']
+		self.assertEqual(game.evaluate(), soldier)
+		game.make_move('e7', 'e6')
+		self.assertEqual(game.evaluate(), -soldier - 10)
+
+		# A red soldier the same distance from home is worth the same
+		self.assertEqual(JanggiGame.from_fen('9/4k4/9/9/4p4/9/9/9/4K4/9 r').evaluate(), soldier + 10)
+
+	def test_set_evaluation(self):
+		game = perft.load_position('midgame')
+		chariots_only = Evaluation({rank: 0 for rank in RANKS if rank != 'chariot'},
+			{rank: (0,) * 90 for rank in RANKS})
+		game.set_evaluation(chariots_only)
+		chariots = len(game._ranks['blue']['chariot']) - len(game._ranks['red']['chariot'])
+		self.assertEqual(game.evaluate(), 1300 * chariots)
+		game.make_move(*next(game.generate_legal_moves(game._turn)))
+		self.assertEqual(game.evaluate(), game.compute_evaluation())
+		self.assertEqual(game.clone().evaluate(), game.evaluate())
+
+		# Other games keep the default
+		self.assertEqual(JanggiGame().evaluate(), 0)
+		with self.assertRaises(ValueError):
+			Evaluation(tables={'horse': (0,) * 89})
+
+
+class TestAttackMaps(unittest.TestCase):
+
+	def positions(self, game_class):
+		"""Yields the stored positions and some random ones"""
+		for name in perft.POSITIONS:
+			yield perft.load_position(name, game_class)
+		rng = random.Random(11)
+		for count in range(10):
+			game = game_class()
+			for ply in range(rng.randrange(60)):
+				moves = list(game.generate_legal_moves(game._turn))
+				if not moves or game.get_game_state() != 'UNFINISHED':
+					break
+				game.make_move(*rng.choice(moves))
+			yield game
+
+	def test_matches_move_generation(self):
+		for game_class in (JanggiGame, bitboard.BitboardGame):
+			for game in self.positions(game_class):
+				for player in PLAYERS:
+					self.assertEqual(game.count_moves(player), len(list(game.generate_moves(player))))
+					attacked = set(square for square in SQUARES if game.is_square_attacked(square, player))
+					self.assertEqual(game.attack_map(player), attacked)
+					for square in SQUARES:
+						self.assertEqual(bool(game.attackers_of(square, player)), square in attacked)
+
+	def test_attackers_of(self):
+		game = perft.load_position('endgame')
+		self.assertEqual(game.attackers_of('e9', 'red'), ['e5', 'd8', 'g8'])
+		self.assertEqual(game.attackers_of('e9', 'blue'), ['f10'])
+		self.assertEqual(game.attackers_of('e9'), ['e5', 'd8', 'g8', 'f10'])
+		self.assertEqual(game.attackers_of('d8'), ['h8', 'e9'])
+		self.assertEqual(game.attackers_of('a1'), ['a5'])
+		self.assertEqual(game.attackers_of('i1'), [])
+
+		# Defended pieces are in their own player's attack map
+		self.assertIn('e9', game.attack_map('blue'))
+		self.assertNotIn('e7', game.attack_map('blue'))
+		self.assertEqual(game.count_moves('blue'), 31)
+		self.assertEqual(game.count_moves('red'), 21)
+
+
+if __name__ == '__main__':
+	unittest.main()
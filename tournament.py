@@ -0,0 +1,294 @@
+# Description: Plays matches between two ways of choosing moves, to tell
+# whether a change to the engine (or to the rules code underneath it) made
+# play stronger or weaker, faster or slower. A policy is named by a string:
+# 'random', 'greedy' (take the most valuable piece on offer) or 'engine:D'
+# (search D plies deep). The two policies swap sides every game. Games can
+# start from random horse/elephant setups and a few random plies, so that
+# deterministic policies don't play the same game over and over.
+#
+# Games are spread over a pool of processes, and each one is written to the
+# log as soon as it finishes (so not always in order), one line per game in
+# the format book.py reads:
+#
+#     eheh hehe c7-c6 c4-c5 ... # 12 blue=A BLUE_WON 87
+#
+# (game number, which policy played blue, result and plies). At the end the
+# runner reports games and plies per second and the Elo difference between
+# the policies with a 95% error margin.
+#
+# Usage: python tournament.py A B [--games N] [--processes N]
+#                                 [--opening-plies N] [--random-setups]
+#                                 [--max-plies N] [--seed N] [--log FILE]
+
+import argparse
+import concurrent.futures
+import math
+import os
+import random
+import sys
+import time
+
+from engine import Engine, PIECE_VALUES, TranspositionTable
+from JanggiGame import JanggiGame, SETUPS, SQUARES
+
+
+# Games still going after this many plies are draws
+DEFAULT_MAX_PLIES = 200
+
+# Size of the transposition table each process gives an engine policy
+POLICY_TABLE_MB = 4
+
+# 1.96 standard errors either side of the mean covers 95%
+CONFIDENCE_Z = 1.96
+
+
+class RandomPolicy:
+	"""Plays any legal move, all equally likely"""
+
+	name = 'random'
+
+	def choose(self, game, rng):
+		moves = list(game.generate_legal_moves(game._turn))
+		return rng.choice(moves) if moves else None
+
+
+class GreedyPolicy:
+	"""Captures the most valuable piece it can, or plays a random move if
+	there is nothing to capture"""
+
+	name = 'greedy'
+
+	def choose(self, game, rng):
+		moves = list(game.generate_legal_moves(game._turn))
+		if not moves:
+			return None
+
+		pieces = game._pieces
+		values = [PIECE_VALUES[pieces[b]._rank] if pieces[b] else 0 for a, b in moves]
+		best_value = max(values)
+		return rng.choice([move for move, value in zip(moves, values) if value == best_value])
+
+
+class EnginePolicy:
+	"""Plays the engine's best move at a fixed depth"""
+
+	def __init__(self, depth):
+		self.depth = depth
+		self.name = 'engine:%d' % depth
+		self._table = TranspositionTable(POLICY_TABLE_MB)
+
+	def choose(self, game, rng):
+		return Engine(game, self._table).search(self.depth).best_move
+
+
+def make_policy(spec):
+	"""Takes a policy name ('random', 'greedy' or 'engine:D') and returns
+	the policy. Raises ValueError for anything else."""
+	if spec == 'random':
+		return RandomPolicy()
+	if spec == 'greedy':
+		return GreedyPolicy()
+	if spec.startswith('engine:') and spec[7:].isdigit() and int(spec[7:]) > 0:
+		return EnginePolicy(int(spec[7:]))
+	raise ValueError("unknown policy %r (expected 'random', 'greedy' or 'engine:D')" % spec)
+
+
+class GameRecord:
+	"""How one game went: the setups, the moves as (from, to) square names,
+	the result ('BLUE_WON', 'RED_WON' or 'DRAW') and its number of plies"""
+
+	def __init__(self, blue_setup, red_setup, moves, result):
+		self.blue_setup = blue_setup
+		self.red_setup = red_setup
+		self.moves = moves
+		self.result = result
+		self.plies = len(moves)
+
+	def to_line(self, comment=''):
+		"""Returns the game as a line of a game record file (see book.py),
+		with an optional comment after the moves"""
+		line = ' '.join([self.blue_setup, self.red_setup] + ['%s-%s' % move for move in self.moves])
+		if comment:
+			line += ' # ' + comment
+		return line
+
+
+def play_game(blue, red, rng, opening_plies=0, random_setups=False, max_plies=DEFAULT_MAX_PLIES):
+	"""Takes the policies for blue and red and a random.Random, plays a game
+	between them and returns its GameRecord. The setups can be picked at
+	random, and the first opening_plies plies can be random moves."""
+	if random_setups:
+		blue_setup, red_setup = rng.choice(SETUPS), rng.choice(SETUPS)
+	else:
+		blue_setup = red_setup = SETUPS[0]
+	game = JanggiGame(blue_setup, red_setup)
+	opening = RandomPolicy()
+	policies = {'blue': blue, 'red': red}
+
+	moves = []
+	while game.get_game_state() == 'UNFINISHED' and len(moves) < max_plies:
+		policy = opening if len(moves) < opening_plies else policies[game._turn]
+		move = policy.choose(game, rng)
+		if move is None:
+			# Nothing to move, so pass
+			general = SQUARES[game._find_general(game._turn)]
+			move = (general, general)
+		if not game.make_move(*move):
+			raise ValueError('%s chose illegal move %s-%s' % (policy.name, move[0], move[1]))
+		moves.append(move)
+
+	result = game.get_game_state()
+	return GameRecord(blue_setup, red_setup, moves, 'DRAW' if result == 'UNFINISHED' else result)
+
+
+# The policies each process has made, by name
+_policies = {}
+
+
+def _play_task(index, specs, opening_plies, random_setups, max_plies, seed):
+	"""Plays game number index of a match and returns (index, whether policy
+	A played blue, GameRecord). Runs in a worker process."""
+	for spec in specs:
+		if spec not in _policies:
+			_policies[spec] = make_policy(spec)
+
+	a_is_blue = index % 2 == 0
+	a, b = (_policies[spec] for spec in specs)
+	blue, red = (a, b) if a_is_blue else (b, a)
+	rng = random.Random('%s:%d' % (seed, index))
+	return index, a_is_blue, play_game(blue, red, rng, opening_plies, random_setups, max_plies)
+
+
+def elo_difference(wins, draws, losses):
+	"""Takes policy A's wins, draws and losses and returns (Elo difference
+	of A over B, 95% margin of error). The difference is infinite if A won
+	or lost every game, and the margin is infinite whenever the interval
+	reaches a score of 0 or 1."""
+	games = wins + draws + losses
+	if not games:
+		return 0.0, math.inf
+
+	score = (wins + draws / 2) / games
+	variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+	margin = CONFIDENCE_Z * math.sqrt(variance / games)
+
+	def elo(score):
+		if score <= 0:
+			return -math.inf
+		if score >= 1:
+			return math.inf
+		return -400 * math.log10(1 / score - 1)
+
+	return elo(score), (elo(score + margin) - elo(score - margin)) / 2
+
+
+class TournamentResult:
+	"""The totals of a match, from policy A's point of view"""
+
+	def __init__(self, policy_a, policy_b):
+		self.policy_a = policy_a
+		self.policy_b = policy_b
+		self.wins = 0
+		self.draws = 0
+		self.losses = 0
+		self.games = 0
+		self.plies = 0
+		self.elapsed = 0.0
+
+	def add(self, a_is_blue, record):
+		"""Counts one game"""
+		self.games += 1
+		self.plies += record.plies
+		if record.result == 'DRAW':
+			self.draws += 1
+		elif (record.result == 'BLUE_WON') == a_is_blue:
+			self.wins += 1
+		else:
+			self.losses += 1
+
+	def games_per_second(self):
+		return self.games / self.elapsed if self.elapsed else 0.0
+
+	def plies_per_second(self):
+		return self.plies / self.elapsed if self.elapsed else 0.0
+
+	def elo(self):
+		"""Returns elo_difference for the match"""
+		return elo_difference(self.wins, self.draws, self.losses)
+
+	def summary(self):
+		"""Returns a few lines of text describing the match"""
+		elo, margin = self.elo()
+		return '\n'.join([
+			'%s vs %s: +%d =%d -%d' % (self.policy_a, self.policy_b, self.wins, self.draws, self.losses),
+			'Elo difference %+.1f +/- %.1f' % (elo, margin),
+			'%d games, %d plies in %.2fs: %.2f games/s, %.0f plies/s' % (
+				self.games, self.plies, self.elapsed, self.games_per_second(), self.plies_per_second()),
+		])
+
+
+def run_tournament(policy_a, policy_b, games, processes=None, opening_plies=0, random_setups=False,
+		max_plies=DEFAULT_MAX_PLIES, seed=0, log=None):
+	"""Takes two policy names and a number of games and plays the match,
+	with A playing blue in the even numbered games. The games are spread
+	over a pool of processes (os.cpu_count() by default, or played in this
+	process when processes is 1). Each game is written to log (a text file)
+	as soon as it finishes, if one is given, so the games can be logged out
+	of order. Returns a TournamentResult."""
+	specs = (policy_a, policy_b)
+	for spec in specs:
+		make_policy(spec)
+	processes = processes or os.cpu_count() or 1
+
+	result = TournamentResult(policy_a, policy_b)
+	arguments = (range(games), [specs] * games, [opening_plies] * games, [random_setups] * games,
+		[max_plies] * games, [seed] * games)
+	start = time.perf_counter()
+
+	def record(outcomes):
+		for index, a_is_blue, game in outcomes:
+			result.add(a_is_blue, game)
+			if log is not None:
+				log.write(game.to_line('%d blue=%s %s %d' % (index, 'A' if a_is_blue else 'B', game.result, game.plies)) + '\n')
+				log.flush()
+
+	if processes == 1:
+		record(map(_play_task, *arguments))
+	else:
+		# Write each game as soon as it finishes, so a long game doesn't hold
+		# back the ones played after it
+		with concurrent.futures.ProcessPoolExecutor(processes) as executor:
+			futures = [executor.submit(_play_task, *task) for task in zip(*arguments)]
+			record(future.result() for future in concurrent.futures.as_completed(futures))
+
+	result.elapsed = time.perf_counter() - start
+	return result
+
+
+def main(argv=None):
+	"""Command line entry point for running a match"""
+	parser = argparse.ArgumentParser(description='Play a match between two move-choosing policies.')
+	parser.add_argument('policy_a', help="'random', 'greedy' or 'engine:D'")
+	parser.add_argument('policy_b', help="'random', 'greedy' or 'engine:D'")
+	parser.add_argument('--games', type=int, default=100, help='games to play')
+	parser.add_argument('--processes', type=int, help='processes to play on')
+	parser.add_argument('--opening-plies', type=int, default=0, help='random plies at the start of each game')
+	parser.add_argument('--random-setups', action='store_true', help='pick random horse/elephant setups')
+	parser.add_argument('--max-plies', type=int, default=DEFAULT_MAX_PLIES, help='plies before a game is a draw')
+	parser.add_argument('--seed', type=int, default=0, help='seed for the random choices')
+	parser.add_argument('--log', help='file to write each game to')
+	args = parser.parse_args(argv)
+
+	log = open(args.log, 'w') if args.log else None
+	try:
+		result = run_tournament(args.policy_a, args.policy_b, args.games, args.processes, args.opening_plies,
+			args.random_setups, args.max_plies, args.seed, log)
+	finally:
+		if log is not None:
+			log.close()
+	print(result.summary())
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())